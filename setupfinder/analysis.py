@@ -255,6 +255,188 @@ def is_harddrop_possible(piece, placement, field):
     return True
 
 
+# SRS kick tables, keyed by (from, to) in SRS states (0 = spawn, 1 = R, 2 = 180, 3 = L), y pointing up.
+_SRS_KICKS = {
+    (0, 1): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+    (1, 0): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+    (1, 2): [(0, 0), (1, 0), (1, -1), (0, 2), (1, 2)],
+    (2, 1): [(0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)],
+    (2, 3): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+    (3, 2): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+    (3, 0): [(0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)],
+    (0, 3): [(0, 0), (1, 0), (1, 1), (0, -2), (1, -2)],
+}
+
+_SRS_KICKS_I = {
+    (0, 1): [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+    (1, 0): [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+    (1, 2): [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+    (2, 1): [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+    (2, 3): [(0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)],
+    (3, 2): [(0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)],
+    (3, 0): [(0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)],
+    (0, 3): [(0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)],
+}
+
+
+def _srs_state(rotation):
+    """Convert between fumen rotations (2 = spawn, +1 = CCW) and SRS states (0 = spawn, +1 = CW).
+
+    The mapping is its own inverse, so this works in both directions.
+    """
+    return (2 - rotation) % 4
+
+
+def _kicks(piece):
+    """Build kick table for a piece keyed by (from, to) fumen rotations. O pieces don't rotate."""
+    if piece == "O":
+        return {}
+    table = _SRS_KICKS_I if piece == "I" else _SRS_KICKS
+    return {(_srs_state(a), _srs_state(b)): offsets for (a, b), offsets in table.items()}
+
+
+def _blocks(piece):
+    """Return (px, py) offsets of each block in a piece rotation."""
+    return tuple((px, py) for py, row in enumerate(piece) for px, block in enumerate(row) if block)
+
+
+# precomputed tables for movement search
+KICKS = {key: _kicks(key) for key in PIECES}
+PIECE_BLOCKS = {key: [_blocks(rot) for rot in piece] for key, piece in PIECES.items()}
+# pieces spawn flat (rotation 2) centered on the top of a 20 row field, O is 1 column further right
+SPAWN_ROW = 20
+SPAWN_POSITIONS = {
+    key: (4 if key == "O" else 3, SPAWN_ROW - min(py for _, py in PIECE_BLOCKS[key][2]), 2)
+    for key in PIECES
+}
+
+_keypress_cache = {}
+
+
+def _column_masks(field):
+    """Convert field to a tuple of per-column bitmasks (bit y is set if block at y is filled).
+
+    This is used as the field state for movement search, so it is compact and hashable.
+    """
+    return tuple(sum(1 << y for y, row in enumerate(field) if row[x]) for x in range(10))
+
+
+def _fits(blocks, x, y, cols):
+    for px, py in blocks:
+        bx = x + px
+        by = y + py
+        if bx < 0 or bx > 9 or by < 0 or (cols[bx] >> by) & 1:
+            return False
+    return True
+
+
+def _drop(blocks, x, y, cols):
+    while _fits(blocks, x, y - 1, cols):
+        y -= 1
+    return y
+
+
+def _cells(blocks, x, y):
+    return frozenset((x + px, y + py) for px, py in blocks)
+
+
+def _search_keypresses(piece, placement, cols):
+    """Breadth-first search from spawn to placement, see find_keypresses."""
+    rot_blocks = PIECE_BLOCKS[piece]
+    kicks = KICKS[piece]
+    x, y, rotation = placement
+    target = _cells(rot_blocks[rotation], x, y)
+    start = SPAWN_POSITIONS[piece]
+    if not _fits(rot_blocks[start[2]], start[0], start[1], cols):
+        return None
+    visited = {start}
+    frontier = [start]
+    presses = 0
+    while frontier:
+        next_frontier = []
+        for state in frontier:
+            sx, sy, srot = state
+            blocks = rot_blocks[srot]
+            # hard drop from here lands on the target
+            if _cells(blocks, sx, _drop(blocks, sx, sy, cols)) == target:
+                return presses + 1
+            moves = []
+            # taps and DAS to the wall
+            for dx in (-1, 1):
+                if _fits(blocks, sx + dx, sy, cols):
+                    moves.append((sx + dx, sy, srot))
+                    wall_x = sx + dx
+                    while _fits(blocks, wall_x + dx, sy, cols):
+                        wall_x += dx
+                    if wall_x != sx + dx:
+                        moves.append((wall_x, sy, srot))
+            # rotations (CW decreases fumen rotation, CCW increases)
+            for new_rot in ((srot - 1) % 4, (srot + 1) % 4):
+                for kx, ky in kicks.get((srot, new_rot), ()):
+                    if _fits(rot_blocks[new_rot], sx + kx, sy + ky, cols):
+                        moves.append((sx + kx, sy + ky, new_rot))
+                        break
+            # soft drop to the floor
+            drop_y = _drop(blocks, sx, sy, cols)
+            if drop_y != sy:
+                moves.append((sx, drop_y, srot))
+            for move in moves:
+                if move not in visited:
+                    visited.add(move)
+                    next_frontier.append(move)
+        frontier = next_frontier
+        presses += 1
+    return None
+
+
+def find_keypresses(piece, placement, field):
+    """Find the minimum number of keypresses needed to move a piece from spawn into placement.
+
+    Keypresses counted are single taps left/right, DAS to a wall, CW/CCW rotations (using SRS kicks),
+    soft drop to the floor and the final hard drop. No hold, no 180 rotations.
+    Results are memoized per piece, placement and field state, so this is cheap to call on repeated fields.
+
+    Args:
+        piece - A piece in "ILOZTJS"
+        placement - tuple (x, y, rotation)
+        field - The field the piece will be placed in (in list form, without the piece)
+    Returns number of keypresses, or None if placement can't be reached from spawn.
+    """
+    cols = _column_masks(field)
+    key = (piece, placement, cols)
+    if key not in _keypress_cache:
+        _keypress_cache[key] = _search_keypresses(piece, placement, cols)
+    return _keypress_cache[key]
+
+
+def count_keypresses(field, bag=None):
+    """Count total keypresses needed to build a setup.
+
+    Args:
+        field - in list form like other functions in this module
+        bag - string of pieces in order, eg. "TSOLIZJ". Pieces missing from the field are skipped.
+              If not given, pieces are placed from the bottom of the field up.
+    Returns total number of keypresses, or None if any piece can't be placed.
+    """
+    placements = {piece: placement for piece, placement in find_placements(field).items() if placement is not None}
+    if bag is None:
+        # place lowest pieces first, the block at the bottom of the piece determines order
+        bag = sorted(placements, key=lambda p: placements[p][1] - MIN_Y_PLACEMENT[p][placements[p][2]])
+    # start from gray blocks already in the field (eg. leftovers from a previous bag)
+    new_field = [[b if b == 8 else 0 for b in row] for row in field]
+    new_field.extend([[0] * 10 for _ in range(20 - len(new_field))])
+    total = 0
+    for piece in bag:
+        if piece not in placements:
+            continue
+        presses = find_keypresses(piece, placements[piece], new_field)
+        if presses is None:
+            return None
+        total += presses
+        place_piece(piece, placements[piece], new_field)
+    return total
+
+
 def main():
     #albatross without T piece
     test_field, _ = fumen.decode("v115@AhBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRpglCe?whJeAgl")
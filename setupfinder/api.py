@@ -0,0 +1,58 @@
+"""Library interface for finding setups from Python, without input files or output.html.
+
+    from setupfinder import api
+    for record in api.find_setups(["TSD row-1,2 col-any filter-isTSD-any", "PC height-4 cutoff-80.00"],
+                                  cache_file=Path("cache.bin")):
+        print(record['id'], record['fumen'], record['pc_rate'])
+
+Records are the same as in --export files (see export module), parents always come before their continuations.
+The command line finishes each bag for every setup before starting the next bag, so nothing is known until the end.
+find_setups instead takes the initial setups one at a time through the remaining bags, yielding each one's records
+as soon as they're done. Records come in the order the setups are found (not sorted by PC rate like output.html),
+with the same ids as an export of the same input.
+"""
+
+from pathlib import Path
+from setupfinder import export
+from setupfinder.find import parse_input_line
+from setupfinder.finder.finder import Finder, check_carry
+
+
+def find_setups(bags, cache_file=None, cache=None, backend=None, mirror_keys=True, jobs=None, progress=None):
+    """Yield a record for every setup found for bags, each setup's tree as soon as it's finished.
+
+    bags are input.txt lines or dicts from find.parse_input_line, ending at the first PC bag (like input.txt).
+    Results are cached in cache_file (loaded first, saved when the generator finishes or is closed), or in cache
+    (a dict or cache_server.RemoteCache that's kept by the caller), or only in memory if neither is given.
+    backend, mirror_keys and jobs are passed to Finder. progress(done, total) is called once the initial setups are
+    found (with done 0) and after each of them is finished."""
+    bags = [parse_input_line(bag) if isinstance(bag, str) else bag for bag in bags]
+    if not bags:
+        return
+    check_carry(bags)
+    # like the command line, nothing after a PC is searched
+    last = next((i for i, args in enumerate(bags) if args['setup_type'] == "PC"), len(bags) - 1)
+    stages = bags[1:last + 1]
+    if cache is None and cache_file is None:
+        cache = {}
+    with Finder(cache_file or Path("cache.bin"), backend=backend, mirror_keys=mirror_keys, jobs=jobs,
+                cache=cache) as f:
+        f.find_initial_setups(bags[0])
+        roots = f.setups
+        if progress is not None:
+            progress(0, len(roots))
+        found = 0
+        for done, root in enumerate(roots, 1):
+            f.setups = [root]
+            for args in stages:
+                if args['setup_type'] == "PC":
+                    f.find_PC_finishes(args)
+                else:
+                    f.find_continuations(args)
+                if not f.setups:
+                    break
+            if f.setups:
+                yield from export.iter_records(f.setups, f.pc_finish, start=found)
+                found += 1
+            if progress is not None:
+                progress(done, len(roots))
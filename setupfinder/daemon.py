@@ -0,0 +1,231 @@
+"""Keep setup-finder running between runs, so each run doesn't pay for startup.
+
+Every setup-finder run starts Python, imports lxml/dominate/imageio/numpy, loads all of cache.bin and the block skin
+and (with --backend jpype/worker) starts sfinder's JVM before doing anything. The daemon does all that once and
+then runs jobs sent over a local socket one at a time, keeping the cache, skins and sfinder backend warm. It saves
+the cache between jobs (at most every save_interval seconds) and when it shuts down.
+
+Start the daemon with: setup-finder-daemon --cache cache.bin --backend worker
+Then add --daemon to any setup-finder run to send it to the daemon instead of running it. Jobs are the input file
+(or its lines) and output options, the reply has the report path and optionally every result record (see export).
+
+Jobs are sent as JSON and authenticated with the user's key, like the cache server (see cache_server module). Job
+paths have to be inside the daemon's root directory (--root, its working directory by default), so a job can't read
+or write files anywhere else.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from setupfinder import export
+from setupfinder.find import setups_from_input
+from setupfinder.img import ImageCache
+from setupfinder.finder.backend import BACKENDS, get_backend
+from setupfinder.finder.cache_server import (PRIVATE_DIR, accept, connect, get_authkey, listen, load_cache, recv_json,
+                                             save_cache, send_json, parse_address)
+from setupfinder.finder.jvm import JVMOptions
+from setupfinder.finder.sfinder import SFINDER_VER
+
+if sys.platform == "win32":
+    DEFAULT_ADDRESS = r"\\.\pipe\setup-finder-daemon"
+else:
+    DEFAULT_ADDRESS = str(PRIVATE_DIR / "daemon.sock")
+# job options passed on to setups_from_input
+JOB_OPTIONS = ["image_files", "page_size", "reuse_stages", "jobs", "shards"]
+
+
+def submit(job, address=DEFAULT_ADDRESS, authkey=None):
+    """Send a job to the daemon and wait for the reply.
+
+    job is a dict with input_file, skin_file and work_dir (absolute paths as strings), and optionally bags (input
+    lines used instead of reading input_file), export_file, manifest_dir, result_files, results (True to get every
+    result record back) and JOB_OPTIONS.
+    Returns dict with output_file, export_file, records (None unless results was requested), elapsed and error."""
+    address = parse_address(address) if isinstance(address, str) else address
+    conn = connect(address, authkey if authkey is not None else get_authkey(), "setup-finder daemon",
+                   "setup-finder-daemon")
+    with conn:
+        send_json(conn, job)
+        return recv_json(conn)
+
+
+class FinderDaemon:
+    """Run jobs from submit with a cache, skins and sfinder backend that stay loaded."""
+
+    def __init__(self,
+                 cache_file,
+                 address=DEFAULT_ADDRESS,
+                 pack_cache=False,
+                 backend=None,
+                 mirror_keys=True,
+                 save_interval=60,
+                 authkey=None,
+                 root=None,
+                 allow_remote=False):
+        self.cache_file = cache_file
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.pack_cache = pack_cache
+        self.backend = backend
+        self.mirror_keys = mirror_keys
+        self.save_interval = save_interval
+        self.authkey = authkey  # None for the user's key (see cache_server.get_authkey)
+        # jobs can only use paths inside root
+        self.root = Path(root).resolve() if root is not None else Path.cwd().resolve()
+        self.allow_remote = allow_remote  # if TCP addresses other machines can reach are allowed
+        self.cache = load_cache(cache_file, mirror_keys)
+        # (skin file, image dir) -> ImageCache, skins are only loaded once and rendered images reused
+        self._images = {}
+        self._saved = time.monotonic()
+
+    def images(self, skin_file, image_dir=None):
+        """ImageCache for a skin, loaded on first use."""
+        key = (skin_file, image_dir)
+        if key in self._images and image_dir is not None and not image_dir.exists():
+            del self._images[key]  # image files were deleted, render them again
+        if key not in self._images:
+            if not skin_file.exists():
+                raise FileNotFoundError(f"Skin file not found. Specify one with --skin or create one at: {skin_file}")
+            self._images[key] = ImageCache(skin_file, image_dir=image_dir)
+        return self._images[key]
+
+    def job_path(self, path):
+        """Resolve a path from a job, raises PermissionError if it's outside root."""
+        path = Path(path).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise PermissionError(f"{path} is outside the daemon's root directory {self.root} (see --root).")
+        return path
+
+    def run_job(self, job):
+        """Run a job (see submit), returns the reply."""
+        start = time.perf_counter()
+        reply = {'output_file': None, 'export_file': None, 'records': None, 'elapsed': None, 'error': None}
+        export_file = None
+        tmp_export = None
+        try:
+            work_dir = self.job_path(job['work_dir'])
+            input_file = self.job_path(job['input_file'])
+            skin_file = self.job_path(job['skin_file'])
+            export_file = self.job_path(job['export_file']) if job.get('export_file') else None
+            manifest_dir = self.job_path(job['manifest_dir']) if job.get('manifest_dir') else None
+            result_files = [self.job_path(result_file) for result_file in job.get('result_files') or []]
+            if export_file is None and job.get('results'):
+                # results are read back from an export
+                fd, tmp_export = tempfile.mkstemp(suffix=".jsonl")
+                os.close(fd)
+                export_file = Path(tmp_export)
+            image_dir = work_dir / "output" / "img" if job.get('image_files') else None
+            output_file = setups_from_input(
+                input_file,
+                self.cache_file,
+                self.pack_cache,
+                skin_file,
+                export_file=export_file,
+                backend=self.backend,
+                mirror_keys=self.mirror_keys,
+                bags=job.get('bags'),
+                work_dir=work_dir,
+                cache=self.cache,
+                images=self.images(skin_file, image_dir),
+                manifest_dir=manifest_dir,
+                result_files=result_files or None,
+                **{option: job[option] for option in JOB_OPTIONS if option in job})
+            reply['output_file'] = str(output_file) if output_file is not None else None
+            if export_file is not None and export_file.exists():
+                if tmp_export is None:
+                    reply['export_file'] = str(export_file)
+                if job.get('results'):
+                    _, records = export.load_results(export_file)
+                    reply['records'] = list(records)
+        except Exception as e:
+            logging.exception(e)
+            reply['error'] = str(e)
+        finally:
+            if tmp_export is not None:
+                os.unlink(tmp_export)
+        reply['elapsed'] = time.perf_counter() - start
+        return reply
+
+    def serve_forever(self):
+        authkey = self.authkey if self.authkey is not None else get_authkey()
+        with listen(self.address, authkey, self.allow_remote) as listener:
+            while True:
+                conn = accept(listener)
+                if conn is None:
+                    continue
+                with conn:
+                    try:
+                        job = recv_json(conn)
+                    except (EOFError, OSError, ValueError):
+                        continue
+                    reply = self.run_job(job)
+                    try:
+                        send_json(conn, reply)
+                    except OSError:
+                        pass  # client went away, results are still cached
+                if time.monotonic() - self._saved >= self.save_interval:
+                    self.save()
+
+    def save(self):
+        save_cache(self.cache_file, self.cache, self.pack_cache)
+        self._saved = time.monotonic()
+
+
+def main():
+    """Entry point for the daemon."""
+    parser = argparse.ArgumentParser(description="Run setup-finder jobs with a warm cache and sfinder.")
+    parser.add_argument("--cache", dest="cache_file", help="location of cache file", default="cache.bin")
+    parser.add_argument("--pack", dest="pack_cache", help="gzip the cache file when saving", action="store_true")
+    parser.add_argument(
+        "--address", dest="address", help="socket path, pipe name or host:port to listen on", default=DEFAULT_ADDRESS)
+    parser.add_argument(
+        "--save-interval", dest="save_interval", type=float, help="least seconds between saves", default=60)
+    parser.add_argument(
+        "--no-mirror-cache",
+        dest="mirror_keys",
+        help="don't reuse cached results for mirror images of a field",
+        action="store_false")
+    parser.add_argument(
+        "--backend", dest="backend", choices=BACKENDS, help="how to run sfinder (see setup-finder --backend)",
+        default="subprocess")
+    parser.add_argument(
+        "--workers", dest="workers", type=int, help="number of worker processes for --backend worker", default=None)
+    parser.add_argument("--max-heap", dest="max_heap", help="largest java heap to use for sfinder (eg. 2g)")
+    parser.add_argument(
+        "--root", dest="root", help="directory jobs' files have to be in (default: working directory)", default=None)
+    parser.add_argument(
+        "--allow-remote",
+        dest="allow_remote",
+        help="allow listening on a TCP address other machines can connect to",
+        action="store_true")
+    args = parser.parse_args(sys.argv[1:])
+    logging.basicConfig(filename='error.log', level=logging.ERROR)
+    working_dir = Path.cwd() / SFINDER_VER
+    backend = get_backend(
+        args.backend, working_dir, workers=args.workers, jvm_args=JVMOptions(working_dir, max_heap=args.max_heap))
+    daemon = FinderDaemon(
+        Path(args.cache_file),
+        args.address,
+        args.pack_cache,
+        backend,
+        args.mirror_keys,
+        args.save_interval,
+        root=args.root,
+        allow_remote=args.allow_remote)
+    print(f"Serving setup-finder jobs with {len(daemon.cache)} cached results at {args.address}. Ctrl+C to stop.")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Saving cache...")
+        daemon.save()
+        if hasattr(backend, "close"):
+            backend.close()
+
+
+if __name__ == "__main__":
+    main()
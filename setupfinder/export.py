@@ -0,0 +1,85 @@
+"""Export setup-finder results as JSON Lines, so they can be queried and compared between runs.
+
+The first line is a header with the title and input bags, then there is one record per setup in the search tree:
+    {"id": "3-0", "parent": "3", "bag": 1, "fumen": "v115@...", "field": "v115@...", "sequence": "IJLOSZT",
+     "pc_rate": 75.0, "continuations": 4}
+fumen is the solution as found by sfinder, field is the field after the setup is finished (T placed, lines cleared).
+Ids are indices into each setup's list of continuations. pc_rate is null unless the run ends with a PC.
+Files ending in .gz are gzipped. The command line writes the header when the run starts and records as setups in
+the last bag are finished (see ExportWriter), so an interrupted run leaves the setups finished so far.
+"""
+
+import gzip
+import json
+
+
+def iter_records(setups, pc_finish=False, parent=None, bag=0, start=0):
+    """Walk the setup tree depth-first, yielding one record per setup (lazily, so the tree is never copied).
+
+    start is the index of the first setup (for records of part of a list of setups)."""
+    for i, setup in enumerate(setups, start):
+        setup_id = str(i) if parent is None else f"{parent}-{i}"
+        yield {
+            'id': setup_id,
+            'parent': parent,
+            'bag': bag,
+            'fumen': setup.solution.fumen,
+            'field': setup.solution.to_fumen(),
+            'sequence': setup.solution.sequence,
+            'pc_rate': setup.PC_rate if pc_finish else None,
+            'continuations': len(setup.continuations)
+        }
+        yield from iter_records(setup.continuations, pc_finish, setup_id, bag + 1)
+
+
+class ExportWriter:
+    """Write an export file as the run goes: the header when it's opened, then the records of finished top-level
+    setups each time write is called (flushed, so they're on disk if the run is interrupted)."""
+
+    def __init__(self, export_file, title, bags, pc_finish=False):
+        open_func = gzip.open if export_file.suffix == ".gz" else open
+        self.pc_finish = pc_finish
+        self.count = 0  # records written
+        self.setups = 0  # top-level setups written, the next one's id
+        self._f = open_func(export_file, "wt", encoding="utf-8")
+        self._f.write(json.dumps({'title': title, 'bags': bags, 'pc_finish': pc_finish}) + "\n")
+        self._f.flush()
+
+    def write(self, setups):
+        """Write records for setups (and their continuations), ids continue from the setups written before."""
+        for record in iter_records(setups, self.pc_finish, start=self.setups):
+            self._f.write(json.dumps(record) + "\n")
+            self.count += 1
+        self.setups += len(setups)
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def export_results(export_file, setups, title, bags, pc_finish=False):
+    """Write setups to export_file as JSON Lines, one record at a time. Returns number of records written."""
+    with ExportWriter(export_file, title, bags, pc_finish) as writer:
+        writer.write(setups)
+    return writer.count
+
+
+def load_results(export_file):
+    """Read an exported file back, returns (header, iterator of records)."""
+    open_func = gzip.open if export_file.suffix == ".gz" else open
+    f = open_func(export_file, "rt", encoding="utf-8")
+    header = json.loads(f.readline())
+
+    def records():
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    return header, records()
@@ -11,8 +11,16 @@ import time
 import logging
 #import warnings
 #from tqdm import tqdm, TqdmSynchronisationWarning
-from setupfinder import output
-from setupfinder.finder import finder
+from setupfinder import export
+from setupfinder.finder import finder, snapshot
+from setupfinder.finder.backend import BACKENDS, get_backend, RecordingBackend, ReplayBackend
+from setupfinder.finder.sfinder import SFINDER_VER
+from setupfinder.finder.jvm import JVMOptions
+from setupfinder.finder.cache_server import DEFAULT_ADDRESS, RemoteCache, load_cache
+from setupfinder.finder.profiler import PROFILER
+
+# setups the last bag is found for at a time when exporting, each chunk's records are written when it's done
+EXPORT_CHUNK = 64
 
 
 def parse_input_line(bag):
@@ -30,6 +38,9 @@ def parse_input_line(bag):
     # todo: should be able to set height for overlays not just PCs, default should be 6 for non-PCs
     height = "4"
     pc_cutoff = 0.01
+    # carry-N: keep at most N setups per parent that leave one piece for the next bag, None requires every setup to
+    # use the whole bag
+    carry = None
     for arg in bag_args:
         if arg[:3] == "col":
             if arg[4:] == "any":
@@ -50,69 +61,232 @@ def parse_input_line(bag):
             height = arg[7:]
         if arg[:6] == "cutoff":
             pc_cutoff = float(arg[7:])
+        if arg[:5] == "carry":
+            carry = int(arg[6:])
     return {
         'setup_type': setup_type,
         'rows': bag_rows,
         'cols': bag_cols,
         'filter': bag_filter,
         'height': height,
-        'cutoff': pc_cutoff
+        'cutoff': pc_cutoff,
+        'carry': carry
     }
 
 
-def setups_from_input(input_file, cache_file, pack_cache, skin_file):
-    if not (input_file).exists():
+def setups_from_input(input_file,
+                      cache_file,
+                      pack_cache,
+                      skin_file,
+                      image_files=False,
+                      page_size=None,
+                      export_file=None,
+                      reuse_stages=True,
+                      profile_file=None,
+                      backend=None,
+                      cache_server=None,
+                      mirror_keys=True,
+                      jobs=None,
+                      manifest_dir=None,
+                      shards=1,
+                      result_files=None,
+                      bags=None,
+                      work_dir=None,
+                      cache=None,
+                      images=None):
+    """Find the setups described by input_file and write the report (see main for the options).
+
+    With manifest_dir, the run stops at the first stage with sfinder queries that aren't cached yet and writes them
+    to shards manifest files instead (see manifest module). result_files are worker results added to the cache.
+    With reuse_stages, bags found by earlier runs of input starting with the same bags are loaded from snapshots/
+    instead of found again (see snapshot module). bags are input lines to use instead of reading input_file. output/
+    and snapshots/ are created in work_dir (default: current directory). cache is an already loaded cache to use instead
+    of cache_file and images an ImageCache for the skin (see daemon module).
+    Returns the report file, or None if the run stopped to write manifests."""
+    if bags is None and not (input_file).exists():
         raise FileNotFoundError(f"Input file not found. Specify one with --input or create one at: {input_file}")
-    if not (skin_file).exists():
+    if images is None and not (skin_file).exists():
         raise FileNotFoundError(f"Skin file not found. Specify one with --skin or create one at: {skin_file}")
-    output_dir = Path.cwd() / "output"  # enable setting this?
+    work_dir = work_dir or Path.cwd()
+    output_dir = work_dir / "output"  # enable setting this?
     if not output_dir.exists():  # pylint: disable=E1101
         output_dir.mkdir(parents=True, exist_ok=True)  # pylint: disable=E1101
     output_file = output_dir / "output.html"
+    # write each unique image once to output/img instead of embedding them in output.html
+    image_dir = output_dir / "img" if image_files else None
 
     timer_start = time.perf_counter()
+    if profile_file is not None:
+        PROFILER.enabled = True
+        PROFILER.reset()
 
-    #check if input file exists...
-    with open(input_file, "r") as f:
-        bags = f.read().splitlines()
+    if bags is None:
+        with open(input_file, "r") as f:
+            bags = f.read().splitlines()
+
+    finder.check_carry([parse_input_line(bag) for bag in bags])
+    # setups are saved after each bag, keyed by the bags up to it, so later runs can reuse them
+    snapshot_dir = work_dir / "snapshots"
+    pc_bag = next((args for args in map(parse_input_line, bags) if args['setup_type'] == "PC"), None)
 
     print("Initializing cache...")
     # using f in a with statement to initialize/output cache
-    with finder.Finder(cache_file, pack_cache=pack_cache) as f:
+    with finder.Finder(
+            cache_file, pack_cache=pack_cache, backend=backend, cache_server=cache_server,
+            mirror_keys=mirror_keys, jobs=jobs, cache=cache) as f:
+        if result_files:
+            # imported here like output and plan below, so runs only import what they use
+            from setupfinder.finder import manifest
+            imported, failed = manifest.import_results(f.cache, result_files, mirror_keys)
+            print(f"Imported {imported} sfinder results" + (f" ({failed} failed)." if failed else "."))
+        resumed_stage = -1
+        # manifest runs always continue where the last one stopped
+        if reuse_stages or manifest_dir is not None:
+            latest = snapshot.load_latest_snapshot(snapshot_dir, bags, pc_bag['cutoff'] if pc_bag else None,
+                                                   mirror_keys)
+            if latest is not None:
+                resumed_stage, state = latest
+                f.set_state(state)
+                print(f"Reusing bags 0-{resumed_stage} found before ({len(f.setups)} setups)")
+        # PC should be the last bag
+        last = next((i for i, bag in enumerate(bags) if parse_input_line(bag)['setup_type'] == "PC"), len(bags) - 1)
         # should generate title from setup results
-        title = ""  #title/heading of output.html
-        for i, bag in enumerate(bags):
-            args = parse_input_line(bag)
-            bag_title = args['setup_type'].split('-')[0]
-
-            if i == 0:
-                print(f"Bag {i}: Finding {bag_title} initial bag setups...")
-                title = bag_title
-                f.find_initial_setups(args)
-            else:
-                if args['setup_type'] == "PC":
-                    print(f"Bag {i}: Finding PCs...")
-                    title += " -> PC"
-                    f.find_PC_finishes(args)
-                    break
-                print(f"Bag {i}: Finding {bag_title} continuations...")
-                title += " -> " + bag_title
-                f.find_continuations(args)
-
-            print(f"Bag {i}: Found {len(f.setups)} valid setups")
-
+        #title/heading of output.html
+        title = " -> ".join(parse_input_line(bag)['setup_type'].split('-')[0] for bag in bags[:last + 1])
+        # records are written as setups are finished, so an interrupted run still leaves them
+        writer = export.ExportWriter(export_file, title, bags, pc_bag is not None) if export_file is not None else None
+        try:
+            for i, bag in enumerate(bags[:last + 1]):
+                args = parse_input_line(bag)
+                if i > resumed_stage:
+                    if manifest_dir is not None and plan_stage(manifest_dir, f"bag-{i}", f.sfinder,
+                                                               *f.stage_queries(args, initial=i == 0), shards):
+                        return None
+                    with PROFILER.stage(f"Bag {i}"):
+                        if i == last and i > 0 and writer is not None:
+                            stream_bag(f, i, args, writer)
+                        else:
+                            find_bag(f, i, args)
+                    print(f"Bag {i}: Found {len(f.setups)} valid setups")
+                    snapshot.save_snapshot(snapshot_dir, bags, i, f.get_state(), mirror_keys)
+            if writer is not None:
+                if writer.setups == 0:
+                    # the last bag wasn't streamed (it was reused or is the first)
+                    writer.write(f.setups)
+                print(f"Exported {writer.count} setups to {export_file}.")
+        finally:
+            if writer is not None:
+                writer.close()
+        # imported here, output pulls in dominate, imageio and numpy which finding setups doesn't need
+        from setupfinder import output
+        if manifest_dir is not None and f.pc_finish and plan_stage(
+                manifest_dir, "output", f.sfinder, "path", output.pc_path_queries(f.setups, f.pc_height), shards):
+            return None
         print("Generating output file...")
-        # image height is hardcoded for now (can I do something like determine max height at each step?)
-        if f.pc_finish:
-            output.output_results_pc(output_file, sorted(f.setups, key=(lambda s: s.PC_rate), reverse=True), title,
-                                     f.pc_height, f.pc_cutoff, 7, f.cache, skin_file)
-        else:
-            output.output_results(output_file, sorted(f.setups, key=(lambda s: len(s.continuations)), reverse=True),
-                                  title, 7, 4, skin_file)
+        with PROFILER.stage("Output"):
+            # image height is hardcoded for now (can I do something like determine max height at each step?)
+            if f.pc_finish:
+                output.output_results_pc(output_file, sorted(f.setups, key=(lambda s: s.PC_rate), reverse=True),
+                                         title, f.pc_height, f.pc_cutoff, 7, f.cache, skin_file,
+                                         image_dir=image_dir, page_size=page_size, sf=f.sfinder, images=images)
+            else:
+                output.output_results(output_file, sorted(f.setups, key=(lambda s: len(s.continuations)),
+                                                          reverse=True),
+                                      title, 7, 4, skin_file, image_dir=image_dir, page_size=page_size,
+                                      images=images)
         print(f"Output saved to {output_file}.")
-        print("Saving cache...")
+        if cache is None:
+            print("Saving cache...")
     print("Done.", end=' ')
     print(f"(Total elapsed time: {time.perf_counter() - timer_start:.2f}sec)")
+    if profile_file is not None:
+        print(PROFILER.report())
+        PROFILER.save(profile_file)
+        print(f"Profile saved to {profile_file}.")
+    return output_file
+
+
+def plan_stage(manifest_dir, stage, sf, command, queries, shards):
+    """Write manifests for the stage's uncached queries, returns True if there are any (so the run should stop)."""
+    from setupfinder.finder import manifest
+    count = manifest.write_manifest(manifest_dir, stage, sf, command, queries, shards)
+    if count == 0:
+        return False
+    print(f"{stage}: wrote {count} sfinder jobs to {min(shards, count)} manifest shards in {manifest_dir}.")
+    print("Run them with setup-finder-worker, then continue with --manifest and --import-results.")
+    return True
+
+
+def print_plan(input_file, cache_file, cache_server=None, mirror_keys=True, jobs=None):
+    """Print how many sfinder queries each bag in input_file needs and how long they should take (see plan module)."""
+    if not (input_file).exists():
+        raise FileNotFoundError(f"Input file not found. Specify one with --input or create one at: {input_file}")
+    with open(input_file, "r") as f:
+        bags = [parse_input_line(bag) for bag in f.read().splitlines()]
+    cache = RemoteCache(cache_server) if cache_server is not None else load_cache(cache_file, mirror_keys)
+    from setupfinder import plan
+    for line in plan.format_plan(plan.plan_stages(bags, cache, mirror_keys=mirror_keys, jobs=jobs)):
+        print(line)
+
+
+def run_in_daemon(args):
+    """Send the run described by command line args to the daemon (see daemon module) and print its reply."""
+    # imported here, the daemon imports this module
+    from setupfinder import daemon
+    job = {
+        'input_file': str(Path(args.input_file).resolve()),
+        'skin_file': str(Path(args.skin_file).resolve()),
+        'work_dir': str(Path.cwd()),
+        'export_file': str(Path(args.export_file).resolve()) if args.export_file else None,
+        'image_files': args.image_files,
+        'page_size': args.page_size,
+        'reuse_stages': not args.fresh,
+        'jobs': args.jobs,
+        'manifest_dir': str(Path(args.manifest_dir).resolve()) if args.manifest_dir else None,
+        'shards': args.shards,
+        'result_files': [str(Path(result_file).resolve()) for result_file in args.result_files or []]
+    }
+    reply = daemon.submit(job, args.daemon or daemon.DEFAULT_ADDRESS)
+    if reply['error'] is not None:
+        raise RuntimeError(f"Daemon: {reply['error']}")
+    if reply['export_file'] is not None:
+        print(f"Exported setups to {reply['export_file']}.")
+    if reply['output_file'] is not None:
+        print(f"Output saved to {reply['output_file']}.")
+    else:
+        print("Stopped to write manifests, see the daemon's output.")
+    print(f"Done. (Total elapsed time: {reply['elapsed']:.2f}sec)")
+
+
+def find_bag(f, i, args, announce=True):
+    """Find setups for bag number i (parsed by parse_input_line) with Finder f."""
+    bag_title = args['setup_type'].split('-')[0]
+    if i == 0:
+        if announce:
+            print(f"Bag {i}: Finding {bag_title} initial bag setups...")
+        f.find_initial_setups(args)
+    elif args['setup_type'] == "PC":
+        if announce:
+            print(f"Bag {i}: Finding PCs...")
+        f.find_PC_finishes(args)
+    else:
+        if announce:
+            print(f"Bag {i}: Finding {bag_title} continuations...")
+        f.find_continuations(args)
+
+
+def stream_bag(f, i, args, writer, chunk_size=None):
+    """Find bag number i like find_bag, for chunk_size setups at a time (default EXPORT_CHUNK), writing each chunk to
+    writer when it's done."""
+    chunk_size = chunk_size or EXPORT_CHUNK
+    setups = f.setups
+    finished = []
+    for start in range(0, len(setups), chunk_size):
+        f.setups = setups[start:start + chunk_size]
+        find_bag(f, i, args, announce=start == 0)
+        writer.write(f.setups)
+        finished.extend(f.setups)
+    f.setups = finished
 
 
 def main():
@@ -127,9 +301,135 @@ def main():
         default="default.png")
     parser.add_argument("--cache", dest="cache_file", help="location of cache file", default="cache.bin")
     parser.add_argument("--pack", dest="pack_cache", help="location of cache file", action="store_true")
+    parser.add_argument(
+        "--cache-server",
+        dest="cache_server",
+        nargs="?",
+        const=DEFAULT_ADDRESS,
+        help="share the cache with other runs through a cache server (started with setup-finder-cache) " +
+        "instead of using the cache file")
+    parser.add_argument(
+        "--no-mirror-cache",
+        dest="mirror_keys",
+        help="don't reuse cached results for mirror images of a field",
+        action="store_false")
+    parser.add_argument(
+        "--image-files",
+        dest="image_files",
+        help="save images to output/img instead of embedding them in output.html",
+        action="store_true")
+    parser.add_argument(
+        "--page-size",
+        dest="page_size",
+        type=int,
+        help="split output.html into pages of this many setups (use with --image-files for large runs)",
+        default=None)
+    parser.add_argument(
+        "--export", dest="export_file", help="also save every setup to this file as JSON Lines (.jsonl or .jsonl.gz)")
+    parser.add_argument(
+        "--fresh",
+        dest="fresh",
+        help="find every bag again instead of reusing the ones saved in snapshots/ by runs of the same bags",
+        action="store_true")
+    # bags are always reused now, kept so old scripts still work (with a deprecation notice)
+    parser.add_argument("--resume", dest="resume", help=argparse.SUPPRESS, action="store_true")
+    parser.add_argument(
+        "--profile",
+        dest="profile_file",
+        nargs="?",
+        const="profile.json",
+        help="print per-stage timings and sfinder/cache stats, and save them as JSON (default: profile.json)")
+    parser.add_argument(
+        "--backend",
+        dest="backend",
+        choices=BACKENDS,
+        help="how to run sfinder: a java process per command (default), in this process through JPype, or a pool of " +
+        "persistent JPype worker processes",
+        default="subprocess")
+    parser.add_argument(
+        "--workers", dest="workers", type=int, help="number of worker processes for --backend worker", default=None)
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, help="number of sfinder commands to run at the same time (default: " +
+        "number of CPUs)", default=None)
+    parser.add_argument(
+        "--jvm-args",
+        dest="jvm_args",
+        help="java options to use for every sfinder command (quoted, eg. \"-Xmx2g\"), instead of choosing them " +
+        "from each command's field height and pieces")
+    parser.add_argument("--max-heap", dest="max_heap", help="largest java heap to use for sfinder (eg. 2g)")
+    parser.add_argument(
+        "--jvm-cds",
+        dest="jvm_cds",
+        help="create and use a class data sharing archive of sfinder for faster java startup (Java 13+)",
+        action="store_true")
+    parser.add_argument("--record", dest="record_file", help="record every sfinder response to this file")
+    parser.add_argument(
+        "--replay", dest="replay_file", help="answer sfinder commands from a --record file instead of running sfinder")
+    parser.add_argument(
+        "--manifest",
+        dest="manifest_dir",
+        help="instead of running sfinder, write the next stage's sfinder jobs to manifests in this directory (for " +
+        "setup-finder-worker), continuing from the last run")
+    parser.add_argument(
+        "--shards", dest="shards", type=int, help="number of manifests to split each stage into", default=1)
+    parser.add_argument(
+        "--import-results",
+        dest="result_files",
+        nargs="+",
+        help="add the results of setup-finder-worker runs to the cache first")
+    parser.add_argument(
+        "--daemon",
+        dest="daemon",
+        nargs="?",
+        const="",
+        help="send the run to a running setup-finder-daemon instead of running it here (the daemon's cache, " +
+        "backend and sfinder options are used)")
+    parser.add_argument(
+        "--plan",
+        dest="plan",
+        help="don't run anything, print how many sfinder queries each bag needs and an estimate of how long they take",
+        action="store_true")
     args = parser.parse_args(sys.argv[1:])
+    if args.resume:
+        print("--resume is deprecated and does nothing: bags found before are always reused, use --fresh to find " +
+              "them again.")
+    backend = None
     try:
-        setups_from_input(Path(args.input_file), Path(args.cache_file), args.pack_cache, Path(args.skin_file))
+        if args.plan:
+            print_plan(Path(args.input_file), Path(args.cache_file), args.cache_server, args.mirror_keys, args.jobs)
+            return
+        if args.daemon is not None:
+            run_in_daemon(args)
+            return
+        if args.replay_file:
+            backend = ReplayBackend(Path(args.replay_file))
+        elif args.backend != "subprocess" or args.record_file or args.jvm_args or args.max_heap or args.jvm_cds:
+            working_dir = Path.cwd() / SFINDER_VER
+            jvm_options = JVMOptions(
+                working_dir,
+                fixed=args.jvm_args.split() if args.jvm_args else None,
+                max_heap=args.max_heap,
+                cds=args.jvm_cds)
+            backend = get_backend(args.backend, working_dir, workers=args.workers, jvm_args=jvm_options)
+        if args.record_file:
+            backend = RecordingBackend(backend, Path(args.record_file))
+        setups_from_input(
+            Path(args.input_file),
+            Path(args.cache_file),
+            args.pack_cache,
+            Path(args.skin_file),
+            image_files=args.image_files,
+            page_size=args.page_size,
+            export_file=Path(args.export_file) if args.export_file else None,
+            reuse_stages=not args.fresh,
+            profile_file=Path(args.profile_file) if args.profile_file else None,
+            backend=backend,
+            cache_server=args.cache_server,
+            mirror_keys=args.mirror_keys,
+            jobs=args.jobs,
+            manifest_dir=Path(args.manifest_dir) if args.manifest_dir else None,
+            shards=args.shards,
+            result_files=[Path(result_file) for result_file in args.result_files or []])
     except Exception as e:
         #if __debug__:
         #    raise
@@ -138,6 +438,9 @@ def main():
         print(f"\nError: {e}")
         print("See error.log for more details. If you think this may be a bug, please consider opening an issue at: " +
               "https://github.com/moozilla/setup-finder/issues")
+    finally:
+        if hasattr(backend, "close"):
+            backend.close()
 
 
 # need this part so script works when build into an EXE file with PyInstaller
@@ -0,0 +1,365 @@
+"""Backends that actually run sfinder commands for SFinder.
+
+A backend has a single method, run(command, options, output_file=None), which runs an sfinder command
+("setup", "path" or "percent") with a list of command line options and returns a tuple of
+(console output, contents of output_file or None). output_file is the result file to read back ("setup.html",
+"path_minimal.html"). Failures raise subprocess.CalledProcessError with sfinder's output, like check_output.
+Backends can also have a coroutine run_async with the same arguments, for the scheduler module. Backends without one
+are run in a thread by run_async.
+
+* SubprocessBackend runs sfinder.jar with java for every command (default).
+* JPypeBackend calls sfinder's Java entry point inside this process through JPype (optional dependency), so there
+  is no JVM startup or process spawn per command.
+* WorkerBackend keeps a pool of worker processes, each with a warm JVM running JPypeBackend. This isolates the
+  finder from the JVM (a crash or System.exit only takes down one worker, which is restarted) and runs commands in
+  parallel.
+* RecordingBackend wraps another backend and saves every response to a file.
+* ReplayBackend answers commands from a recording, so the finder can run without Java or sfinder.jar
+  (eg. for deterministic performance tests of the Python side).
+"""
+
+from pathlib import Path
+import json
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+from setupfinder.finder.jvm import JVMOptions
+
+BACKENDS = ["subprocess", "jpype", "worker"]
+
+# file sfinder writes results to, passed with -o (path adds _minimal/_unique to the name)
+OUTPUT_BASES = {"setup": "setup.html", "path": "path.html"}
+
+
+class SubprocessBackend:
+    """Run sfinder.jar in a new java process for every command, with java options chosen per command by JVMOptions."""
+
+    def __init__(self, working_dir, jvm_args=None):
+        if not (working_dir / "sfinder.jar").exists():
+            raise FileNotFoundError(f"Cannot find sfinder.jar. Sfinder should be installed in: {working_dir}")
+        self.working_dir = working_dir
+        self.jvm_options = JVMOptions.from_args(working_dir, jvm_args)
+
+    def run(self, command, options, output_file=None):
+        """Run sfinder in a private output directory, so several commands can run at the same time."""
+        run_dir, args = self._prepare(command, options)
+        try:
+            output = subprocess.check_output(
+                args, cwd=self.working_dir, stderr=subprocess.STDOUT, universal_newlines=True)
+            return output, self._read_output(run_dir, output_file)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    async def run_async(self, command, options, output_file=None):
+        """Like run, but waits for java without blocking the event loop."""
+        # imported here, only runs that prefetch need it (see scheduler module)
+        import asyncio
+        run_dir, args = self._prepare(command, options)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args, cwd=str(self.working_dir), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+            try:
+                stdout, _ = await process.communicate()
+            except BaseException:
+                # cancelled (eg. another query of the stage failed), stop java before its run_dir is removed
+                if process.returncode is None:
+                    try:
+                        process.kill()
+                    except ProcessLookupError:
+                        pass
+                    await process.wait()
+                raise
+            # same as universal_newlines in run
+            output = stdout.decode(errors="replace").replace("\r\n", "\n")
+            if process.returncode:
+                raise subprocess.CalledProcessError(process.returncode, args, output=output)
+            return output, self._read_output(run_dir, output_file)
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+    def _prepare(self, command, options):
+        """Make a private output directory and return it with the java command line."""
+        output_dir = self.working_dir / "output"
+        output_dir.mkdir(exist_ok=True)
+        run_dir = Path(tempfile.mkdtemp(dir=output_dir))
+        args = ["java"] + self.jvm_options.args(command, options) + ["-jar", "sfinder.jar", command] + options
+        args.extend(["-lp", str(run_dir / "last_output.txt")])
+        if command in OUTPUT_BASES:
+            args.extend(["-o", str(run_dir / OUTPUT_BASES[command])])
+        return run_dir, args
+
+    @staticmethod
+    def _read_output(run_dir, output_file):
+        # sfinder may not write an output file if there aren't any solutions
+        if output_file and (run_dir / output_file).exists():
+            with open(run_dir / output_file, "r", encoding="utf-8") as f:
+                return f.read()
+        return None
+
+
+class JPypeBackend:
+    """Run sfinder commands in an embedded JVM through JPype.
+
+    The JVM is started once (per process) with sfinder.jar on the classpath, then each command calls sfinder's entry
+    point class directly with console output captured. sfinder still writes its result HTML, into
+    a private temporary directory like SubprocessBackend. sfinder uses global state (System.out), so commands run one
+    at a time in each process, use WorkerBackend for parallel commands.
+    sfinder's main ends with System.exit, which would exit this process, so ENTRY_METHOD (static int mainRun(String[]),
+    which main calls and which returns the exit code) is called instead. Entry points without one aren't supported,
+    use SubprocessBackend for them.
+    """
+
+    ENTRY_POINT = "entry.EntryPointMain"
+    ENTRY_METHOD = "mainRun"
+
+    def __init__(self, working_dir, jvm_args=None, entry_point=None):
+        try:
+            import jpype
+        except ImportError:
+            raise ImportError("The jpype backend requires JPype, install it with: pip install JPype1")
+        jar_file = working_dir / "sfinder.jar"
+        if not jar_file.exists():
+            raise FileNotFoundError(f"Cannot find sfinder.jar. Sfinder should be installed in: {working_dir}")
+        self.working_dir = working_dir
+        self._jpype = jpype
+        if not jpype.isJVMStarted():
+            # one JVM runs every command, so it gets options for the heaviest ones
+            jvm_args = JVMOptions.from_args(working_dir, jvm_args).startup_args()
+            # sfinder resolves relative paths against user.dir
+            jpype.startJVM(*jvm_args, f"-Duser.dir={working_dir.resolve()}", classpath=[str(jar_file.resolve())])
+        entry_point = entry_point or self.ENTRY_POINT
+        self._entry = jpype.JClass(entry_point)
+        if not hasattr(self._entry, self.ENTRY_METHOD):
+            raise RuntimeError(f"{entry_point} has no {self.ENTRY_METHOD} method and its main may exit the process " +
+                               "(System.exit). Use --backend subprocess with this sfinder version.")
+        self._system = jpype.JClass("java.lang.System")
+        self._lock = threading.Lock()
+
+    def run(self, command, options, output_file=None):
+        jpype = self._jpype
+        ByteArrayOutputStream = jpype.JClass("java.io.ByteArrayOutputStream")
+        PrintStream = jpype.JClass("java.io.PrintStream")
+        output_dir = self.working_dir / "output"
+        output_dir.mkdir(exist_ok=True)
+        run_dir = Path(tempfile.mkdtemp(dir=output_dir))
+        try:
+            args = [command] + options + ["-lp", str(run_dir / "last_output.txt")]
+            if command in OUTPUT_BASES:
+                args.extend(["-o", str(run_dir / OUTPUT_BASES[command])])
+            with self._lock:
+                buffer = ByteArrayOutputStream()
+                stream = PrintStream(buffer, True, "UTF-8")
+                stdout, stderr = self._system.out, self._system.err
+                self._system.setOut(stream)
+                self._system.setErr(stream)
+                try:
+                    returncode = getattr(self._entry, self.ENTRY_METHOD)(jpype.JArray(jpype.JString)(args))
+                    returncode = int(returncode) if returncode is not None else 0
+                    failed = None
+                except jpype.JException as e:
+                    returncode = 1
+                    failed = e
+                finally:
+                    self._system.setOut(stdout)
+                    self._system.setErr(stderr)
+                output = str(buffer.toString("UTF-8"))
+            if failed is not None:
+                output += f"\nMessage: {failed.getMessage()}\n"
+            if returncode:
+                raise subprocess.CalledProcessError(returncode, ["sfinder", command] + options, output=output)
+            contents = None
+            if output_file and (run_dir / output_file).exists():
+                with open(run_dir / output_file, "r", encoding="utf-8") as f:
+                    contents = f.read()
+            return output, contents
+        finally:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def _worker_main(conn, working_dir, jvm_args):
+    """Worker process loop for WorkerBackend, runs commands received over conn until it gets None."""
+    try:
+        backend = JPypeBackend(working_dir, jvm_args)
+        startup_error = None
+    except Exception as e:  # pylint: disable=broad-except
+        startup_error = repr(e)  # reported for every command, instead of the worker just exiting
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        if startup_error is not None:
+            conn.send(("error", startup_error))
+            continue
+        try:
+            conn.send(("ok", backend.run(*job)))
+        except subprocess.CalledProcessError as e:
+            conn.send(("failed", (e.returncode, e.output)))
+        except Exception as e:  # pylint: disable=broad-except
+            conn.send(("error", repr(e)))
+
+
+class WorkerBackend:
+    """Pool of persistent worker processes, each keeping a JVM with sfinder loaded (see JPypeBackend).
+
+    Workers are started when first needed, at most workers commands run at the same time.
+    Call close() when done to shut down the workers.
+    """
+
+    def __init__(self, working_dir, workers=None, jvm_args=None):
+        if not (working_dir / "sfinder.jar").exists():
+            raise FileNotFoundError(f"Cannot find sfinder.jar. Sfinder should be installed in: {working_dir}")
+        self.working_dir = working_dir
+        self.jvm_args = jvm_args
+        self._idle = queue.Queue()
+        for _ in range(workers or os.cpu_count()):
+            self._idle.put(None)  # placeholder, started on first use
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _start_worker(self):
+        # imported here, only this backend needs it
+        import multiprocessing
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(
+            target=_worker_main, args=(child_conn, self.working_dir, self.jvm_args), daemon=True)
+        process.start()
+        worker = (process, parent_conn)
+        with self._lock:
+            self._workers.append(worker)
+        return worker
+
+    def run(self, command, options, output_file=None):
+        worker = self._idle.get()
+        try:
+            if worker is None:
+                worker = self._start_worker()
+            process, conn = worker
+            conn.send((command, options, output_file))
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # worker died (JVM crashed or exited), replace it next time
+            worker = None
+            raise RuntimeError(f"Sfinder worker exited while running: {command} {' '.join(options)}")
+        finally:
+            self._idle.put(worker)
+        if status == "failed":
+            returncode, output = result
+            raise subprocess.CalledProcessError(returncode, ["sfinder", command] + options, output=output)
+        if status == "error":
+            raise RuntimeError(f"Sfinder worker error: {result}")
+        return result
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for process, conn in workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+def get_backend(name, working_dir, workers=None, jvm_args=None):
+    """Create a backend by name (one of BACKENDS). jvm_args is a JVMOptions or list of java options."""
+    if name == "subprocess":
+        return SubprocessBackend(working_dir, jvm_args)
+    if name == "jpype":
+        return JPypeBackend(working_dir, jvm_args)
+    if name == "worker":
+        return WorkerBackend(working_dir, workers=workers, jvm_args=jvm_args)
+    raise ValueError(f"Unknown sfinder backend '{name}'.")
+
+
+async def run_async(backend, command, options, output_file=None):
+    """Run a command with backend without blocking the event loop (in a thread if backend has no run_async)."""
+    if hasattr(backend, "run_async"):
+        return await backend.run_async(command, options, output_file)
+    import asyncio
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, backend.run, command, options, output_file)
+
+
+def _key(command, options):
+    return json.dumps([command] + list(options))
+
+
+class RecordingBackend:
+    """Pass commands through to another backend, recording every response (including failures) to record_file.
+
+    Recordings are JSON Lines, one response per line, appended as they happen so a crashed run keeps its recording.
+    """
+
+    def __init__(self, backend, record_file):
+        self.backend = backend
+        self.record_file = record_file
+        self._lock = threading.Lock()
+
+    def run(self, command, options, output_file=None):
+        try:
+            output, contents = self.backend.run(command, options, output_file)
+            self._record(command, options, output_file, 0, output, contents)
+            return output, contents
+        except subprocess.CalledProcessError as e:
+            self._record(command, options, output_file, e.returncode, e.output, None)
+            raise
+
+    async def run_async(self, command, options, output_file=None):
+        try:
+            output, contents = await run_async(self.backend, command, options, output_file)
+            self._record(command, options, output_file, 0, output, contents)
+            return output, contents
+        except subprocess.CalledProcessError as e:
+            self._record(command, options, output_file, e.returncode, e.output, None)
+            raise
+
+    def close(self):
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+    def _record(self, command, options, output_file, returncode, output, contents):
+        record = {
+            'command': command,
+            'options': list(options),
+            'output_file': output_file,
+            'returncode': returncode,
+            'output': output,
+            'contents': contents
+        }
+        with self._lock:
+            with open(self.record_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+class ReplayBackend:
+    """Answer sfinder commands from recordings made with RecordingBackend.
+
+    Responses are keyed by command and options (so by fumen, pieces and height). Commands that weren't recorded
+    are passed to fallback if given, otherwise they raise KeyError.
+    """
+
+    def __init__(self, record_file=None, responses=None, fallback=None):
+        self.responses = dict(responses) if responses is not None else {}
+        self.fallback = fallback
+        if record_file is not None:
+            with open(record_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    self.responses[_key(record['command'], record['options'])] = (record['returncode'],
+                                                                                 record['output'], record['contents'])
+
+    def run(self, command, options, output_file=None):
+        key = _key(command, options)
+        if key not in self.responses:
+            if self.fallback is not None:
+                return self.fallback.run(command, options, output_file)
+            raise KeyError(f"No recorded sfinder response for: {command} {' '.join(options)}")
+        returncode, output, contents = self.responses[key]
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, ["sfinder", command] + list(options), output=output)
+        return output, contents
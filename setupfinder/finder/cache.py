@@ -1,14 +1,24 @@
-"""Save sfinder results for faster setup finding times."""
+"""Import the old per-file sfinder result cache.
 
-from os import getcwd
-from os.path import isfile
-from setupfinder.finder.tet import TetSolution, TetField
-from setupfinder.finder import fumen
+Before cache.bin, results were saved as one text file per query in ./cache (a list of fumens, or a PC rate), and each
+sfinder call checked for its file. import_legacy_cache moves the whole directory into the main cache in one go, so
+sfinder calls don't touch the filesystem anymore. Imported files are moved to notes/old_cache like before.
+"""
+
+import os
+import re
 from pathlib import Path
+from setupfinder.finder.tet import TetSolution, TetField
+from setupfinder.finder import fumen, normalize
 
 #working_dir = "%s\\..\\%s" % (getcwd(), "cache")
 working_dir = Path.cwd() / "cache"
 backup_dir = Path.cwd() / "notes" / "old_cache"
+# files are named after the query with "v115@" and "?" stripped, "/" and "*" replaced by "_"
+# path/percent files start with p/r and the pieces (from TetSolution.get_remaining_pieces)
+PIECES_FILE = re.compile(r"([pr])((?:[LJSZIOT],)*_p7)(.+)")
+# below this many files decoding in parallel isn't worth starting processes
+PARALLEL_MIN_FILES = 256
 
 
 def get_cache_file(fm):
@@ -20,45 +30,63 @@ def get_cache_file(fm):
     return clean + ".txt"
 
 
-def get_solutions(fm):
-    """Attempt to retrieve solutions from cache."""
-    fname = get_cache_file(fm)
-    cache_file = Path(working_dir / fname)
-    if cache_file.exists():
-        with cache_file.open() as f:
-            sols = f.read().splitlines()
-        # move to backup of old caches
-        cache_file.rename(backup_dir / fname)
-        solutions = []
-        for sol in sols:
-            field, seq = fumen.decode(sol)
-            solutions.append(TetSolution(TetField(from_list=field), sol, seq))
-        return solutions
-    else:
-        return None
-
+def parse_cache_file(name):
+    """Return (command, fumen, pieces) of the query a legacy cache file (name without .txt) was saved for."""
+    match = PIECES_FILE.fullmatch(name)
+    if match:
+        command = "path" if match.group(1) == "p" else "percent"
+        fm = "v115@" + match.group(3).replace("_", "/")
+        try:
+            fumen.decode(fm)
+            return command, fm, match.group(2).replace("_", "*")
+        except (ValueError, NotImplementedError, IndexError):
+            pass  # setup fumen that happens to look like pieces
+    return "setup", "v115@" + name.replace("_", "/"), None
 
-'''def save_solutions(fm, solutions):
-    """Save solutions in cache."""
-    sols = "\n".join(map(lambda sol: sol.fumen, solutions))
-    with open(get_cache_file(fm), "w+") as cacheFile:
-        cacheFile.write(sols)
 
+def read_cache_file(cache_file):
+    """Return (key, value) for a legacy cache file, key is the canonical cache key (see normalize module)."""
+    command, fm, pieces = parse_cache_file(cache_file.stem)
+    with cache_file.open() as f:
+        contents = f.read()
+    if command == "percent":
+        value = contents
+    else:
+        value = []
+        for sol in contents.splitlines():
+            field, seq = fumen.decode(sol)
+            value.append(TetSolution(TetField(from_list=field), sol, seq))
+    key, mirrored = normalize.cache_key(command, fm, pieces)
+    if mirrored:
+        try:
+            return key, normalize.mirror_result(value)
+        except (ValueError, NotImplementedError):
+            # can't be mirrored, use the key for this orientation
+            key, _ = normalize.cache_key(command, fm, pieces, mirrors=False)
+    return key, value
 
-def save_PC_rate(fm, rate):
-    """Save PC rate in cache."""
-    with open(get_cache_file(fm), "w+") as cacheFile:
-        cacheFile.write(rate)'''
 
+def import_legacy_cache(setup_cache, legacy_dir=None, old_cache_dir=None, workers=None):
+    """Add every result in the legacy cache directory to setup_cache, then move the files to old_cache_dir.
 
-def get_PC_rate(fm):
-    """Attempt to retrieve PC rate from cache."""
-    fname = get_cache_file(fm)
-    cache_file = Path(working_dir / fname)
-    if cache_file.exists():
-        with cache_file.open() as f:
-            rate = f.read()
-        cache_file.rename(backup_dir / fname)
-        return rate
+    Files are decoded in parallel if there are many of them. Results already in setup_cache are kept.
+    Returns number of files imported."""
+    legacy_dir = legacy_dir or working_dir
+    old_cache_dir = old_cache_dir or backup_dir
+    if not legacy_dir.is_dir():
+        return 0
+    files = sorted(legacy_dir.glob("*.txt"))
+    if not files:
+        return 0
+    if len(files) >= PARALLEL_MIN_FILES:
+        # imported here, most runs have no legacy cache to import
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            entries = list(executor.map(read_cache_file, files, chunksize=64))
     else:
-        return None
\ No newline at end of file
+        entries = [read_cache_file(cache_file) for cache_file in files]
+    setup_cache.update({key: value for key, value in entries if key not in setup_cache})
+    old_cache_dir.mkdir(parents=True, exist_ok=True)
+    for cache_file in files:
+        os.replace(cache_file, old_cache_dir / cache_file.name)
+    return len(files)
@@ -0,0 +1,355 @@
+"""Share one sfinder result cache between several finder processes.
+
+Normally each Finder loads its own copy of cache.bin and writes it back on exit, so runs going at the same time
+repeat each other's sfinder work and the last one to finish overwrites the others' results. Instead a cache server
+can own cache.bin: finders connect with --cache-server and read/add results through RemoteCache, and the server
+saves the cache periodically and when it shuts down.
+
+Start a server with: setup-finder-cache --cache cache.bin
+The default address is a unix socket in a directory only the user can access (a named pipe on windows), "host:port"
+listens on TCP instead, only on loopback addresses unless --allow-remote is given. Clients authenticate with a random
+key created for the user on first use (AUTHKEY_FILE, copy it to other machines to connect from them), and messages
+are JSON, never pickles, so a client can't make the server run code even if the key leaks.
+"""
+
+import argparse
+from pathlib import Path
+import gzip
+import ipaddress
+import json
+import os
+import pickle
+import secrets
+import sys
+import threading
+import time
+from setupfinder.finder.normalize import rekey_cache
+from setupfinder.finder.tet import TetField, TetSolution
+
+# sockets and the authentication key, readable only by the user
+PRIVATE_DIR = Path(os.environ.get("XDG_RUNTIME_DIR") or Path.home() / ".cache") / "setup-finder"
+AUTHKEY_FILE = PRIVATE_DIR / "authkey"
+if sys.platform == "win32":
+    DEFAULT_ADDRESS = r"\\.\pipe\setup-finder-cache"
+else:
+    DEFAULT_ADDRESS = str(PRIVATE_DIR / "cache.sock")
+
+
+def load_cache(cache_file, mirrors=True):
+    """Load a cache saved with save_cache, returns an empty cache if cache_file doesn't exist.
+
+    Entries from older versions are moved to canonical keys (see normalize module)."""
+    if not cache_file.exists():
+        return {}
+    with open(cache_file, "rb") as f:
+        # test magic bytes to see if cache is packed with gzip
+        is_gzipped = f.read(2) == b'\x1f\x8b'
+        # return to start of stream
+        f.seek(0)
+        if is_gzipped:
+            cache = pickle.load(gzip.GzipFile(fileobj=f))
+        else:
+            cache = pickle.load(f)
+    rekey_cache(cache, mirrors)
+    return cache
+
+
+def save_cache(cache_file, cache, pack_cache=False):
+    """Save cache to cache_file (gzipped if pack_cache).
+
+    Written to a temporary file first and then moved into place, so readers never see a partly written cache."""
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    open_func = gzip.open if pack_cache else open
+    try:
+        with open_func(tmp_file, "wb") as f:
+            pickle.dump(cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    finally:
+        if tmp_file.exists():
+            tmp_file.unlink()
+
+
+def parse_address(address):
+    """"host:port" is a TCP address, anything else a unix socket path or windows pipe name."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and not address.startswith("\\\\"):
+        return (host or "localhost", int(port))
+    return address
+
+
+def private_dir():
+    """Create PRIVATE_DIR if needed, with permissions so only the user can access it."""
+    PRIVATE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if sys.platform != "win32":
+        os.chmod(PRIVATE_DIR, 0o700)
+    return PRIVATE_DIR
+
+
+def get_authkey(authkey_file=None):
+    """The user's key for authenticating with cache servers and daemons, a random one is created on first use."""
+    if authkey_file is None:
+        private_dir()
+        authkey_file = AUTHKEY_FILE
+    try:
+        fd = os.open(str(authkey_file), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        if sys.platform != "win32" and os.stat(str(authkey_file)).st_mode & 0o077:
+            raise PermissionError(f"{authkey_file} can be read by other users, make it private with: chmod 600 " +
+                                  str(authkey_file))
+        return authkey_file.read_bytes()
+    authkey = secrets.token_bytes(32)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+def check_address(address, allow_remote=False):
+    """Raise ValueError for a TCP address other machines can connect to, unless allow_remote."""
+    if not isinstance(address, tuple) or allow_remote:
+        return
+    host = address[0]
+    try:
+        loopback = ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        loopback = host == "localhost"
+    if not loopback:
+        raise ValueError(f"Not listening on {host}, other machines could connect to it. Use a loopback address " +
+                         "(eg. localhost:port) or --allow-remote.")
+
+
+def listen(address, authkey, allow_remote=False):
+    """Return a Listener for a server at address (see parse_address), only the user can connect to its socket."""
+    # imported here, runs without a server don't need it
+    from multiprocessing.connection import Listener
+    check_address(address, allow_remote)
+    if isinstance(address, str) and sys.platform != "win32":
+        if address == DEFAULT_ADDRESS:
+            private_dir()
+        if os.path.exists(address):
+            os.unlink(address)  # stale socket from a server that didn't shut down cleanly
+    listener = Listener(address, authkey=authkey)
+    if isinstance(address, str) and sys.platform != "win32":
+        os.chmod(address, 0o600)
+    return listener
+
+
+def accept(listener):
+    """Accept a connection, None if it failed (eg. a client with the wrong key)."""
+    from multiprocessing import AuthenticationError
+    try:
+        return listener.accept()
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+
+def connect(address, authkey, name, command):
+    """Connect to a server, raises ConnectionError if it isn't running or doesn't accept authkey."""
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Client
+    try:
+        return Client(address, authkey=authkey)
+    except (OSError, EOFError):
+        raise ConnectionError(f"Can't connect to {name} at {address}. Start one with: {command}")
+    except AuthenticationError:
+        raise ConnectionError(f"The {name} at {address} didn't accept the authentication key in {AUTHKEY_FILE}.")
+
+
+def send_json(conn, message):
+    conn.send_bytes(json.dumps(message).encode())
+
+
+def recv_json(conn):
+    return json.loads(conn.recv_bytes().decode())
+
+
+# key of the dict lists of TetSolutions are sent as, other values (eg. the cost module's model) are sent as they are
+SOLUTIONS_TAG = "__solutions__"
+
+
+def pack_value(value):
+    """Cache value as JSON: setup/path results (lists of TetSolutions) are tagged, anything else is left as it is."""
+    if isinstance(value, list) and all(isinstance(sol, TetSolution) for sol in value):
+        return {
+            SOLUTIONS_TAG:
+            [[sol.fumen, sol.sequence, sol.carry, sol.field.field, sol.field.clearedRows] for sol in value]
+        }
+    return value
+
+
+def unpack_value(value):
+    """Rebuild a cache value from pack_value output."""
+    if isinstance(value, dict) and list(value) == [SOLUTIONS_TAG]:
+        solutions = []
+        for fumen, sequence, carry, rows, cleared_rows in value[SOLUTIONS_TAG]:
+            field = TetField(from_list=rows)
+            field.clearedRows = cleared_rows
+            solution = TetSolution(field, fumen, sequence)
+            if carry:
+                solution.carry = carry
+            solutions.append(solution)
+        return solutions
+    return value
+
+
+class RemoteCache:
+    """Dict-like client for a CacheServer, can be used as SFinder's cache.
+
+    Each thread gets its own connection, so it works with SFinder.prefetch."""
+
+    _MISSING = ("missing",)
+
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.authkey = authkey if authkey is not None else get_authkey()
+        self._local = threading.local()
+        self._request("len")  # fail early if the server isn't running
+
+    def _request(self, *request):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.address, self.authkey, "cache server", "setup-finder-cache")
+            self._local.conn = conn
+        send_json(conn, request)
+        reply = recv_json(conn)
+        if isinstance(reply, list) and reply and reply[0] == "error":
+            raise RuntimeError(f"Cache server error: {reply[1]}")
+        return reply
+
+    def get(self, key, default=None):
+        reply = self._request("get", key)
+        return unpack_value(reply[1]) if reply[0] == "ok" else default
+
+    def __getitem__(self, key):
+        reply = self._request("get", key)
+        if reply[0] != "ok":
+            raise KeyError(key)
+        return unpack_value(reply[1])
+
+    def __setitem__(self, key, value):
+        self._request("set", key, pack_value(value))
+
+    def __contains__(self, key):
+        return self._request("contains", key)
+
+    def __len__(self):
+        return self._request("len")
+
+    def update(self, items):
+        self._request("update", {key: pack_value(value) for key, value in dict(items).items()})
+
+    def save(self):
+        """Ask the server to save the cache now."""
+        self._request("save")
+
+
+class CacheServer:
+    """Serve the cache in cache_file to RemoteCache clients, saving it every save_interval seconds if it changed."""
+
+    def __init__(self,
+                 cache_file,
+                 address=DEFAULT_ADDRESS,
+                 pack_cache=False,
+                 save_interval=60,
+                 authkey=None,
+                 allow_remote=False):
+        self.cache_file = cache_file
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.pack_cache = pack_cache
+        self.save_interval = save_interval
+        self.authkey = authkey  # None for the user's key (see get_authkey)
+        self.allow_remote = allow_remote  # if TCP addresses other machines can reach are allowed
+        self.cache = load_cache(cache_file)
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def serve_forever(self):
+        authkey = self.authkey if self.authkey is not None else get_authkey()
+        with listen(self.address, authkey, self.allow_remote) as listener:
+            threading.Thread(target=self._save_loop, daemon=True).start()
+            while True:
+                conn = accept(listener)
+                if conn is not None:
+                    threading.Thread(target=self._handle, args=(conn, ), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = recv_json(conn)
+                except (EOFError, OSError, ValueError):
+                    return
+                try:
+                    reply = self._reply(request)
+                except Exception as e:
+                    # a bad request gets an error back instead of ending the connection
+                    reply = ("error", f"{type(e).__name__}: {e}")
+                send_json(conn, reply)
+
+    def _reply(self, request):
+        op = request[0]
+        with self._lock:
+            if op == "get":
+                if request[1] in self.cache:
+                    return ("ok", pack_value(self.cache[request[1]]))
+                return RemoteCache._MISSING
+            if op == "contains":
+                return request[1] in self.cache
+            if op == "len":
+                return len(self.cache)
+            if op == "set":
+                self.cache[request[1]] = unpack_value(request[2])
+                self._dirty = True
+                return None
+            if op == "update":
+                self.cache.update((key, unpack_value(value)) for key, value in request[1].items())
+                self._dirty = True
+                return None
+        if op == "save":
+            self.save()
+            return None
+        raise ValueError(f"Unknown cache server request '{op}'.")
+
+    def save(self):
+        with self._lock:
+            # values are never mutated once added, so a shallow copy is enough to save outside the lock
+            cache = dict(self.cache)
+            self._dirty = False
+        save_cache(self.cache_file, cache, self.pack_cache)
+
+    def _save_loop(self):
+        while True:
+            time.sleep(self.save_interval)
+            if self._dirty:
+                self.save()
+
+
+def main():
+    """Entry point for the cache server."""
+    parser = argparse.ArgumentParser(description="Share a setup-finder cache between finder processes.")
+    parser.add_argument("--cache", dest="cache_file", help="location of cache file", default="cache.bin")
+    parser.add_argument("--pack", dest="pack_cache", help="gzip the cache file when saving", action="store_true")
+    parser.add_argument(
+        "--address", dest="address", help="socket path, pipe name or host:port to listen on", default=DEFAULT_ADDRESS)
+    parser.add_argument(
+        "--save-interval", dest="save_interval", type=float, help="seconds between saves", default=60)
+    parser.add_argument(
+        "--allow-remote",
+        dest="allow_remote",
+        help="allow listening on a TCP address other machines can connect to (they need a copy of the key in " +
+        f"{AUTHKEY_FILE})",
+        action="store_true")
+    args = parser.parse_args(sys.argv[1:])
+    server = CacheServer(
+        Path(args.cache_file), args.address, args.pack_cache, args.save_interval, allow_remote=args.allow_remote)
+    print(f"Serving {len(server.cache)} cached results from {args.cache_file} at {args.address}. Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Saving cache...")
+        server.save()
+
+
+if __name__ == "__main__":
+    main()
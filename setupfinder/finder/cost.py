@@ -0,0 +1,72 @@
+"""Estimate how long sfinder queries take, so the scheduler can start the longest ones first.
+
+Most queries take under a second but some (tall fields, TST shapes, *p7 selectors) take minutes. Run in a fixed order,
+a parallel stage can end with one JVM grinding on a straggler while the others sit idle. CostModel predicts log run
+time per command with a linear model of field height, free cells and log number of piece sequences (see
+jvm.query_size). It starts from a rough prior and learns from the timings of every query the scheduler runs,
+the fitted state is kept in the cache under COST_MODEL_KEY so it improves across runs.
+"""
+
+from math import exp, log
+import numpy as np
+from setupfinder.finder.jvm import query_size
+
+COST_MODEL_KEY = "__cost_model__"
+# log seconds = intercept + height + free cells + log sequences
+PRIOR = [log(0.5), 0.4, 0.02, 0.3]
+# how many observations the prior is worth
+PRIOR_WEIGHT = 5.0
+
+
+def features(command, query):
+    """Feature vector of a query (kwargs dict for an SFinder command)."""
+    options = ["-t", query['fumen']]
+    if query.get('pieces'):
+        options.extend(["-p", query['pieces']])
+    if query.get('height'):
+        options.extend(["-c", str(query['height'])])
+    height, sequences, free = query_size(options)
+    return [1.0, float(height), float(free), log(sequences)]
+
+
+class CostModel:
+    """Per command ridge regression (towards PRIOR) of log run time, updated one observation at a time."""
+
+    def __init__(self, state=None):
+        # command -> (X^T X, X^T y, number of observations)
+        self.state = {}
+        for command, (xtx, xty, n) in (state or {}).items():
+            self.state[command] = (np.array(xtx), np.array(xty), n)
+        self._coefficients = {}
+
+    @classmethod
+    def load(cls, cache):
+        return cls(cache.get(COST_MODEL_KEY))
+
+    def save(self, cache):
+        cache[COST_MODEL_KEY] = {
+            command: (xtx.tolist(), xty.tolist(), n)
+            for command, (xtx, xty, n) in self.state.items()
+        }
+
+    def observe(self, command, query, seconds):
+        """Add the run time of a query."""
+        x = np.array(features(command, query))
+        xtx, xty, n = self.state.get(command, (np.zeros((len(x), len(x))), np.zeros(len(x)), 0))
+        self.state[command] = (xtx + np.outer(x, x), xty + x * log(max(seconds, 1e-3)), n + 1)
+        self._coefficients.pop(command, None)
+
+    def coefficients(self, command):
+        if command not in self._coefficients:
+            prior = np.array(PRIOR)
+            if command in self.state:
+                xtx, xty, _ = self.state[command]
+                ridge = PRIOR_WEIGHT * np.eye(len(prior))
+                self._coefficients[command] = np.linalg.solve(xtx + ridge, xty + ridge @ prior)
+            else:
+                self._coefficients[command] = prior
+        return self._coefficients[command]
+
+    def predict(self, command, query):
+        """Predicted run time of a query in seconds."""
+        return exp(float(np.dot(self.coefficients(command), features(command, query))))
@@ -3,36 +3,51 @@
 The finder module is intended to be used by scripts to run any setup finding code.
 Input and output should be done by the scripts themselves and then passed into and received from the finder module."""
 
-from copy import deepcopy
+from collections import Counter
 from pathlib import Path
-import gzip
-import pickle
-import colorama  # so tqdm looks good on windows
-from tqdm import tqdm
 from setupfinder.finder.sfinder import SFinder
 from setupfinder.finder.tet import TetOverlay, TetSetup, TetField
-from setupfinder.finder import gen
-
-
-def is_TSS(solution, x, y, vertical_T=False, mirror=False):
-    # for now, filter out solutions that use less than 6 pieces
-    # (carrying over pieces into the next bag makes search space too large)
-
-    if len(solution.sequence) == 6:
+from setupfinder.finder import gen, cache
+from setupfinder.finder.profiler import PROFILER
+from setupfinder.finder.cache_server import RemoteCache, load_cache, save_cache
+
+
+def carried_piece(solution, carry="", allow_carry=False):
+    """Return the piece solution leaves for the next bag ("" for none), or None if the bag can't build it.
+
+    A bag has its 6 pieces before the T, plus carry if the bag before left one. Solutions have to use all of them,
+    or all but one if allow_carry (that piece is carried into the next bag)."""
+    left = Counter("IJLOSZ" + carry)
+    left.subtract(p for p in solution.sequence if p in "TIJLOSZ")
+    if any(n < 0 for n in left.values()):
+        return None  # uses pieces the bag doesn't have
+    left = "".join(left.elements())
+    if not left or (allow_carry and len(left) == 1):
+        return left
+    return None
+
+
+def is_TSS(solution, x, y, vertical_T=False, mirror=False, carry="", allow_carry=False):
+    # solutions have to use every piece in the bag, or all but one with carry-N (see carried_piece)
+    carry_out = carried_piece(solution, carry, allow_carry)
+    if carry_out is not None:
         # leaving each solution's field modfied is by design
         # this way it's as if sfinder had found solutions with Ts already placed
         solution.field.add_T(x, y, vertical=vertical_T, mirror=mirror)
         # todo: (maybe I should move addT to TetSolution?)
         solution.sequence += "T"
+        solution.carry = carry_out
         return solution.field.clearedRows == 1
     else:
         return False
 
 
-def is_TSD(solution, x, y):
-    if len(solution.sequence) == 6:
+def is_TSD(solution, x, y, carry="", allow_carry=False):
+    carry_out = carried_piece(solution, carry, allow_carry)
+    if carry_out is not None:
         solution.field.add_T(x, y, False)  #flat T
         solution.sequence += "T"
+        solution.carry = carry_out
         return solution.field.clearedRows == 2
     else:
         return False
@@ -40,27 +55,91 @@ def is_TSD(solution, x, y):
 
 def test_TSD(solution, x, y):
     """Test if solution _would_ be a TSD, don't actually add the T piece like isTSD."""
-    sol = deepcopy(solution)
+    sol = PROFILER.deepcopy(solution)
     sol.field.add_T(x, y, False)  #flat T
     return sol.field.clearedRows == 2
 
 
-def is_TST(solution, x, y, mirror):
-    if len(solution.sequence) == 6:
+def is_TST(solution, x, y, mirror, carry="", allow_carry=False):
+    carry_out = carried_piece(solution, carry, allow_carry)
+    if carry_out is not None:
         #vertical T, flipped in comparison to TSS vertical T
         solution.field.add_T(x - 1 if mirror else x + 1, y, True, mirror=not mirror)
         solution.sequence += "T"
+        solution.carry = carry_out
         return solution.field.clearedRows == 3
     else:
         return False
 
 
-def get_TSS_continuations(field, rows, cols, bag_filter, TSS1, TSS2, find_mirrors, use_cache=None):
+# filters that place the T, so they know which pieces a setup used (and which one it carries)
+CARRY_FILTERS = ["isTSS-any", "isTSD-any", "isTST"]
+
+
+def setup_comment(carry=""):
+    """sfinder options for T-spin setup queries on a field, carry is the piece the bag before left ("" for none).
+
+    The carried piece comes before the bag, so a query has no more sequences than the bag itself."""
+    return f"-m o -f i -p {carry},[^T]!" if carry else "-m o -f i -p [^T]!"
+
+
+def check_carry(bags):
+    """Raise ValueError if bags (dicts from parse_input_line) carry a piece into a bag that would lose it."""
+    for i, args in enumerate(bags):
+        if args.get('carry') is None:
+            continue
+        if args['filter'] not in CARRY_FILTERS:
+            raise ValueError(f"Bag {i}: carry needs one of the filters {', '.join(CARRY_FILTERS)}.")
+        if i + 1 < len(bags) and bags[i + 1]['setup_type'] != "PC" and bags[i + 1]['filter'] not in CARRY_FILTERS:
+            raise ValueError(f"Bag {i + 1}: bag {i} can carry a piece into it, so it needs one of the filters " +
+                             f"{', '.join(CARRY_FILTERS)} (Tetris bags can't use a carried piece).")
+
+
+def check_carried_into(carry, bag_filter):
+    """Raise ValueError if a piece is carried into a bag whose filter doesn't account for it (see check_carry)."""
+    if carry and bag_filter not in CARRY_FILTERS:
+        raise ValueError(f"A piece ({carry}) can't be carried into a bag without one of the filters " +
+                         f"{', '.join(CARRY_FILTERS)}.")
+
+
+def prune_carried(solutions, carry_limit):
+    """Keep at most carry_limit solutions that carry a piece into the next bag, one for each field and carried piece
+    (solutions ending on the same field with the same piece have the same continuations)."""
+    seen = set()
+    pruned = []
+    for solution in solutions:
+        if solution.carry:
+            key = (tuple(map(tuple, solution.field.field)), solution.carry)
+            if key in seen or len(seen) >= carry_limit:
+                PROFILER.count("carry_pruned")
+                continue
+            seen.add(key)
+        pruned.append(solution)
+    return pruned
+
+
+def get_TSS_continuations(field,
+                          rows,
+                          cols,
+                          bag_filter,
+                          TSS1,
+                          TSS2,
+                          find_mirrors,
+                          use_cache=None,
+                          sf=None,
+                          carry="",
+                          carry_limit=None):
     """Finds TSS continuations. Set TSS1 and TSS2 variables to choose which type.
-    Find mirrors should be used to find setups with both left and right overhangs."""
-    sf = SFinder(setup_cache=use_cache)
+    Find mirrors should be used to find setups with both left and right overhangs.
+    carry is the piece the bag before left, set carry_limit to allow carrying one into the next bag."""
+    check_carried_into(carry, bag_filter)
+    sf = sf if sf is not None else SFinder(setup_cache=use_cache)
+    comment = setup_comment(carry)
+    allow_carry = carry_limit is not None
     solutions = []
     mirrors = [False, True] if find_mirrors else [False]
+    # imported here, runs that fail early or only read snapshots don't need it (see bench_import)
+    from tqdm import tqdm
     # manual tqdm progress bar
     t = tqdm(total=len(rows) * len(cols) * (2 if TSS1 and TSS2 else 1) * len(mirrors), unit="setup", leave=False)
     for row in rows:
@@ -68,20 +147,20 @@ def get_TSS_continuations(field, rows, cols, bag_filter, TSS1, TSS2, find_mirror
             for mirror in mirrors:
                 # make copies to avoid mutating field
                 if TSS1:
-                    tss1_field = deepcopy(field)
+                    tss1_field = PROFILER.deepcopy(field)
                     # 6 is a reasonable height for blank field setups (7+ should be impossible in one bag)
                     # may want to have an option for different heights for finding tspins in other bags (prob pass an arg)
                     if tss1_field.add_overlay(gen.generate_TSS1(6, col, row, mirror)):
-                        tss1_sols = sf.setup(fumen=gen.output_fumen(tss1_field.field))
+                        tss1_sols = sf.setup(fumen=gen.output_fumen(tss1_field.field, comment=comment))
                         # copy so we can try both flat and vertical T
                     else:
                         tss1_sols = []
                     t.update()
-                    tss1_sols_copy = deepcopy(tss1_sols)
+                    tss1_sols_copy = PROFILER.deepcopy(tss1_sols)
                 if TSS2:
-                    tss2_field = deepcopy(field)
+                    tss2_field = PROFILER.deepcopy(field)
                     if tss2_field.add_overlay(gen.generate_TSS2(6, col, row, mirror)):
-                        tss2_sols = sf.setup(fumen=gen.output_fumen(tss2_field.field))
+                        tss2_sols = sf.setup(fumen=gen.output_fumen(tss2_field.field, comment=comment))
 
                     else:
                         tss2_sols = []
@@ -92,12 +171,13 @@ def get_TSS_continuations(field, rows, cols, bag_filter, TSS1, TSS2, find_mirror
                     # check if setup is actually a TSS (with all 7 pieces)
                     if TSS1:
                         valid_sols.extend(
-                            filter(lambda sol: is_TSS(sol, col, row, vertical_T=False, mirror=mirror), tss1_sols))
+                            filter(lambda sol: is_TSS(sol, col, row, False, mirror, carry, allow_carry), tss1_sols))
                         valid_sols.extend(
-                            filter(lambda sol: is_TSS(sol, col, row, vertical_T=True, mirror=mirror), tss1_sols_copy))
+                            filter(lambda sol: is_TSS(sol, col, row, True, mirror, carry, allow_carry),
+                                   tss1_sols_copy))
                     if TSS2:
                         valid_sols.extend(
-                            filter(lambda sol: is_TSS(sol, col, row, vertical_T=False, mirror=mirror), tss2_sols))
+                            filter(lambda sol: is_TSS(sol, col, row, False, mirror, carry, allow_carry), tss2_sols))
                 else:
                     if TSS1:
                         valid_sols.extend(tss1_sols)
@@ -107,26 +187,31 @@ def get_TSS_continuations(field, rows, cols, bag_filter, TSS1, TSS2, find_mirror
                 #print("  Found %d valid TSS setups at %d,%d" % (len(valid_sols), col, row))
                 solutions.extend(valid_sols)
     t.close()
-    return solutions
+    return prune_carried(solutions, carry_limit) if allow_carry else solutions
 
 
-def get_TSD_continuations(field, rows, cols, bag_filter, find_mirrors, use_cache=None):
-    sf = SFinder(setup_cache=use_cache)
+def get_TSD_continuations(field, rows, cols, bag_filter, find_mirrors, use_cache=None, sf=None, carry="",
+                          carry_limit=None):
+    check_carried_into(carry, bag_filter)
+    sf = sf if sf is not None else SFinder(setup_cache=use_cache)
+    comment = setup_comment(carry)
+    allow_carry = carry_limit is not None
     solutions = []
     mirrors = [False, True] if find_mirrors else [False]
+    from tqdm import tqdm  # imported here, see get_TSS_continuations
     # manual tqdm progress bar
     t = tqdm(total=len(rows) * len(cols) * len(mirrors), unit="setup", leave=False)
     for row in rows:
         for col in cols:
             for mirror in mirrors:
                 # make copies to avoid mutating field
-                tsd_field = deepcopy(field)
+                tsd_field = PROFILER.deepcopy(field)
                 if tsd_field.add_overlay(gen.generate_TSD(6, col, row, mirror)):
-                    tsd_sols = sf.setup(fumen=gen.output_fumen(tsd_field.field))
+                    tsd_sols = sf.setup(fumen=gen.output_fumen(tsd_field.field, comment=comment))
 
                     valid_sols = []
                     if bag_filter == "isTSD-any":
-                        valid_sols.extend(filter(lambda sol: is_TSD(sol, col, row), tsd_sols))
+                        valid_sols.extend(filter(lambda sol: is_TSD(sol, col, row, carry, allow_carry), tsd_sols))
                     elif bag_filter == "testTSD":
                         valid_sols.extend(filter(lambda sol: test_TSD(sol, col, row), tsd_sols))
                     else:
@@ -134,42 +219,49 @@ def get_TSD_continuations(field, rows, cols, bag_filter, find_mirrors, use_cache
                     solutions.extend(valid_sols)
                 t.update()
     t.close()
-    return solutions
+    return prune_carried(solutions, carry_limit) if allow_carry else solutions
 
 
-def get_TST_continuations(field, rows, cols, bag_filter, find_mirrors, use_cache=None):
-    sf = SFinder(setup_cache=use_cache)
+def get_TST_continuations(field, rows, cols, bag_filter, find_mirrors, use_cache=None, sf=None, carry="",
+                          carry_limit=None):
+    check_carried_into(carry, bag_filter)
+    sf = sf if sf is not None else SFinder(setup_cache=use_cache)
+    comment = setup_comment(carry)
+    allow_carry = carry_limit is not None
     solutions = []
     mirrors = [False, True] if find_mirrors else [False]
+    from tqdm import tqdm  # imported here, see get_TSS_continuations
     # manual tqdm progress bar
     t = tqdm(total=len(rows) * len(cols) * len(mirrors), unit="setup", leave=False)
     for row in rows:
         for col in cols:
             for mirror in mirrors:
                 # make copies to avoid mutating field
-                tst_field = deepcopy(field)
+                tst_field = PROFILER.deepcopy(field)
                 if tst_field.add_overlay(gen.generate_TST(6, col, row, mirror)):
-                    tst_sols = sf.setup(fumen=gen.output_fumen(tst_field.field))
+                    tst_sols = sf.setup(fumen=gen.output_fumen(tst_field.field, comment=comment))
 
                     #sf.setup returns None if setup would require too many pieces
                     if tst_sols is not None:
                         valid_sols = []
                         if bag_filter == "isTST":
-                            valid_sols.extend(filter(lambda sol: is_TST(sol, col, row, mirror), tst_sols))
+                            valid_sols.extend(
+                                filter(lambda sol: is_TST(sol, col, row, mirror, carry, allow_carry), tst_sols))
                         else:
                             valid_sols.extend(tst_sols)
                         solutions.extend(valid_sols)
                 t.update()
     t.close()
-    return solutions
+    return prune_carried(solutions, carry_limit) if allow_carry else solutions
 
 
-def get_Tetris_continuations(field, row, cols, use_cache=None):
-    sf = SFinder(setup_cache=use_cache)
+def get_Tetris_continuations(field, row, cols, use_cache=None, sf=None, carry=""):
+    check_carried_into(carry, None)
+    sf = sf if sf is not None else SFinder(setup_cache=use_cache)
     solutions = []
     for col in cols:
         # make copies to avoid mutating field
-        tet_field = deepcopy(field)
+        tet_field = PROFILER.deepcopy(field)
         # this height should be passed in (from input file?)
         tet_overlay = gen.generate_Tetris(7, col, row)
         if tet_field.add_overlay(tet_overlay):
@@ -178,68 +270,195 @@ def get_Tetris_continuations(field, row, cols, use_cache=None):
     return solutions
 
 
-def get_setup_func(args, find_mirrors=False, setup_cache=None):
+def get_setup_func(args, find_mirrors=False, setup_cache=None, sf=None):
     """Return a function that can be applied to a field argument to find setups of the proper type.
     
-    args is dict containing setup_type, rows, cols, filter, height, cutoff
+    args is dict containing setup_type, rows, cols, filter, height, cutoff, carry
+    sf is the SFinder to use, if not given one is created using setup_cache.
+    The function also takes the piece carried from the bag before ("" for none), see check_carry.
     """
+    carry_limit = args.get('carry')
     if args['setup_type'] == "TSS-any" or args['setup_type'] == "TSS":
-        return lambda field: get_TSS_continuations(field, args['rows'], args['cols'], args['filter'], True, True, find_mirrors, use_cache=setup_cache)
+        return lambda field, carry="": get_TSS_continuations(field, args['rows'], args['cols'], args['filter'], True, True, find_mirrors, use_cache=setup_cache, sf=sf, carry=carry, carry_limit=carry_limit)
     elif args['setup_type'] == "TSS1":
-        return lambda field: get_TSS_continuations(field, args['rows'], args['cols'], args['filter'], True, False, find_mirrors, use_cache=setup_cache)
+        return lambda field, carry="": get_TSS_continuations(field, args['rows'], args['cols'], args['filter'], True, False, find_mirrors, use_cache=setup_cache, sf=sf, carry=carry, carry_limit=carry_limit)
     elif args['setup_type'] == "TSS2":
-        return lambda field: get_TSS_continuations(field, args['rows'], args['cols'], args['filter'], False, True, find_mirrors, use_cache=setup_cache)
+        return lambda field, carry="": get_TSS_continuations(field, args['rows'], args['cols'], args['filter'], False, True, find_mirrors, use_cache=setup_cache, sf=sf, carry=carry, carry_limit=carry_limit)
     elif args['setup_type'] == "TSD-any" or args['setup_type'] == "TSD":
-        return lambda field: get_TSD_continuations(field, args['rows'], args['cols'], args['filter'], find_mirrors, use_cache=setup_cache)
+        return lambda field, carry="": get_TSD_continuations(field, args['rows'], args['cols'], args['filter'], find_mirrors, use_cache=setup_cache, sf=sf, carry=carry, carry_limit=carry_limit)
     elif args['setup_type'] == "TST":
-        return lambda field: get_TST_continuations(field, args['rows'], args['cols'], args['filter'], find_mirrors, use_cache=setup_cache)
+        return lambda field, carry="": get_TST_continuations(field, args['rows'], args['cols'], args['filter'], find_mirrors, use_cache=setup_cache, sf=sf, carry=carry, carry_limit=carry_limit)
     elif args['setup_type'] == "Tetris":
         # only supports 1 row for tetrises
-        return lambda field: get_Tetris_continuations(field, args['rows'][0], args['cols'], use_cache=setup_cache)
+        return lambda field, carry="": get_Tetris_continuations(field, args['rows'][0], args['cols'], use_cache=setup_cache, sf=sf, carry=carry)
     else:
         raise ValueError(f"Unknown setup type '{args['setup_type']}'.")
 
 
+def share_continuations(setup_func):
+    """Wrap a setup function so a field that comes up again with the same carried piece gets a copy of the first
+    result, instead of running the overlays and filters for it again."""
+    results = {}
+
+    def find(field, carry=""):
+        key = (tuple(map(tuple, field.field)), carry)
+        if key in results:
+            PROFILER.count("continuation_reuse")
+            return PROFILER.deepcopy(results[key])
+        results[key] = setup_func(field, carry)
+        return results[key]
+
+    return find
+
+
+# overlay generators used by get_setup_func for each setup type (Tetris is handled separately)
+OVERLAY_GENERATORS = {
+    "TSS-any": [gen.generate_TSS1, gen.generate_TSS2],
+    "TSS": [gen.generate_TSS1, gen.generate_TSS2],
+    "TSS1": [gen.generate_TSS1],
+    "TSS2": [gen.generate_TSS2],
+    "TSD-any": [gen.generate_TSD],
+    "TSD": [gen.generate_TSD],
+    "TST": [gen.generate_TST],
+}
+
+
+def iter_overlays(field, args, find_mirrors=False, carry=""):
+    """Yield the fumen of every sfinder setup query the setup function for args (see get_setup_func) makes for field.
+
+    Used to plan a stage's queries so they can be prefetched."""
+    if args['setup_type'] == "Tetris":
+        for col in args['cols']:
+            tet_field = PROFILER.deepcopy(field)
+            if tet_field.add_overlay(gen.generate_Tetris(7, col, args['rows'][0])):
+                yield gen.output_fumen(tet_field.field, comment="-m o -f i -p *p7")
+        return
+    if args['setup_type'] not in OVERLAY_GENERATORS:
+        raise ValueError(f"Unknown setup type '{args['setup_type']}'.")
+    mirrors = [False, True] if find_mirrors else [False]
+    for row in args['rows']:
+        for col in args['cols']:
+            for mirror in mirrors:
+                for generate in OVERLAY_GENERATORS[args['setup_type']]:
+                    overlay_field = PROFILER.deepcopy(field)
+                    if overlay_field.add_overlay(generate(6, col, row, mirror)):
+                        yield gen.output_fumen(overlay_field.field, comment=setup_comment(carry))
+
+
+def iter_leaves(setups):
+    """Yield setups without continuations (the ones the next stage is applied to)."""
+    for setup in setups:
+        if setup.continuations:
+            yield from iter_leaves(setup.continuations)
+        else:
+            yield setup
+
+
 class Finder:
-    def __init__(self, cache_file, pack_cache=False):
+    def __init__(self,
+                 cache_file,
+                 pack_cache=False,
+                 backend=None,
+                 cache_server=None,
+                 mirror_keys=True,
+                 jobs=None,
+                 cache=None):
         self.setups = []
         self.pc_finish = False
         # these are used in generating PC paths in output, if "best_pc" is found here these could be removed
         self.pc_height = None
         self.pc_cutoff = None
-        self.cache = {}  #initialize cache here
+        self.cache = cache if cache is not None else {}  #initialize cache here
         self.cache_file = cache_file
         self.pack_cache = pack_cache  # if cache should be gzipped when saved
+        self.backend = backend  # sfinder backend, None for default (see backend module)
+        # address of a cache server to share the cache with other finders, instead of using cache_file
+        self.cache_server = cache_server
+        self.mirror_keys = mirror_keys  # if mirror images share cache entries (see normalize module)
+        self.jobs = jobs  # sfinder commands to run at the same time, None for number of CPUs
+        # cache that's already loaded (kept by the daemon), used instead of cache_file and not saved on exit
+        self.shared_cache = cache
+        self._sfinder = None
+
+    @property
+    def sfinder(self):
+        """SFinder shared by every stage, created when first needed (so sfinder isn't required until then)."""
+        if self._sfinder is None:
+            self._sfinder = SFinder(
+                setup_cache=self.cache, backend=self.backend, mirror_keys=self.mirror_keys, jobs=self.jobs)
+        return self._sfinder
 
     def __enter__(self):
-        """When used in a context-manager, load sfinder result cache from cache.bin."""
-        if self.cache_file.exists():  # pylint: disable=E1101
-            with open(self.cache_file, "rb") as f:
-                # test magic bytes to see if cache is packed with gzip
-                is_gzipped = f.read(2) == b'\x1f\x8b'
-                # return to start of stream
-                f.seek(0)
-                if is_gzipped:
-                    self.cache = pickle.load(gzip.GzipFile(fileobj=f))
-                else:
-                    self.cache = pickle.load(f)
+        """When used in a context-manager, load sfinder result cache from cache.bin (or connect to cache server)."""
+        if self.shared_cache is not None:
+            self.cache = self.shared_cache
+        elif self.cache_server is not None:
+            self.cache = RemoteCache(self.cache_server)
+        else:
+            self.cache = load_cache(self.cache_file, self.mirror_keys)
+        # results from the old per-file cache (./cache) are moved into the cache once
+        imported = cache.import_legacy_cache(self.cache)
+        if imported:
+            print(f"Imported {imported} results from the legacy cache directory.")
+        # make sure sfinder uses the loaded cache
+        self._sfinder = None
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        open_func = gzip.open if self.pack_cache else open
-        with open_func(self.cache_file, "wb") as f:
-            pickle.dump(self.cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # the cache server (or daemon) saves the shared cache itself
+        if self.cache_server is None and self.shared_cache is None:
+            save_cache(self.cache_file, self.cache, self.pack_cache)
         return False  # don't supress any exceptions
 
+    def get_state(self):
+        """Return everything needed to continue finding setups from the current stage (for snapshots)."""
+        return {
+            'setups': self.setups,
+            'pc_finish': self.pc_finish,
+            'pc_height': self.pc_height,
+            'pc_cutoff': self.pc_cutoff
+        }
+
+    def set_state(self, state):
+        """Restore state from get_state."""
+        self.setups = state['setups']
+        self.pc_finish = state['pc_finish']
+        self.pc_height = state['pc_height']
+        self.pc_cutoff = state['pc_cutoff']
+
+    def stage_queries(self, args, initial=False):
+        """Return (command, queries) of the sfinder queries the stage for args makes, as kwargs dicts for command.
+
+        initial is True for the first stage (setups on a blank field). Used to prefetch or plan the stage."""
+        if initial:
+            return "setup", [{'fumen': fm} for fm in iter_overlays(TetField(from_list=[]), args)]
+        if args['setup_type'] == "PC":
+            return "percent", [{
+                'fumen': leaf.solution.to_fumen(),
+                'pieces': leaf.solution.get_remaining_pieces(),
+                'height': args['height']
+            } for leaf in iter_leaves(self.setups) if leaf.solution.field.height <= int(args['height'])]
+        return "setup", [{
+            'fumen': fm
+        } for leaf in iter_leaves(self.setups)
+                         for fm in iter_overlays(leaf.solution.field, args, True, leaf.solution.carry)]
+
     def find_initial_setups(self, args):
         """Initialize by finding blank-field setups specified by args."""
-        setup_func = get_setup_func(args, find_mirrors=False, setup_cache=self.cache)
+        # not mirrored: a mirrored opener is the same opener built on the other side, adding them (even synthesized
+        # with TetSolution.mirror, without sfinder) would double the setups every later stage has to search
+        setup_func = get_setup_func(args, find_mirrors=False, sf=self.sfinder)
+        # run every sfinder query of the stage up front (in parallel), so the search below only reads the cache
+        self.sfinder.prefetch(*self.stage_queries(args, initial=True))
         # Apply setup function to blank field to get initial bag 'continuations.'
         self.setups = list(map(TetSetup, setup_func(TetField(from_list=[]))))
 
     def find_continuations(self, args):
         """Apply setup function (specified by args) to each setup to find it's continuations."""
-        setup_func = get_setup_func(args, find_mirrors=True, setup_cache=self.cache)
+        # setups often end on the same field, their continuations are only found once
+        setup_func = share_continuations(get_setup_func(args, find_mirrors=True, sf=self.sfinder))
+        self.sfinder.prefetch(*self.stage_queries(args))
+        from tqdm import tqdm  # imported here, see get_TSS_continuations
         for setup in tqdm(self.setups, unit="setup"):
             setup.find_continuations(setup_func)
         # remove setups with no continuations
@@ -251,6 +470,9 @@ class Finder:
         self.pc_height = args['height']
         self.pc_cutoff = args['cutoff']
         self.pc_finish = True
+        self.sfinder.prefetch(*self.stage_queries(args))
+        from tqdm import tqdm  # imported here, see get_TSS_continuations
         self.setups = list(
-            filter(lambda setup: setup.find_PCs(self.pc_height, self.pc_cutoff, use_cache=self.cache),
-                   tqdm(self.setups, unit="setup")))
+            filter(
+                lambda setup: setup.find_PCs(self.pc_height, self.pc_cutoff, use_cache=self.cache, sf=self.sfinder),
+                tqdm(self.setups, unit="setup")))
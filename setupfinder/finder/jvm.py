@@ -0,0 +1,176 @@
+"""Choose java options for each sfinder command.
+
+Starting a JVM with a big heap and the optimizing compiler costs time that tiny setup jobs never get back, while big
+percent jobs (tall fields, long piece sequences) run out of memory with a small heap. JVMOptions estimates how much
+work a command is from its field height and piece selector and picks heap size, GC and JIT flags for that weight
+class. It can also use a class data sharing (CDS) archive of sfinder's classes to cut startup time.
+"""
+
+from math import factorial
+import re
+import threading
+from urllib.parse import unquote
+from setupfinder.finder.fumen import decode as fumen_decode
+
+# (heap, extra flags) for each weight class
+PROFILES = {
+    # short runs: serial GC has the smallest startup cost, C1 only compiles fast enough for jobs that last ~1s
+    "light": ("512m", ["-XX:+UseSerialGC", "-XX:TieredStopAtLevel=1"]),
+    "medium": ("1024m", []),
+    "heavy": ("4096m", ["-XX:+UseParallelGC"]),
+}
+CDS_ARCHIVE = "sfinder.jsa"
+
+
+def count_sequences(pieces):
+    """Estimate the number of piece sequences an sfinder piece selector (eg. "T,*p4" or "[^T]!") expands to."""
+    total = 1
+    for token in pieces.split(","):
+        token = token.strip()
+        match = re.fullmatch(r"(\*|\[\^?[TIOLJSZ]+\]|[TIOLJSZ]+)(!|p(\d))?", token)
+        if not match:
+            continue  # unknown syntax, ignore rather than fail
+        group, suffix, count = match.groups()
+        if group == "*":
+            n = 7
+        elif group.startswith("[^"):
+            n = 7 - len(group) + 3
+        elif group.startswith("["):
+            n = len(group) - 2
+        else:
+            n = 1 if suffix is None else len(group)
+        if suffix == "!":
+            k = n
+        elif count is not None:
+            k = min(int(count), n)
+        else:
+            k = 1
+        total *= factorial(n) // factorial(n - k)
+    return total
+
+
+def query_size(options):
+    """Return (height, sequences, free cells) of an sfinder query from its options.
+
+    height is from -c or the field, sequences is how many piece sequences the -p selector (or the one in the fumen
+    comment) expands to, free cells how many cells of the field aren't solid (gray)."""
+    options = list(options)
+
+    def option(name):
+        return options[options.index(name) + 1] if name in options and options.index(name) + 1 < len(options) else None
+
+    height = option("-c")
+    pieces = option("-p")
+    fm = option("-t")
+    free = None
+    if fm is not None:
+        try:
+            field, comment = fumen_decode(fm)
+        except (ValueError, NotImplementedError):
+            field, comment = None, ""
+        if field is not None:
+            free = sum(1 for row in field for b in row if b != 8)
+            if height is None:
+                height = len(field)
+        if pieces is None:
+            match = re.search(r"-p(?: |%20)(\S+?)(?:$| |%20)", comment)
+            pieces = unquote(match.group(1)) if match else None
+    height = int(height) if height is not None else 4
+    sequences = count_sequences(pieces) if pieces else 1
+    return height, sequences, free if free is not None else height * 10
+
+
+def command_weight(command, options):
+    """Classify an sfinder command as "light", "medium" or "heavy" from its options."""
+    height, sequences, _ = query_size(options)
+    if command == "percent" or command == "path":
+        # percent/path search every sequence for a PC, which grows with height
+        if height >= 6 or sequences > 5040:
+            return "heavy"
+        return "medium"
+    if command == "setup":
+        if height <= 4 and sequences <= 5040:
+            return "light"
+        return "heavy" if height >= 7 else "medium"
+    return "light"
+
+
+class JVMOptions:
+    """Build the java options used to run sfinder.jar.
+
+    By default options are adaptive (see command_weight), profiles overrides entries of PROFILES.
+    With fixed set, the same options are used for every command instead. max_heap caps the heap of any profile.
+    With cds, sfinder.jsa in working_dir is used to share sfinder's classes between runs. If it doesn't exist yet,
+    the first command creates it (needs Java 13+).
+    """
+
+    def __init__(self, working_dir=None, fixed=None, profiles=None, max_heap=None, cds=False):
+        self.working_dir = working_dir
+        self.fixed = fixed
+        self.profiles = dict(PROFILES, **(profiles or {}))
+        self.max_heap = max_heap
+        self.cds = cds
+        self._archiving = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, working_dir, jvm_args):
+        """jvm_args can be a JVMOptions, a list of fixed java options, or None for adaptive options."""
+        if jvm_args is None:
+            return cls(working_dir)
+        if isinstance(jvm_args, JVMOptions):
+            return jvm_args
+        return cls(working_dir, fixed=jvm_args)
+
+    def __getstate__(self):
+        # picklable for worker processes
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def args(self, command, options=()):
+        """Return java options (everything before -jar) for running command with options."""
+        if self.fixed is not None:
+            args = list(self.fixed)
+        else:
+            heap, flags = self.profiles[command_weight(command, options)]
+            args = [f"-Xmx{self._cap(heap)}"] + flags
+        return args + self._cds_args()
+
+    def startup_args(self):
+        """Options for a long-lived JVM that will run every kind of command (see JPypeBackend)."""
+        if self.fixed is not None:
+            return list(self.fixed) + self._cds_args()
+        heap, flags = self.profiles["heavy"]
+        return [f"-Xmx{self._cap(heap)}"] + flags + self._cds_args()
+
+    def _cap(self, heap):
+        if self.max_heap is not None and _heap_bytes(self.max_heap) < _heap_bytes(heap):
+            return self.max_heap
+        return heap
+
+    def _cds_args(self):
+        if not self.cds or self.working_dir is None:
+            return []
+        # absolute, JPype/worker JVMs run in this process' directory, not working_dir (user.dir doesn't move -XX paths)
+        archive = (self.working_dir / CDS_ARCHIVE).resolve()
+        if archive.exists():
+            return [f"-XX:SharedArchiveFile={archive}", "-Xshare:auto"]
+        with self._lock:
+            # only one command dumps the archive, others run normally until it exists
+            if self._archiving:
+                return []
+            self._archiving = True
+        return [f"-XX:ArchiveClassesAtExit={archive}"]
+
+
+def _heap_bytes(heap):
+    units = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+    heap = heap.lower()
+    if heap[-1] in units:
+        return int(heap[:-1]) * units[heap[-1]]
+    return int(heap)
@@ -0,0 +1,132 @@
+"""Split a stage's sfinder work into manifests that can run on other machines.
+
+Finder plans a stage's queries and runs them right away, so one run can only use one box. With --manifest, the run
+instead stops at the first stage with uncached queries and writes them to manifest shards (JSON Lines, one job per
+line: command and query, ie. fumen, pieces and height). Each shard is run with setup-finder-worker, which records
+every sfinder response to a results file next to it (same format as --record, see backend.RecordingBackend). The
+results are merged into the cache with --import-results, and the next run continues to the next stage.
+
+    setup-finder --manifest jobs --shards 4
+    setup-finder-worker jobs/bag-0-shard-1.jobs.jsonl   (on each box, sfinder in ./solution-finder-0.511)
+    setup-finder --manifest jobs --shards 4 --import-results jobs/*.results.jsonl
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from setupfinder.finder.backend import BACKENDS, get_backend, RecordingBackend, ReplayBackend
+from setupfinder.finder.cost import CostModel
+from setupfinder.finder.sfinder import SFinder, SFINDER_VER
+
+JOBS_SUFFIX = ".jobs.jsonl"
+RESULTS_SUFFIX = ".results.jsonl"
+# sfinder options of a query (see SFinder.options)
+QUERY_OPTIONS = {"-t": 'fumen', "-p": 'pieces', "-c": 'height'}
+
+
+def write_manifest(manifest_dir, stage, sf, command, queries, shards=1):
+    """Write the queries sf doesn't have cached to shards manifest files for stage, returns number of jobs written.
+
+    Jobs are dealt to shards longest first (see cost module), so shards take about as long as each other.
+    Old manifests for stage are removed, nothing is written if every query is cached."""
+    manifest_dir.mkdir(parents=True, exist_ok=True)
+    for old in manifest_dir.glob(f"{stage}-shard-*{JOBS_SUFFIX}"):
+        old.unlink()
+    queries = sf.pending(command, queries)
+    if not queries:
+        return 0
+    model = CostModel.load(sf.cache)
+    queries.sort(key=lambda query: model.predict(command, query), reverse=True)
+    shards = max(min(shards, len(queries)), 1)
+    for n in range(shards):
+        with open(manifest_dir / f"{stage}-shard-{n + 1}{JOBS_SUFFIX}", "w", encoding="utf-8") as f:
+            for query in queries[n::shards]:
+                f.write(json.dumps({'command': command, 'query': query}) + "\n")
+    return len(queries)
+
+
+def read_manifest(manifest_file):
+    """Return list of (command, query) jobs in a manifest file."""
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        jobs = [json.loads(line) for line in f if line.strip()]
+    return [(job['command'], job['query']) for job in jobs]
+
+
+def results_file(manifest_file):
+    """Where setup-finder-worker writes the results of a manifest file."""
+    name = manifest_file.name
+    if name.endswith(JOBS_SUFFIX):
+        name = name[:-len(JOBS_SUFFIX)]
+    return manifest_file.with_name(name + RESULTS_SUFFIX)
+
+
+def run_manifest(manifest_file, backend, output_file=None, jobs=None):
+    """Run every job in a manifest file with backend, recording the responses to output_file.
+
+    output_file defaults to results_file(manifest_file). Returns number of jobs run."""
+    output_file = output_file or results_file(manifest_file)
+    # the worker's cache is only used to run each query once, results go to output_file
+    sf = SFinder(setup_cache={}, backend=RecordingBackend(backend, output_file), jobs=jobs)
+    by_command = {}
+    for command, query in read_manifest(manifest_file):
+        by_command.setdefault(command, []).append(query)
+    for command, queries in by_command.items():
+        sf.prefetch(command, queries)
+    return sum(len(queries) for queries in by_command.values())
+
+
+def import_results(cache, result_files, mirror_keys=True):
+    """Add the sfinder responses in worker result files to cache. Returns (results imported, failed queries).
+
+    Queries whose response can't be parsed (sfinder errors) aren't cached, so they're planned again."""
+    replay = ReplayBackend()
+    for result_file in result_files:
+        replay.responses.update(ReplayBackend(result_file).responses)
+    queries = []
+    for key in replay.responses:
+        # keys are json lists of command + options (see backend module)
+        command, *options = json.loads(key)
+        pairs = zip(options[::2], options[1::2])
+        queries.append((command, {QUERY_OPTIONS[flag]: value for flag, value in pairs if flag in QUERY_OPTIONS}))
+    sf = SFinder(setup_cache=cache, backend=replay, mirror_keys=mirror_keys)
+    imported = failed = 0
+    for command, query in queries:
+        if not sf.pending(command, [query]):
+            continue
+        try:
+            # memoized, so the parsed result is added to the cache
+            getattr(sf, command)(**query)
+            imported += 1
+        except RuntimeError:
+            failed += 1
+    return imported, failed
+
+
+def main():
+    """Entry point for setup-finder-worker."""
+    parser = argparse.ArgumentParser(description="Run setup-finder manifest shards (see --manifest).")
+    parser.add_argument("manifests", nargs="+", help="manifest files to run")
+    parser.add_argument(
+        "--sfinder", dest="sfinder_dir", help="solution-finder directory", default=str(Path.cwd() / SFINDER_VER))
+    parser.add_argument(
+        "--backend", dest="backend", choices=BACKENDS, help="how to run sfinder (see setup-finder --backend)",
+        default="subprocess")
+    parser.add_argument(
+        "--workers", dest="workers", type=int, help="number of worker processes for --backend worker", default=None)
+    parser.add_argument(
+        "-j", "--jobs", dest="jobs", type=int, help="number of sfinder commands to run at the same time (default: " +
+        "number of CPUs)", default=None)
+    args = parser.parse_args(sys.argv[1:])
+    backend = get_backend(args.backend, Path(args.sfinder_dir), workers=args.workers)
+    try:
+        for manifest_file in map(Path, args.manifests):
+            count = run_manifest(manifest_file, backend, jobs=args.jobs)
+            print(f"Ran {count} jobs from {manifest_file}, results saved to {results_file(manifest_file)}.")
+    finally:
+        if hasattr(backend, "close"):
+            backend.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Canonical cache keys for sfinder queries.
+
+Keying the cache on the raw fumen string misses equivalent queries: the same field can be encoded with a different
+comment, "?" line breaks, or different colors for blocks that are just solid to sfinder. Keys are instead built from
+the decoded field, with cells reduced to what they mean to the command, and only the option tokens of the comment.
+
+A field and its mirror image (with L/J and S/Z swapped in the pieces) have mirrored results, so both are keyed by
+whichever of the two keys sorts first. A result is always stored in the orientation of its key, and flipped back
+when it's read for the other orientation (see mirror_result).
+
+Canonical keys look like "setup:<field>:<options>:<pieces>", they never contain a fumen (fumens can't contain ":").
+"""
+
+import re
+from urllib.parse import unquote
+from setupfinder.finder import fumen
+
+MIRROR_PIECES = str.maketrans("LJSZ", "JLZS")
+MIRROR_COLORS = {2: 6, 6: 2, 4: 7, 7: 4}  # fumen colors: L <-> J, S <-> Z
+PIECE_COLORS = {"i": 1, "l": 2, "o": 3, "z": 4, "t": 5, "j": 6, "s": 7, "gray": 8}
+COMMANDS = ["setup", "path", "percent"]
+# legacy keys are command + fumen (+ pieces from TetSolution.get_remaining_pieces)
+LEGACY_PIECES = re.compile(r"((?:[LJSZIOT],)*\*p7)$")
+
+
+def parse_options(comment):
+    """Return (flag, value) pairs of sfinder options in a fumen comment, ignoring any other text."""
+    tokens = comment.split()
+    options = []
+    for i, token in enumerate(tokens):
+        if token.startswith("-"):
+            value = tokens[i + 1] if i + 1 < len(tokens) and not tokens[i + 1].startswith("-") else ""
+            options.append((token, value))
+    return options
+
+
+def _cells(command, field, options):
+    """Field rows (bottom up) as strings of what each cell means: blank, solid, fill or margin."""
+    roles = {}
+    if command == "setup":
+        # only setup gives colors a meaning (-f fill and -m margin), everything else is solid
+        for flag, role in (("-m", "."), ("-f", "*")):
+            for option, value in options:
+                if option == flag and value.lower() in PIECE_COLORS:
+                    roles[PIECE_COLORS[value.lower()]] = role
+    return ["".join("_" if b == 0 else roles.get(b, "X") for b in row) for row in field]
+
+
+def _key(command, rows, options, pieces):
+    return ":".join([command, "/".join(rows), " ".join(f"{flag} {value}".strip() for flag, value in options), pieces])
+
+
+def cache_key(command, fm, pieces=None, mirrors=True):
+    """Return (key, mirrored) for an sfinder query, mirrored is True if key is for the query's mirror image.
+
+    Falls back to the raw command + fumen + pieces key (not mirrored) if fm can't be decoded."""
+    try:
+        field, comment = fumen.decode(fm)
+    except (ValueError, NotImplementedError, IndexError):
+        return command + fm + (pieces or ""), False
+    comment = unquote(comment)  # fumen.encode escapes comments
+    # -m/-f are replaced by cell roles
+    options = [(flag, value) for flag, value in parse_options(comment) if flag not in ("-m", "-f")]
+    rows = _cells(command, field, parse_options(comment))
+    key = _key(command, rows, options, pieces or "")
+    if not mirrors:
+        return key, False
+    mirror_options = [(flag, value.translate(MIRROR_PIECES)) for flag, value in options]
+    mirror_key = _key(command, [row[::-1] for row in rows], mirror_options, (pieces or "").translate(MIRROR_PIECES))
+    if mirror_key < key:
+        return mirror_key, True
+    return key, False
+
+
+def mirror_fumen(fm):
+    """Mirror a (single frame) fumen left to right, swapping L/J and S/Z colors and pieces in the comment."""
+    field, comment = fumen.decode(fm)
+    mirrored = [[MIRROR_COLORS.get(b, b) for b in reversed(row)] for row in field]
+    return fumen.encode([(mirrored, unquote(comment).translate(MIRROR_PIECES))])
+
+
+def mirror_result(result):
+    """Mirror an sfinder result: a list of TetSolutions (setup, path), None, or a percentage (unchanged).
+
+    Raises ValueError or NotImplementedError if a solution's fumen can't be decoded."""
+    if isinstance(result, list):
+        return [solution.mirror() for solution in result]
+    return result
+
+
+def rekey_cache(cache, mirrors=True):
+    """Move entries with legacy raw fumen keys to their canonical keys (in place). Returns number of keys changed."""
+    changed = 0
+    for old_key in [k for k in cache if ":" not in k and not k.startswith("__")]:
+        command = next((c for c in COMMANDS if old_key.startswith(c + "v115@")), None)
+        if command is None:
+            continue
+        rest = old_key[len(command):]
+        pieces = None
+        match = LEGACY_PIECES.search(rest)
+        if match and command != "setup":
+            pieces = match.group(1)
+            rest = rest[:match.start()]
+        key, mirrored = cache_key(command, rest, pieces, mirrors)
+        if key == old_key:
+            continue  # couldn't decode
+        value = cache.pop(old_key)
+        try:
+            cache.setdefault(key, mirror_result(value) if mirrored else value)
+        except (ValueError, NotImplementedError, IndexError):
+            cache[old_key] = value  # result fumens can't be mirrored, keep the old entry
+            continue
+        changed += 1
+    return changed
@@ -0,0 +1,137 @@
+"""Instrumentation for measuring where time goes during a run.
+
+A single module-level PROFILER records counters (sfinder calls by command, cache hits/misses, deepcopies), timers
+(time spent waiting on the JVM) and per-stage wall times. It's disabled by default, in which case every call is a
+cheap no-op, and is enabled with --profile.
+"""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import copy
+import json
+import sys
+import threading
+import time
+
+try:
+    import resource  # not available on windows
+except ImportError:
+    resource = None
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = defaultdict(int)
+        self.timers = defaultdict(float)
+        self.stages = []
+        self._start = time.perf_counter()
+
+    def count(self, name, n=1):
+        """Increment counter name by n."""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    @contextmanager
+    def timer(self, name):
+        """Add time spent inside the with block to timer name."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timers[name] += elapsed
+
+    @contextmanager
+    def stage(self, name):
+        """Record wall time and counter/timer changes for a stage of the run (eg. a bag)."""
+        if not self.enabled:
+            yield
+            return
+        counters = dict(self.counters)
+        timers = dict(self.timers)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'name': name,
+                'wall_time': time.perf_counter() - start,
+                'counters': {k: v - counters.get(k, 0) for k, v in self.counters.items() if v != counters.get(k, 0)},
+                'timers': {k: v - timers.get(k, 0.0) for k, v in self.timers.items() if v != timers.get(k, 0.0)}
+            })
+
+    def deepcopy(self, obj):
+        """copy.deepcopy, counted."""
+        self.count("deepcopy")
+        return copy.deepcopy(obj)
+
+    def summary(self):
+        """Return all measurements as a dict (JSON serializable)."""
+        total_time = time.perf_counter() - self._start
+        cache = {}
+        for command in ("setup", "path", "percent"):
+            hits = self.counters.get("cache_hit:" + command, 0)
+            misses = self.counters.get("cache_miss:" + command, 0)
+            if hits + misses:
+                cache[command] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+        return {
+            'total_time': total_time,
+            # JVM time is summed over sfinder calls, calls running at the same time can make this exceed total time
+            'jvm_time': self.timers.get("jvm", 0.0),
+            'python_time': max(total_time - self.timers.get("jvm", 0.0), 0.0),
+            'sfinder_calls': {k.split(":", 1)[1]: v for k, v in self.counters.items() if k.startswith("sfinder:")},
+            'cache': cache,
+            'deepcopies': self.counters.get("deepcopy", 0),
+            'peak_memory_mb': _peak_memory_mb(),
+            'counters': dict(self.counters),
+            'timers': dict(self.timers),
+            'stages': self.stages
+        }
+
+    def report(self):
+        """Human readable summary."""
+        summary = self.summary()
+        lines = [
+            f"Total time: {summary['total_time']:.2f}sec (JVM: {summary['jvm_time']:.2f}sec, "
+            f"Python: {summary['python_time']:.2f}sec)"
+        ]
+        for stage in summary['stages']:
+            calls = ", ".join(f"{k.split(':', 1)[1]}: {v}" for k, v in stage['counters'].items()
+                              if k.startswith("sfinder:"))
+            lines.append(f"  {stage['name']}: {stage['wall_time']:.2f}sec" + (f" (sfinder {calls})" if calls else ""))
+        calls = ", ".join(f"{k}: {v}" for k, v in summary['sfinder_calls'].items()) or "none"
+        lines.append(f"Sfinder calls: {calls}")
+        for command, stats in summary['cache'].items():
+            lines.append(f"Cache {command}: {stats['hits']} hits, {stats['misses']} misses "
+                         f"({stats['hit_rate']:.1%} hit rate)")
+        if summary['counters'].get("continuation_reuse"):
+            lines.append(f"Continuations reused: {summary['counters']['continuation_reuse']}")
+        lines.append(f"Deepcopies: {summary['deepcopies']}")
+        if summary['peak_memory_mb'] is not None:
+            lines.append(f"Peak memory: {summary['peak_memory_mb']:.1f}MB")
+        return "\n".join(lines)
+
+    def save(self, profile_file):
+        with open(profile_file, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def _peak_memory_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kB, mac reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+PROFILER = Profiler()
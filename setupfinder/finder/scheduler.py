@@ -0,0 +1,65 @@
+"""Run many sfinder queries at the same time on an asyncio event loop.
+
+The finder itself calls sfinder one query at a time. Before each stage, the queries it's going to make are planned
+(see finder.iter_overlays) and run here so the stage only reads the cache. A producer feeds queries through a bounded
+queue (so planning never gets far ahead of sfinder) to a fixed number of worker tasks. Each worker waits for its JVM
+without blocking the loop (SubprocessBackend.run_async uses asyncio.create_subprocess_exec), so parsing results and
+cache writes for finished queries happen while other JVMs are still running, without a pool of Python processes.
+Queries are started longest first, as predicted by the cost module's CostModel, which learns from their run times.
+"""
+
+import asyncio
+import time
+from tqdm import tqdm
+from setupfinder.finder.cost import CostModel
+
+
+class Scheduler:
+    def __init__(self, sf, jobs):
+        """sf is the SFinder to run queries with (its cache receives the results), jobs how many run at once."""
+        self.sf = sf
+        self.jobs = max(jobs, 1)
+
+    def run(self, command, queries):
+        """Run queries (kwargs dicts for command, see SFinder.pending), adding the results to the cache."""
+        if not queries:
+            return
+        model = CostModel.load(self.sf.cache)
+        # longest first, so the stage doesn't end waiting on one slow query
+        queries.sort(key=lambda query: model.predict(command, query), reverse=True)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._run(command, queries, model))
+        finally:
+            loop.close()
+            model.save(self.sf.cache)
+
+    async def _run(self, command, queries, model):
+        queue = asyncio.Queue(maxsize=self.jobs * 2)
+        with tqdm(total=len(queries), unit=command, leave=False) as progress:
+            workers = [asyncio.ensure_future(self._worker(command, queue, progress, model)) for _ in range(self.jobs)]
+            producer = asyncio.ensure_future(self._produce(queries, queue, len(workers)))
+            try:
+                await asyncio.gather(producer, *workers)
+            except BaseException:
+                for task in workers + [producer]:
+                    task.cancel()
+                raise
+
+    @staticmethod
+    async def _produce(queries, queue, workers):
+        for query in queries:
+            # waits while the queue is full
+            await queue.put(query)
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def _worker(self, command, queue, progress, model):
+        while True:
+            query = await queue.get()
+            if query is None:
+                return
+            start = time.perf_counter()
+            await self.sf.fetch(command, query)
+            model.observe(command, query, time.perf_counter() - start)
+            progress.update()
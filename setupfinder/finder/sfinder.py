@@ -1,37 +1,32 @@
 """Sfinder module, a wrapper for working with knewjade's solution-finder program."""
 
 import os, re, subprocess
-from lxml import html, etree
 from setupfinder.finder.tet import TetSolution, TetField
-from setupfinder.finder import cache
+from setupfinder.finder.backend import SubprocessBackend, run_async
+from setupfinder.finder.jvm import JVMOptions
 from setupfinder.finder.fumen import decode as fumen_decode
+from setupfinder.finder import normalize
 import base64  #for image generation
-from copy import deepcopy
+from setupfinder.finder.profiler import PROFILER
 from pathlib import Path
 
 #solution finder version, used for finding default sfinder folder
 SFINDER_VER = "solution-finder-0.511"
+# result file read back for each command
+OUTPUT_FILES = {"setup": "setup.html", "path": "path_minimal.html", "percent": None}
+# marks a cache miss, None is a valid cached result
+_MISSING = object()
 
 
 def memoize(func):
     def wrapper(self, *args, **kwargs):
-        """ if func.__name__ == "percent":
-            print(f"Cache: {str(self.cache)[:30]}")
-            key = func.__name__ + kwargs['fumen']
-            print(f"Key: {key}")
-            print(f"Result: {self.cache[key]}") """
         if self.cache is not None and 'fumen' in kwargs:
-            key = func.__name__ + kwargs['fumen']
-            if 'pieces' in kwargs:
-                key += kwargs['pieces']
-            if key in self.cache:
-                # return a copy so cache isn't mutated
-                return deepcopy(self.cache[key])
-            else:
-                # store result in cache
-                result = func(self, *args, **kwargs)
-                self.cache[key] = result
-                return deepcopy(result)
+            key, mirrored, cached = self._cache_lookup(func.__name__, kwargs)
+            if cached is not _MISSING:
+                return cached
+            result = func(self, *args, **kwargs)
+            self._cache_store(key, mirrored, result)
+            return PROFILER.deepcopy(result)
         else:
             # no cache or no fumen argument passed
             return func(self, *args, **kwargs)
@@ -40,14 +35,27 @@ def memoize(func):
 
 
 class SFinder:
-    def __init__(self, setup_cache=None, working_dir=None):
+    def __init__(self,
+                 setup_cache=None,
+                 working_dir=None,
+                 backend=None,
+                 jvm_args=None,
+                 mirror_keys=True,
+                 jobs=None):
+        """backend runs the actual sfinder commands (see backend module), defaults to running java for each one.
+
+        jvm_args is a JVMOptions or list of java options (see jvm module), default is adaptive per command.
+        With mirror_keys, a query and its mirror image share a cache entry (see normalize module).
+        jobs is how many sfinder commands prefetch runs at the same time (default: number of CPUs)."""
         if working_dir is not None:
             self.working_dir = working_dir
         else:
             self.working_dir = Path.cwd() / SFINDER_VER
-        if not (self.working_dir / "sfinder.jar").exists():
-            raise FileNotFoundError(f"Cannot find sfinder.jar. Sfinder should be installed in: {self.working_dir}")
+        self.jvm_options = JVMOptions.from_args(self.working_dir, jvm_args)
+        self.backend = backend if backend is not None else SubprocessBackend(self.working_dir, self.jvm_options)
         self.cache = setup_cache
+        self.mirror_keys = mirror_keys
+        self.jobs = jobs or os.cpu_count()
 
     @memoize
     def setup(self, fumen=None, pieces=None, input_diagram=None, print_results=False):
@@ -55,127 +63,194 @@ class SFinder:
         
         Returns a list of TetSolutions.
         """
-        # old cache
-        if fumen is not None:
-            cached_result = cache.get_solutions(fumen)
-            if cached_result is not None:
-                return cached_result
-        args = ["java", "-Xmx1024m", "-jar", "sfinder.jar", "setup"]
-        if fumen:
-            args.extend(["-t", fumen])
-        if pieces:
-            args.extend(["-p", pieces])
         if input_diagram:
             self.setInputTxt(input_diagram)
-        try:
-            output = subprocess.check_output(
-                args, cwd=self.working_dir, stderr=subprocess.STDOUT, universal_newlines=True)
-            match = re.search(r"Found solution = (\d+)\D+time = (\d+)", output)
-            if match:
-                if print_results:
-                    print("Setup found %s solutions, took %s ms\n" % match.group(1, 2))
-                #parse setup.html for solutions
-                with open(self.working_dir / "output/setup.html", "r") as f:
-                    setupHtml = f.read()
-                tree = html.fromstring(setupHtml)
-                sections = tree.xpath("//section")
-                solutions = []
-                for section in sections:
-                    for child in section:
-                        if child.tag == "p":
-                            etree.strip_tags(child[0], "br")
-                            field_str = child[0].text
-                        if child.tag == "div":
-                            solutions.append(
-                                TetSolution(
-                                    TetField(from_string=field_str),
-                                    child[0].attrib["href"].split("fumen.zui.jp/?")[1],
-                                    child[0].text))
-                return solutions
-            else:
-                #only happens if it doesnt report 0 solutions - so never? maybe should raise exception
-                print("Error: Setup didn't find any solutions\n\n" + output)
-                return None
-        except subprocess.CalledProcessError as e:
-            if "Should specify equal to or more than" in e.output:
-                # not enough pieces to even try finding setups, return None
-                #use_cache[fumen] = None
-                return None
-            else:
-                raise RuntimeError("Sfinder Error: %s" % re.search(r"Message: (.+)\n", e.output).group(1))
+        return self._parse("setup", *self._call("setup", fumen=fumen, pieces=pieces), print_results=print_results)
 
     @memoize
     def path(self, fumen=None, pieces=None, height=None):
         """Run sfinder path command, returns a list of solution fumens.
         
         Note: Doesn't parse sequences possible for each fumen, could add this later. (Might want to change to parsing csv for that?)"""
-        if fumen is not None and pieces is not None:
-            key = "p" + pieces + fumen
-            cached_result = cache.get_solutions(key)
-            if cached_result is not None:
-                return cached_result
-        args = ["java", "-Xmx1024m", "-jar", "sfinder.jar", "path"]
-        if fumen:
-            args.extend(["-t", fumen])
-        if pieces:
-            args.extend(["-p", pieces])
-        if height:
-            args.extend(["-c", height])
-        try:
-            output = subprocess.check_output(
-                args, cwd=self.working_dir, stderr=subprocess.STDOUT, universal_newlines=True)
-            match = re.search(r"Found path \[minimal\] = (\d+)", output)
-            if match:
-                # maybe should have an option for which path result it uses? but going with minimal for now
-                with open(self.working_dir / "output/path_minimal.html", "r", encoding="utf-8") as f:
-                    setupHtml = f.read()
-                tree = html.fromstring(setupHtml)
-                divs = tree.xpath("//section//div")
-                solutions = []
-                for div in divs:
-                    fumen_str = div[0].attrib["href"].split("fumen.zui.jp/?")[1]
-                    field, seq = fumen_decode(fumen_str)
-                    # actually kind of silly saving field at all considering it's just cleared lines, but whatever
-                    solutions.append(TetSolution(TetField(from_list=field), fumen_str, seq))
-                return solutions
-            else:
-                #only happens if it doesnt report 0 solutions - so never? maybe should raise exception
-                print("Error: Path didn't find any solutions\n\n" + output)
-                return None
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError("Sfinder Error: %s" % re.search(r"Message: (.+)\n", e.output).group(1))
+        return self._parse("path", *self._call("path", fumen=fumen, pieces=pieces, height=height))
 
     @memoize
     def percent(self, fumen=None, pieces=None, height=None):
         """Run sfinder percent command, return overall success rate (just the number)"""
-        if fumen is not None and pieces is not None:
-            # "r" for rate, I'll use "p" if I implement path later on
-            key = "r" + pieces + fumen
-            cached_result = cache.get_PC_rate(key)
-            if cached_result is not None:
-                return cached_result
-        args = ["java", "-Xmx1024m", "-jar", "sfinder.jar", "percent"]
+        return self._parse("percent", *self._call("percent", fumen=fumen, pieces=pieces, height=height))
+
+    @staticmethod
+    def options(fumen=None, pieces=None, height=None):
+        """Command line options for a query."""
+        args = []
         if fumen:
             args.extend(["-t", fumen])
         if pieces:
             args.extend(["-p", pieces])
         if height:
             args.extend(["-c", height])
+        return args
+
+    def _call(self, command, **query):
+        """Run a query with the backend, returns (console output, contents of result file, CalledProcessError)."""
         try:
-            output = subprocess.check_output(
-                args, cwd=self.working_dir, stderr=subprocess.STDOUT, universal_newlines=True)
-            match = re.search(r"success = (\d+\.\d+)%", output)
-            if match:
-                pc_rate = match.group(1)
-                return pc_rate
+            output, contents = self._run(command, self.options(**query), output_file=OUTPUT_FILES[command])
+            return output, contents, None
+        except subprocess.CalledProcessError as e:
+            return e.output, None, e
+
+    def _parse(self, command, output, contents, error, print_results=False):
+        """Turn sfinder's response to a command into a result."""
+        return getattr(self, "_parse_" + command)(output, contents, error, print_results)
+
+    def _parse_setup(self, output, setupHtml, error, print_results):
+        if error is not None:
+            if "Should specify equal to or more than" in output:
+                # not enough pieces to even try finding setups, return None
+                #use_cache[fumen] = None
+                return None
             else:
-                raise RuntimeError("Couldn't find percentage in sfinder output.\n\n" + output)
+                raise RuntimeError("Sfinder Error: %s" % re.search(r"Message: (.+)\n", output).group(1))
+        match = re.search(r"Found solution = (\d+)\D+time = (\d+)", output)
+        if match:
+            if print_results:
+                print("Setup found %s solutions, took %s ms\n" % match.group(1, 2))
+            if setupHtml is None:
+                return []
+            # imported here, runs that only read the cache don't need lxml
+            from lxml import html, etree
+            #parse setup.html for solutions
+            tree = html.fromstring(setupHtml)
+            sections = tree.xpath("//section")
+            solutions = []
+            for section in sections:
+                for child in section:
+                    if child.tag == "p":
+                        etree.strip_tags(child[0], "br")
+                        field_str = child[0].text
+                    if child.tag == "div":
+                        solutions.append(
+                            TetSolution(
+                                TetField(from_string=field_str),
+                                child[0].attrib["href"].split("fumen.zui.jp/?")[1],
+                                child[0].text))
+            return solutions
+        else:
+            #only happens if it doesnt report 0 solutions - so never? maybe should raise exception
+            print("Error: Setup didn't find any solutions\n\n" + output)
+            return None
+
+    def _parse_path(self, output, setupHtml, error, print_results):
+        if error is not None:
+            raise RuntimeError("Sfinder Error: %s" % re.search(r"Message: (.+)\n", output).group(1))
+        # maybe should have an option for which path result it uses? but going with minimal for now
+        match = re.search(r"Found path \[minimal\] = (\d+)", output)
+        if match:
+            if setupHtml is None:
+                return []
+            from lxml import html
+            tree = html.fromstring(setupHtml)
+            divs = tree.xpath("//section//div")
+            solutions = []
+            for div in divs:
+                fumen_str = div[0].attrib["href"].split("fumen.zui.jp/?")[1]
+                field, seq = fumen_decode(fumen_str)
+                # actually kind of silly saving field at all considering it's just cleared lines, but whatever
+                solutions.append(TetSolution(TetField(from_list=field), fumen_str, seq))
+            return solutions
+        else:
+            #only happens if it doesnt report 0 solutions - so never? maybe should raise exception
+            print("Error: Path didn't find any solutions\n\n" + output)
+            return None
+
+    def _parse_percent(self, output, contents, error, print_results):
+        if error is not None:
+            raise RuntimeError("Sfinder Error: %s" % re.search(r"Message: (.+)\n", output).group(1))
+        match = re.search(r"success = (\d+\.\d+)%", output)
+        if match:
+            pc_rate = match.group(1)
+            return pc_rate
+        else:
+            raise RuntimeError("Couldn't find percentage in sfinder output.\n\n" + output)
+
+    def cache_key(self, command, query):
+        """Return (key, mirrored) for a query, equivalent queries (and mirror images) share a key (see normalize)."""
+        return normalize.cache_key(command, query['fumen'], query.get('pieces'), mirrors=self.mirror_keys)
+
+    def pending(self, command, queries):
+        """Queries that need sfinder, skipping cached ones and duplicates (including mirror images)."""
+        pending = {}
+        for query in queries:
+            key, _ = self.cache_key(command, query)
+            if key not in pending and key not in self.cache:
+                pending[key] = query
+        return list(pending.values())
+
+    def _cache_lookup(self, command, query):
+        """Return (key, mirrored, result) for a query, result is _MISSING if it isn't cached."""
+        key, mirrored = self.cache_key(command, query)
+        # single lookup, the cache may be remote (see cache_server module)
+        cached = self.cache.get(key, _MISSING)
+        if cached is _MISSING:
+            PROFILER.count("cache_miss:" + command)
+            return key, mirrored, _MISSING
+        PROFILER.count("cache_hit:" + command)
+        # return a copy so cache isn't mutated (mirroring makes a new copy)
+        return key, mirrored, normalize.mirror_result(cached) if mirrored else PROFILER.deepcopy(cached)
+
+    def _cache_store(self, key, mirrored, result):
+        """Store result in cache, in the orientation of the key."""
+        try:
+            self.cache[key] = normalize.mirror_result(result) if mirrored else result
+        except (ValueError, NotImplementedError):
+            pass  # result can't be mirrored, so it isn't cached
+
+    def prefetch(self, command, queries, jobs=None):
+        """Run many sfinder commands at the same time so their results are cached.
+
+        command is "setup", "path" or "percent", queries is a list of kwargs dicts for that command.
+        Queries already in the cache are skipped, results can then be read back from the cache with normal calls.
+        See scheduler module, jobs defaults to self.jobs.
+        """
+        if self.cache is None:
+            raise ValueError("Prefetching sfinder results requires a cache.")
+        queries = self.pending(command, queries)
+        if not queries:
+            return
+        # imported here, scheduler imports this module (and runs that only read the cache don't need asyncio)
+        from setupfinder.finder.scheduler import Scheduler
+        Scheduler(self, jobs or self.jobs).run(command, queries)
+
+    async def fetch(self, command, query):
+        """Async version of a memoized command call, for the scheduler. Runs sfinder without blocking the loop."""
+        key, mirrored, cached = self._cache_lookup(command, query)
+        if cached is not _MISSING:
+            return cached
+        PROFILER.count("sfinder:" + command)
+        try:
+            with PROFILER.timer("jvm"):
+                output, contents = await run_async(self.backend, command, self.options(**query),
+                                                   OUTPUT_FILES[command])
+            error = None
         except subprocess.CalledProcessError as e:
-            raise RuntimeError("Sfinder Error: %s" % re.search(r"Message: (.+)\n", e.output).group(1))
+            output, contents, error = e.output, None, e
+        result = self._parse(command, output, contents, error)
+        self._cache_store(key, mirrored, result)
+        return result
+
+    def _run(self, command, options, output_file=None):
+        """Run an sfinder command with the backend.
+
+        Returns tuple of (console output, contents of output_file or None).
+        Raises subprocess.CalledProcessError if sfinder fails.
+        """
+        PROFILER.count("sfinder:" + command)
+        with PROFILER.timer("jvm"):
+            return self.backend.run(command, options, output_file)
 
     def fig_png(self, fumen, height):
         """Generate an image for a fumen using 'util fig' and return base64 encode data_url."""
-        args = ["java", "-jar", "sfinder.jar", "util", "fig"]
+        args = ["java"] + self.jvm_options.args("util", ["-t", fumen]) + ["-jar", "sfinder.jar", "util", "fig"]
         args.extend(["-t", fumen])
         # output to png, no hold/next, end after 1st frame (to only make 1 image)
         args.extend(["-F", "png", "-f", "no", "-e", "1"])
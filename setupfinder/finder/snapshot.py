@@ -0,0 +1,96 @@
+"""Save and load snapshots of the setup tree after each bag, so runs can reuse bags that were already found.
+
+Snapshots are stored under a hash of the input lines up to their bag, the sfinder version and whether mirror images
+share cache entries (see stage_key), so any input starting with the same bags (eg. only the last bag's rows changed) loads them instead of walking those bags again, and interrupted
+runs continue after the last bag saved. The PC cutoff isn't part of the key: a PC bag found with a lower cutoff is
+filtered down to the new one (see TetSetup.filter_PCs).
+
+Setups are packed into nested tuples (fumen, sequence, carried piece, field rows as bitmasks, cleared rows, PC rate,
+continuations) before pickling, which is much smaller and faster to load than pickling the TetSetup objects themselves.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import pickle
+from setupfinder.finder.sfinder import SFINDER_VER
+from setupfinder.finder.tet import TetSetup, TetSolution, TetField
+
+SNAPSHOT_VERSION = 3
+
+
+def pack_setup(setup):
+    """Pack a TetSetup (and its continuations) into nested tuples."""
+    solution = setup.solution
+    rows = tuple(sum(b << x for x, b in enumerate(row)) for row in solution.field.field)
+    return (solution.fumen, solution.sequence, solution.carry, rows, solution.field.clearedRows, setup.PC_rate,
+            tuple(pack_setup(cont) for cont in setup.continuations))
+
+
+def unpack_setup(data):
+    """Rebuild a TetSetup from pack_setup output."""
+    fumen, sequence, carry, rows, cleared_rows, pc_rate, continuations = data
+    field = TetField(from_list=[[(row >> x) & 1 for x in range(10)] for row in rows])
+    field.clearedRows = cleared_rows
+    solution = TetSolution(field, fumen, sequence)
+    solution.carry = carry
+    setup = TetSetup(solution)
+    setup.PC_rate = pc_rate
+    setup.continuations = [unpack_setup(cont) for cont in continuations]
+    return setup
+
+
+def stage_key(bags, stage, mirror_keys=True):
+    """Hash of input lines bags[:stage + 1] (ignoring extra spaces and cutoff arguments), SFINDER_VER and mirror_keys.
+
+    Setups found with another sfinder version or with --no-mirror-cache aren't reused."""
+    lines = [" ".join(arg for arg in bag.split() if not arg.startswith("cutoff-")) for bag in bags[:stage + 1]]
+    return hashlib.sha1(json.dumps([SNAPSHOT_VERSION, SFINDER_VER, mirror_keys] + lines).encode()).hexdigest()[:20]
+
+
+def get_snapshot_file(snapshot_dir, bags, stage, mirror_keys=True):
+    return snapshot_dir / f"{stage_key(bags, stage, mirror_keys)}.bin"
+
+
+def save_snapshot(snapshot_dir, bags, stage, state, mirror_keys=True):
+    """Save finder state after bag number stage has been found.
+
+    bags is the list of input lines, the snapshot is stored under stage_key(bags, stage, mirror_keys).
+    state is a dict from Finder.get_state. File is replaced atomically so an interrupted save can't corrupt it.
+    """
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    data = dict(state, setups=[pack_setup(setup) for setup in state['setups']])
+    key = stage_key(bags, stage, mirror_keys)
+    snapshot = {'version': SNAPSHOT_VERSION, 'key': key, 'bags': bags[:stage + 1], 'stage': stage, 'state': data}
+    snapshot_file = get_snapshot_file(snapshot_dir, bags, stage, mirror_keys)
+    tmp_file = snapshot_file.with_suffix(".tmp")
+    with gzip.open(tmp_file, "wb", compresslevel=1) as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_file, snapshot_file)
+
+
+def load_latest_snapshot(snapshot_dir, bags, pc_cutoff=None, mirror_keys=True):
+    """Find the snapshot of the latest bag in bags that has been found before.
+
+    pc_cutoff is the cutoff of the PC bag in bags, a snapshot of the PC bag is only used if it was found with the
+    same or a lower cutoff (and is then filtered to pc_cutoff). mirror_keys is the Finder's (see stage_key).
+    Returns tuple of (stage, state) where stage is the last bag already found, or None if there is no usable snapshot.
+    """
+    for stage in reversed(range(len(bags))):
+        snapshot_file = get_snapshot_file(snapshot_dir, bags, stage, mirror_keys)
+        if not snapshot_file.exists():
+            continue
+        with gzip.open(snapshot_file, "rb") as f:
+            snapshot = pickle.load(f)
+        if snapshot['version'] != SNAPSHOT_VERSION or snapshot['key'] != stage_key(bags, stage, mirror_keys):
+            continue
+        state = snapshot['state']
+        if state['pc_finish'] and (pc_cutoff is None or state['pc_cutoff'] > pc_cutoff):
+            continue  # PCs below the old cutoff weren't kept, find them again
+        state['setups'] = [unpack_setup(data) for data in state['setups']]
+        if state['pc_finish'] and state['pc_cutoff'] < pc_cutoff:
+            state['setups'] = [setup for setup in state['setups'] if setup.filter_PCs(pc_cutoff)]
+            state['pc_cutoff'] = pc_cutoff
+        return stage, state
+    return None
@@ -8,8 +8,7 @@ From simple->complex:
 * TetSetup - TetSolution + continuations (either further TetSetup bags/steps or PCs)
 """
 
-from setupfinder.finder import sfinder, fumen
-from tqdm import tqdm
+from setupfinder.finder import fumen, normalize
 
 
 class TetField:
@@ -67,6 +66,14 @@ class TetField:
             self.field[y - 1][x] = 1
         self.clear_rows()
 
+    def mirror(self):
+        """Return a copy of the field flipped left to right."""
+        mirrored = TetField()
+        mirrored.field = [row[::-1] for row in self.field]
+        mirrored.height = self.height
+        mirrored.clearedRows = self.clearedRows
+        return mirrored
+
     def clear_rows(self):
         self.field = [row for row in self.field if row != ([1] * 10)]
         newHeight = len(self.field)
@@ -112,6 +119,10 @@ class TetOverlay:
 class TetSolution:
     """Wrapper for sfinder solutions. Setups with multiple fumens are split into multiple TetSolutions for simplicity."""
 
+    # piece left over for the next bag (set by the is_TS* filters when the bag allows carrying one)
+    # class attribute so solutions pickled before carry existed still have it
+    carry = ""
+
     def __init__(self, field, fumen, sequence):
         self.field = field
         self.fumen = fumen
@@ -125,11 +136,22 @@ class TetSolution:
     def get_remaining_pieces(self):
         """Takes a piece sequence and returns an sfinder piece selector containing the missing pieces + *p7"""
         nextPieces = "*p7"
-        remaining = ','.join([p for p in "LJSZIOT" if p not in self.sequence])
+        if self.carry:
+            # the sequence may include a piece carried from the bag before, the carried piece is what's left
+            remaining = ','.join(self.carry)
+        else:
+            remaining = ','.join([p for p in "LJSZIOT" if p not in self.sequence])
         if remaining:
             nextPieces = remaining + "," + nextPieces
         return nextPieces
 
+    def mirror(self):
+        """Return the mirror image of this solution (L/J and S/Z swapped)."""
+        mirrored = TetSolution(self.field.mirror(), normalize.mirror_fumen(self.fumen),
+                               self.sequence.translate(normalize.MIRROR_PIECES))
+        mirrored.carry = self.carry.translate(normalize.MIRROR_PIECES)
+        return mirrored
+
     def tostring(self):
         ret = self.field.tostring()
         ret += "\n\nFumen: %s\n" % self.fumen
@@ -169,23 +191,27 @@ class TetSetup:
     def find_continuations(self, setup_func):
         """Recursively find and add continuations with function passed as setup_func."""
         if len(self.continuations) > 0:
+            # imported here, importing the command line shouldn't load it (see bench_import)
+            from tqdm import tqdm
             for cont in tqdm(self.continuations, unit="continuation", leave=False):
                 cont.find_continuations(setup_func)
             # remove setups with no continuations
             self.continuations = [setup for setup in self.continuations if len(setup.continuations) > 0]
         else:
-            new_conts = setup_func(self.solution.field)
+            new_conts = setup_func(self.solution.field, self.solution.carry)
             self.add_continuations(new_conts)
 
-    def find_PCs(self, height, cutoff, use_cache):
+    def find_PCs(self, height, cutoff, use_cache, sf=None):
         """Find PCs for all continuations, then figure out overall PC rate.
         
         Returns true if overall PC rate is >= cutoff, for filtering.
+        sf is the SFinder to use, if not given one is created using use_cache.
         """
         if len(self.continuations) > 0:
+            from tqdm import tqdm  # imported here, see find_continuations
             # find PCs for all continuations, filter out continuations without PCs
             self.continuations = list(
-                filter(lambda cont: cont.find_PCs(height, cutoff, use_cache),
+                filter(lambda cont: cont.find_PCs(height, cutoff, use_cache, sf),
                        tqdm(self.continuations, unit="PC", leave=False)))
             if len(self.continuations) == 0:
                 # no PCs found
@@ -203,12 +229,25 @@ class TetSetup:
                 self.PC_rate = 0.00
             else:
                 #with sfinder.SFinder() as sf:
-                sf = sfinder.SFinder(setup_cache=use_cache)
+                if sf is None:
+                    # imported here, sfinder imports this module
+                    from setupfinder.finder import sfinder
+                    sf = sfinder.SFinder(setup_cache=use_cache)
                 self.PC_rate = float(
                     sf.percent(
                         fumen=self.solution.to_fumen(), pieces=self.solution.get_remaining_pieces(), height=height))
         return self.PC_rate >= cutoff
 
+    def filter_PCs(self, cutoff):
+        """Filter out continuations below a higher cutoff than the one find_PCs was run with.
+
+        Returns true if PC rate is >= cutoff. PC rates don't change, the best continuation always passes if any do."""
+        if len(self.continuations) > 0:
+            self.continuations = [cont for cont in self.continuations if cont.filter_PCs(cutoff)]
+            if len(self.continuations) == 0:
+                self.PC_rate = 0.00
+        return self.PC_rate >= cutoff
+
     def tostring(self, cont=False):
         """Pretty print for outputing to results txt file."""
         ret = self.solution.tostring()
@@ -3,9 +3,14 @@
 The goal of this module is to speed up output generation.
 The current method of calling sfinder util fig can take several minutes if there are hundreds of solutions."""
 
-import imageio, numpy, base64
+import imageio, numpy, base64, hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from setupfinder.finder import fumen
 
+# images rendered by one render_fields call in ImageCache.prefetch, bounds the memory used for drawing
+PREFETCH_CHUNK = 128
+
 
 def get_blocks_from_skin(skin_filename):
     """Load block data from skin file (PNG format).
@@ -24,24 +29,139 @@ def get_blocks_from_skin(skin_filename):
     return blocks
 
 
-def fumen_to_image(fumen_data, height, blocks):
-    """Convert fumen encoded field to base64 encoded PNG image (for embedding in output.html).
+def get_atlas(blocks):
+    """Stack block images into one array (block, y, x, color) so fields can be drawn by indexing into it."""
+    return numpy.ascontiguousarray(numpy.asarray(blocks))
 
-    height can be used to expand the field to a certain height with blank rows, should not be less than field height.
-    blocks is a numpy array of block images in PNG format.
+
+def render_fields(fields, height, atlas):
+    """Draw fields (in list form, bottom->top) into an array of images.
+
+    All fields are drawn at once by fancy indexing into the block atlas. Fields are expanded to height with blank
+    rows, height should not be less than the tallest field.
+    Returns array with shape (fields, height * block size, 10 * block size, color).
     """
-    field, _ = fumen.decode(fumen_data)
-    field_height = len(field)
-    if (height > field_height):
-        field.extend([[0] * 10 for _ in range(height - field_height)])
-    # fumen.decode returns blocks in reverse order
-    # could potentially speed things up even more by going straight from fumen to the proper format for this
-    # and have a separate function to turn fumen output to a TetField
-    field.reverse()
-    img_data = numpy.vstack(
-        tuple(numpy.hstack(tuple(blocks[i] for i in row)) for row in field))
+    atlas = get_atlas(atlas)
+    _, size, _, channels = atlas.shape
+    # preallocate block indices, top row first (fields go bottom->top)
+    indices = numpy.zeros((len(fields), height, 10), dtype=numpy.intp)
+    for i, field in enumerate(fields):
+        if field:
+            indices[i, height - len(field):] = field[::-1]
+    # fancy index whole blocks out of the atlas, then copy into the preallocated image layout
+    # (field, row, block y, col, block x) which reshapes into images without another copy
+    images = numpy.empty((len(fields), height, size, 10, size, channels), dtype=atlas.dtype)
+    images[...] = atlas[indices].transpose(0, 1, 3, 2, 4, 5)
+    return images.reshape(len(fields), height * size, 10 * size, channels)
+
+
+def encode_pngs(images, workers=None):
+    """Encode image arrays as PNG data, in parallel with a thread pool (zlib releases the GIL)."""
     # for some reason optimize is giving me larger filesizes
     # imageio.imwrite("test.png", img_data, format="PNG", optimize=True
-    png_data = imageio.imwrite(imageio.RETURN_BYTES, img_data, format="PNG")
+    encode = lambda img_data: imageio.imwrite(imageio.RETURN_BYTES, img_data, format="PNG")
+    if len(images) < 2 or workers == 1:
+        return [encode(img_data) for img_data in images]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(encode, images))
+
+
+def fumens_to_pngs(fumens, height, blocks, workers=None):
+    """Convert many fumen encoded fields to PNG image data.
+
+    Fields are drawn in batches (one per image height) and encoded in parallel. See fumen_to_png for arguments.
+    """
+    atlas = get_atlas(blocks)
+    fields = [fumen.decode(fumen_data)[0] for fumen_data in fumens]
+    # group by image height, fields taller than height make taller images
+    batches = {}
+    for i, field in enumerate(fields):
+        batches.setdefault(max(height, len(field)), []).append(i)
+    images = [None] * len(fields)
+    for batch_height, batch in batches.items():
+        rendered = render_fields([fields[i] for i in batch], batch_height, atlas)
+        for i, img_data in zip(batch, rendered):
+            images[i] = img_data
+    return encode_pngs(images, workers=workers)
+
+
+def fumen_to_png(fumen_data, height, blocks):
+    """Convert fumen encoded field to PNG image data.
+
+    height can be used to expand the field to a certain height with blank rows, should not be less than field height.
+    blocks is a numpy array of block images in PNG format (or an atlas from get_atlas).
+    """
+    return fumens_to_pngs([fumen_data], height, blocks)[0]
+
+
+def fumen_to_image(fumen_data, height, blocks):
+    """Convert fumen encoded field to base64 encoded PNG image (for embedding in output.html).
+
+    See fumen_to_png for arguments.
+    """
+    png_data = fumen_to_png(fumen_data, height, blocks)
     data_url = "data:image/png;base64," + base64.b64encode(png_data).decode()
-    return data_url
\ No newline at end of file
+    return data_url
+
+
+class ImageCache:
+    """LRU cache of rendered images, keyed by (fumen, height, skin).
+
+    The same setups are drawn many times in output.html (parent setups are repeated for every sub-setup),
+    so images are only rendered and encoded once.
+    If image_dir is set, each unique image is written to a file in image_dir once and referenced by relative url
+    instead of being embedded as a data url. Files are named by a hash of their contents, so identical images
+    for different fumens (eg. different comments) are also only stored once, and existing files are reused.
+    """
+
+    def __init__(self, skin_file, image_dir=None, maxsize=4096):
+        self.skin = str(skin_file)
+        self.blocks = get_atlas(get_blocks_from_skin(skin_file))
+        self.image_dir = image_dir
+        self.maxsize = maxsize
+        self._urls = OrderedDict()
+        if image_dir is not None:
+            image_dir.mkdir(parents=True, exist_ok=True)
+
+    def url(self, fumen_data, height):
+        """Return url of image for a fumen, rendering it if necessary."""
+        key = (fumen_data, height, self.skin)
+        if key in self._urls:
+            self._urls.move_to_end(key)
+            return self._urls[key]
+        return self._store(key, fumen_to_png(fumen_data, height, self.blocks))
+
+    def prefetch(self, fumens, height, workers=None, chunk_size=PREFETCH_CHUNK):
+        """Render images that aren't cached yet in batches (much faster than rendering them one by one).
+
+        fumens should be in the order the images are used. Only as many images as fit in the cache next to the ones
+        in fumens that are already cached are rendered (the first ones), the rest are rendered when they're used."""
+        missing = []
+        cached = 0
+        for fumen_data in OrderedDict.fromkeys(fumens):
+            key = (fumen_data, height, self.skin)
+            if key in self._urls:
+                # keep them from being evicted by this batch
+                self._urls.move_to_end(key)
+                cached += 1
+            else:
+                missing.append(fumen_data)
+        missing = missing[:max(self.maxsize - cached, 0)]
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            for fumen_data, png_data in zip(chunk, fumens_to_pngs(chunk, height, self.blocks, workers=workers)):
+                self._store((fumen_data, height, self.skin), png_data)
+
+    def _store(self, key, png_data):
+        if self.image_dir is not None:
+            filename = hashlib.sha1(png_data).hexdigest()[:20] + ".png"
+            img_file = self.image_dir / filename
+            if not img_file.exists():
+                img_file.write_bytes(png_data)
+            url = f"{self.image_dir.name}/{filename}"
+        else:
+            url = "data:image/png;base64," + base64.b64encode(png_data).decode()
+        self._urls[key] = url
+        if len(self._urls) > self.maxsize:
+            self._urls.popitem(last=False)
+        return url
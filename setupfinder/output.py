@@ -5,67 +5,198 @@ from pathlib import Path
 import warnings
 from tqdm import tqdm, TqdmSynchronisationWarning
 from dominate import document
-from dominate.tags import h1, h2, div, p, img, a, b, pre
+from dominate.tags import h1, h2, div, p, img, a, b, pre, ul, li
 from dominate.util import text
 from setupfinder.finder.sfinder import SFinder
-from setupfinder.img import get_blocks_from_skin, fumen_to_image
+from setupfinder.img import ImageCache
 
 working_dir = Path.cwd() / "output"
 fumen_url = "http://104.236.152.73/fumen/?"  #"http://fumen.zui.jp/?"
+# setups whose images are rendered in one batch (see ImageCache.prefetch)
+PREFETCH_SETUPS = 64
 
 
-def output_results_pc(output_file, setups, title, pc_height, pc_cutoff, img_height, cache, skin_file):
-    skin = get_blocks_from_skin(skin_file)
-    with open(output_file, "w+") as f:
+def output_results_pc(output_file,
+                      setups,
+                      title,
+                      pc_height,
+                      pc_cutoff,
+                      img_height,
+                      cache,
+                      skin_file,
+                      image_dir=None,
+                      page_size=None,
+                      sf=None,
+                      images=None):
+    """Output PC setups to output_file. If image_dir is set, images are saved there instead of embedded.
+
+    If page_size is set, setups are split into pages of page_size setups each, see write_report.
+    sf is the SFinder used to find best PC paths, if not given one is created using cache.
+    images is an ImageCache to draw with, instead of a new one for skin_file and image_dir."""
+    images = images or ImageCache(skin_file, image_dir=image_dir)
+    if sf is None:
+        sf = SFinder(setup_cache=cache)
+    # run sfinder for every best PC path up front (in parallel), so rendering only reads the cache
+    sf.prefetch("path", pc_path_queries(setups, pc_height))
+    write_report(
+        output_file, setups, title,
+        lambda setup, i: generate_output_pc(setup, "Setup %d" % i, pc_cutoff, pc_height, img_height, images, sf),
+        lambda page: images.prefetch([fm for setup in page for fm in collect_fumens_pc(setup, sf, pc_height)],
+                                     img_height), page_size)
+
+
+def output_results(output_file,
+                   setups,
+                   title,
+                   img_height,
+                   conts_to_display,
+                   skin_file,
+                   image_dir=None,
+                   page_size=None,
+                   images=None):
+    """Output setups to output_file. If image_dir is set, images are saved there instead of embedded.
+
+    If page_size is set, setups are split into pages of page_size setups each, see write_report.
+    images is an ImageCache to draw with, instead of a new one for skin_file and image_dir."""
+    images = images or ImageCache(skin_file, image_dir=image_dir)
+    write_report(
+        output_file, setups, title,
+        lambda setup, i: generate_output(setup, ("Setup %d" % i), img_height, conts_to_display, images),
+        lambda page: images.prefetch([fm for setup in page for fm in collect_fumens(setup, conts_to_display)],
+                                     img_height), page_size)
+
+
+def write_report(output_file, setups, title, render_setup, prefetch, page_size=None):
+    """Render setups into output_file one page at a time.
+
+    render_setup(setup, i) is called inside the page document for each setup, prefetch(setups) before each
+    PREFETCH_SETUPS of them are rendered.
+    Without page_size (or if everything fits on one page) all setups go in output_file. Otherwise output_file is an
+    index linking to pages (output-1.html, output-2.html, ...), each page is written to disk and discarded before the
+    next one is generated so memory use is bounded by page size.
+    """
+    if not page_size or len(setups) <= page_size:
         d = document(title=title)
         d += h1(title)
         d += p("%d setups found" % len(setups))
         with d:
-            #annoying tqdm bug workaround
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", TqdmSynchronisationWarning)
-                for i, setup in enumerate(tqdm(setups, unit="setup")):
-                    generate_output_pc(setup, "Setup %d" % i, pc_cutoff, pc_height, img_height, skin, cache)
-        f.write(d.render())
+            _render_setups(setups, 0, render_setup, prefetch)
+        with open(output_file, "w+") as f:
+            f.write(d.render())
+        return
 
-
-def output_results(output_file, setups, title, img_height, conts_to_display, skin_file):
-    skin = get_blocks_from_skin(skin_file)
+    starts = range(0, len(setups), page_size)
+    page_files = [output_file.with_name(f"{output_file.stem}-{n + 1}{output_file.suffix}") for n in range(len(starts))]
+    index = document(title=title)
+    index += h1(title)
+    index += p("%d setups found" % len(setups))
+    with index:
+        with ul():
+            for start, page_file in zip(starts, page_files):
+                end = min(start + page_size, len(setups))
+                li(a("Setups %d - %d" % (start, end - 1), href=page_file.name))
     with open(output_file, "w+") as f:
-        d = document(title=title)
+        f.write(index.render())
+    del index
+
+    for n, (start, page_file) in enumerate(zip(tqdm(starts, unit="page"), page_files)):
+        page = setups[start:start + page_size]
+        d = document(title=f"{title} ({n + 1}/{len(page_files)})")
         d += h1(title)
-        d += p("%d setups found" % len(setups))
         with d:
-            #annoying tqdm bug workaround
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore", TqdmSynchronisationWarning)
-                for i, setup in enumerate(tqdm(setups, unit="setup")):
-                    generate_output(setup, ("Setup %d" % i), img_height, conts_to_display, skin)
-        f.write(d.render())
+            with p():
+                a("Index", href=output_file.name)
+                if n > 0:
+                    text(" – ")
+                    a("Previous", href=page_files[n - 1].name)
+                if n < len(page_files) - 1:
+                    text(" – ")
+                    a("Next", href=page_files[n + 1].name)
+            _render_setups(page, start, render_setup, prefetch, leave=False)
+        with open(page_file, "w+") as f:
+            f.write(d.render())
 
 
-def generate_output(setup, title, img_height, conts_to_display, skin, imgs=[]):
+def _render_setups(setups, start, render_setup, prefetch, leave=True):
+    #annoying tqdm bug workaround
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", TqdmSynchronisationWarning)
+        for n, setup in enumerate(tqdm(setups, unit="setup", leave=leave)):
+            # images are rendered just before they're used, so they're still cached when they are
+            if n % PREFETCH_SETUPS == 0:
+                prefetch(setups[n:n + PREFETCH_SETUPS])
+            render_setup(setup, start + n)
+
+
+def collect_fumens(setup, conts_to_display):
+    """Yield fumens of every image generate_output will display, so they can be rendered in one batch."""
+    yield setup.solution.fumen
+    if setup.continuations and len(setup.continuations[0].continuations) > 0:
+        new_ctd = conts_to_display - 1 if conts_to_display > 1 else 1
+        for s in setup.continuations:
+            yield from collect_fumens(s, new_ctd)
+    else:
+        for cont in setup.continuations[:conts_to_display - 1]:
+            yield cont.solution.fumen
+
+
+def collect_fumens_pc(setup, sf, pc_height):
+    """Yield fumens of every image generate_output_pc will display. Best PC paths should be prefetched."""
+    yield setup.solution.fumen
+    if setup.continuations and len(setup.continuations[0].continuations) > 0:
+        for s in setup.continuations:
+            yield from collect_fumens_pc(s, sf, pc_height)
+    else:
+        yield setup.continuations[0].solution.fumen
+        yield sf.path(**best_pc_query(setup, pc_height))[0].fumen
+
+
+def penultimate_setups(setup):
+    """Yield setups in the last bag before the PC (the ones that get displayed with their best PC)."""
+    if setup.continuations and len(setup.continuations[0].continuations) > 0:
+        for s in setup.continuations:
+            yield from penultimate_setups(s)
+    else:
+        yield setup
+
+
+def pc_path_queries(setups, pc_height):
+    """Arguments for every sfinder path query output_results_pc makes for setups."""
+    return [best_pc_query(s, pc_height) for setup in setups for s in penultimate_setups(setup)]
+
+
+def best_pc_query(setup, pc_height):
+    """Arguments for sfinder path to find an example of setup's best PC continuation."""
+    best_continuation = setup.continuations[0].solution
+    return {
+        'fumen': best_continuation.to_fumen(),
+        'pieces': best_continuation.get_remaining_pieces(),
+        'height': pc_height
+    }
+
+
+def generate_output(setup, title, img_height, conts_to_display, images, imgs=[]):
     """Recursively generate output for setup+continuations."""
     #not the penultimate bag, need to go deeper
     if setup.continuations and len(setup.continuations[0].continuations) > 0:
         #store images in list to print at the end
         new_imgs = imgs.copy()  #don't think this needs to be a deepcopy
-        new_imgs.append(fumen_to_image(setup.solution.fumen, img_height, skin))
+        new_imgs.append(images.url(setup.solution.fumen, img_height))
         # this naming scheme could get messy, anything better? maybe Setup 1-A-A?
         # but I'm not sure what to do if more continuatons than 26, maybe just AA, then AAA
         new_ctd = conts_to_display - 1 if conts_to_display > 1 else 1
         for i, s in enumerate(tqdm(setup.continuations, unit="setup", leave=False)):
-            generate_output(s, title + (" - Sub-Setup %d" % i), img_height, new_ctd, skin, new_imgs)
+            generate_output(s, title + (" - Sub-Setup %d" % i), img_height, new_ctd, images, new_imgs)
     else:
         h2(title)
         with div():
             for url in imgs:
-                img(src=url)
+                img(src=url, loading="lazy")
             #final setup with conts, still need to display it's image
-            img(src=fumen_to_image(setup.solution.fumen, img_height, skin))
+            img(src=images.url(setup.solution.fumen, img_height), loading="lazy")
             conts_to_display -= 1
             for cont in setup.continuations[:conts_to_display]:
-                img(src=fumen_to_image(cont.solution.fumen, img_height, skin))
+                img(src=images.url(cont.solution.fumen, img_height), loading="lazy")
         with p():
             total_conts = len(setup.continuations)
             text("Showing ")
@@ -74,29 +205,27 @@ def generate_output(setup, title, img_height, conts_to_display, skin, imgs=[]):
             b(a("%d continuations" % total_conts, href=fumen_url + setup.to_fumen()))
 
 
-def generate_output_pc(setup, title, pc_cutoff, pc_height, img_height, skin, cache, imgs=[]):
+def generate_output_pc(setup, title, pc_cutoff, pc_height, img_height, images, sf, imgs=[]):
     #not the penultimate bag, need to go deeper
     if setup.continuations and len(setup.continuations[0].continuations) > 0:
         #store images in list to print at the end
         new_imgs = imgs.copy()  #don't think this needs to be a deepcopy
-        new_imgs.append(fumen_to_image(setup.solution.fumen, img_height, skin))
+        new_imgs.append(images.url(setup.solution.fumen, img_height))
         for i, s in enumerate(tqdm(setup.continuations, unit="setup", leave=False)):
-            generate_output_pc(s, title + (" - Sub-Setup %d" % i), pc_cutoff, pc_height, img_height, skin, cache,
+            generate_output_pc(s, title + (" - Sub-Setup %d" % i), pc_cutoff, pc_height, img_height, images, sf,
                                new_imgs)
     else:
-        sf = SFinder(setup_cache=cache)
         h2(title)
         with div():
             best_continuation = setup.continuations[0].solution
-            best_pc = sf.path(
-                fumen=best_continuation.to_fumen(), pieces=best_continuation.get_remaining_pieces(),
-                height=pc_height)[0]  #todo: hack! change this when i fix cache
+            # results should already be cached by prefetch in output_results_pc
+            best_pc = sf.path(**best_pc_query(setup, pc_height))[0]  #todo: hack! change this when i fix cache
 
             for url in imgs:
-                img(src=url)
-            img(src=fumen_to_image(setup.solution.fumen, img_height, skin))
-            img(src=fumen_to_image(best_continuation.fumen, img_height, skin))
-            img(src=fumen_to_image(best_pc.fumen, img_height, skin))
+                img(src=url, loading="lazy")
+            img(src=images.url(setup.solution.fumen, img_height), loading="lazy")
+            img(src=images.url(best_continuation.fumen, img_height), loading="lazy")
+            img(src=images.url(best_pc.fumen, img_height), loading="lazy")
         with p():
             text("Best continuation: ")
             b("%.2f%%" % setup.continuations[0].PC_rate)
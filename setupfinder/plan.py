@@ -0,0 +1,118 @@
+"""Estimate how much sfinder work a run needs before starting it (--plan).
+
+Each bag's sfinder queries are planned like the finder does before running a stage (see Finder.stage_queries): every
+row/col/mirror overlay that fits on each setup's field. Queries already in the cache are free, the rest are timed
+with the cost model (see cost module, it learns from the timings of every query run so far).
+
+Later bags depend on the setups sfinder finds, so a bag can only be planned exactly if every bag before it is
+cached. Those are run from the cache (never calling sfinder). After the first bag that needs sfinder, only an upper
+bound of queries per setup is known.
+"""
+
+import os
+from setupfinder import output
+from setupfinder.finder.cost import CostModel
+from setupfinder.finder.finder import Finder, OVERLAY_GENERATORS
+
+
+class NotCached(Exception):
+    pass
+
+
+class DryRunBackend:
+    """Backend for planning, stages are only run if they're cached so sfinder is never needed."""
+
+    def run(self, command, options, output_file=None):
+        raise NotCached(f"{command} {' '.join(options)}")
+
+
+def queries_per_setup(args):
+    """Most sfinder queries the stage for args (from parse_input_line) can make for one setup."""
+    if args['setup_type'] == "PC":
+        return 1
+    if args['setup_type'] == "Tetris":
+        return len(args['cols'])
+    # continuations try mirrored overlays too
+    return len(args['rows']) * len(args['cols']) * 2 * len(OVERLAY_GENERATORS.get(args['setup_type'], []))
+
+
+def plan_stages(bags, cache, mirror_keys=True, jobs=None):
+    """Plan the sfinder queries of each stage for bags (dicts from parse_input_line), using cached results.
+
+    Returns a list of dicts, one per stage: stage, command, queries, pending (not cached), seconds (estimated time to
+    run the pending queries with jobs at a time) and per_setup (see queries_per_setup). queries, pending and seconds
+    are None for stages that can't be planned until an earlier one is run."""
+    jobs = jobs or os.cpu_count()
+    f = Finder(None, backend=DryRunBackend(), mirror_keys=mirror_keys, jobs=jobs, cache=cache)
+    model = CostModel.load(cache)
+    stages = []
+    known = True
+    for i, args in enumerate(bags):
+        stage = {'stage': f"Bag {i}", 'command': "percent" if args['setup_type'] == "PC" and i > 0 else "setup",
+                 'queries': None, 'pending': None, 'seconds': None, 'per_setup': queries_per_setup(args)}
+        if known:
+            command, queries = f.stage_queries(args, initial=i == 0)
+            known = _plan(stage, f.sfinder, model, command, queries, jobs) and _run_stage(f, i, args)
+        stages.append(stage)
+        if args['setup_type'] == "PC":
+            break
+    if f.pc_finish:
+        stage = {'stage': "Output", 'command': "path", 'queries': None, 'pending': None, 'seconds': None,
+                 'per_setup': 1}
+        if known:
+            _plan(stage, f.sfinder, model, "path", output.pc_path_queries(f.setups, f.pc_height), jobs)
+        stages.append(stage)
+    return stages
+
+
+def _plan(stage, sf, model, command, queries, jobs):
+    """Fill in stage's counts and estimate, returns True if every query is cached."""
+    pending = sf.pending(command, queries)
+    times = [model.predict(command, query) for query in pending]
+    # equivalent queries only run once
+    stage['queries'] = len({sf.cache_key(command, query)[0] for query in queries})
+    stage['pending'] = len(pending)
+    # longest first scheduling can't finish before the longest query
+    stage['seconds'] = max(sum(times) / jobs, max(times)) if times else 0.0
+    return not pending
+
+
+def _run_stage(f, i, args):
+    """Run a stage from the cache, returns False if it turned out to need sfinder."""
+    try:
+        if i == 0:
+            f.find_initial_setups(args)
+        elif args['setup_type'] == "PC":
+            f.find_PC_finishes(args)
+        else:
+            f.find_continuations(args)
+    except NotCached:
+        return False
+    return True
+
+
+def format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}min"
+    return f"{seconds / 3600:.1f}h"
+
+
+def format_plan(stages):
+    """Lines describing a plan from plan_stages."""
+    lines = []
+    for stage in stages:
+        if stage['queries'] is None:
+            lines.append(f"{stage['stage']}: up to {stage['per_setup']} {stage['command']} queries per setup " +
+                         "(depends on the results of earlier bags)")
+        else:
+            lines.append(f"{stage['stage']}: {stage['pending']} of {stage['queries']} {stage['command']} queries " +
+                         f"need sfinder, about {format_duration(stage['seconds'])}")
+    known = [stage['seconds'] for stage in stages if stage['seconds'] is not None]
+    total = format_duration(sum(known))
+    if len(known) < len(stages):
+        lines.append(f"Total: at least {total} (later bags can't be planned until earlier ones are run)")
+    else:
+        lines.append(f"Total: about {total}")
+    return lines
@@ -0,0 +1,87 @@
+"""Benchmark suite for setup-finder's hot paths.
+
+Run every benchmark with `python tests/bench.py`, or only some suites with eg. `python tests/bench.py fumen img`.
+Each suite is a bench_<name>.py module with a benchmark(trials) function, they can also be run on their own.
+Use --save to store results as JSON, and --compare to check for regressions against saved results.
+"""
+
+import argparse
+import importlib
+import json
+import sys
+import time
+from pathlib import Path
+
+TESTS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(TESTS_DIR.parent))  # so setupfinder can be imported without installing
+sys.path.insert(0, str(TESTS_DIR))
+
+SUITES = ["fumen", "tet", "analysis", "img", "cache", "finder", "import"]
+
+
+def run(name, func, trials, setup=None):
+    """Time func over a number of trials, print and return results.
+
+    setup is called before each trial and isn't timed, its return value is passed to func.
+    """
+    trials = max(trials, 1)
+    # warm up (caches, imports, etc) before timing
+    func(setup()) if setup else func()
+    total_time = 0.0
+    for _ in range(trials):
+        arg = setup() if setup else None
+        timer_start = time.perf_counter()
+        func(arg) if setup else func()
+        total_time += time.perf_counter() - timer_start
+    avg_time = total_time / trials
+    print("%s: Trials: %d, Total time: %.2fsec, Avg. Time: %.6fsec" % (name, trials, total_time, avg_time))
+    return {'name': name, 'trials': trials, 'total_time': total_time, 'avg_time': avg_time}
+
+
+def compare(results, saved, threshold):
+    """Print changes against saved results, return names of benchmarks that are slower than threshold allows."""
+    saved_times = {r['name']: r['avg_time'] for r in saved}
+    regressions = []
+    print("\nComparison:")
+    for r in results:
+        if r['name'] not in saved_times:
+            continue
+        ratio = r['avg_time'] / saved_times[r['name']]
+        flag = ""
+        if ratio > threshold:
+            flag = " REGRESSION"
+            regressions.append(r['name'])
+        print("%s: %.2fx%s" % (r['name'], ratio, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run setup-finder benchmarks.")
+    parser.add_argument("suites", nargs="*", help=f"suites to run (default: all of {', '.join(SUITES)})")
+    parser.add_argument("--trials", type=int, default=None, help="override number of trials for every benchmark")
+    parser.add_argument("--save", help="save results to JSON file")
+    parser.add_argument("--compare", help="compare against results saved with --save")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression (default: 1.25)")
+    args = parser.parse_args()
+
+    results = []
+    for suite in args.suites or SUITES:
+        if suite not in SUITES:
+            parser.error(f"Unknown suite '{suite}'.")
+        print(f"== {suite} ==")
+        module = importlib.import_module(f"bench_{suite}")
+        results.extend(module.benchmark(args.trials) if args.trials else module.benchmark())
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
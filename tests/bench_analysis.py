@@ -0,0 +1,27 @@
+"""Benchmarks for analysis module."""
+
+import bench
+import setupfinder.analysis
+from setupfinder.finder import fumen
+
+ALBATROSS_NO_T = "v115@AhBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRpglCe?whJeAgl"
+
+
+def benchmark(trials=500):
+    """Benchmark placement finding, bag feasibility and keypress counting."""
+    field, _ = fumen.decode(ALBATROSS_NO_T)
+    uncached = lambda: (setupfinder.analysis._keypress_cache.clear(), setupfinder.analysis.count_keypresses(field))
+    return [
+        bench.run("analysis.find_placements", lambda: setupfinder.analysis.find_placements(field), trials),
+        bench.run("analysis.is_bag_possible", lambda: setupfinder.analysis.is_bag_possible(field, "SOLIZJ"), trials),
+        bench.run("analysis.count_keypresses (uncached)", uncached, trials // 10),
+        bench.run("analysis.count_keypresses (cached)", lambda: setupfinder.analysis.count_keypresses(field), trials),
+    ]
+
+
+def main():
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Benchmarks for loading and saving the sfinder result cache and snapshots."""
+
+import tempfile
+from pathlib import Path
+import bench
+from setupfinder.finder import finder, fumen, snapshot
+from setupfinder.finder.tet import TetField, TetSolution, TetSetup
+
+TEST_FUMEN = "v115@9gwhCeBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRp?glMeAgl"
+
+
+def make_cache(entries):
+    """Make a cache with a similar shape to a real one (lists of solutions and PC rates)."""
+    field, _ = fumen.decode(TEST_FUMEN)
+    cache = {}
+    for i in range(entries):
+        cache[f"setup{TEST_FUMEN}{i}"] = [TetSolution(TetField(from_list=field), TEST_FUMEN, "IJLOSZ")] * 3
+        cache[f"percent{TEST_FUMEN}{i}*p7"] = "75.00"
+    return cache
+
+
+def make_setups(width, depth):
+    field, _ = fumen.decode(TEST_FUMEN)
+    setups = [TetSetup(TetSolution(TetField(from_list=field), TEST_FUMEN, "IJLOSZT")) for _ in range(width)]
+    if depth > 1:
+        for setup in setups:
+            setup.continuations = make_setups(width, depth - 1)
+    return setups
+
+
+def benchmark(trials=5):
+    """Benchmark cache.bin load/save (plain and packed) and snapshot save/load."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp_dir = Path(tmp)
+        cache = make_cache(5000)
+        for pack in (False, True):
+            cache_file = tmp_dir / f"cache-{pack}.bin"
+            f = finder.Finder(cache_file, pack_cache=pack)
+            f.cache = cache
+            name = "packed" if pack else "plain"
+            results.append(bench.run(f"Finder cache save ({name})", lambda: f.__exit__(None, None, None), trials))
+            results.append(bench.run(f"Finder cache load ({name})", lambda: finder.Finder(cache_file, pack).__enter__(),
+                                     trials))
+        bags = ["TSD", "TSD", "TSD"]
+        state = {'setups': make_setups(20, 3), 'pc_finish': False, 'pc_height': None, 'pc_cutoff': None}
+        results.append(
+            bench.run("snapshot.save_snapshot", lambda: snapshot.save_snapshot(tmp_dir, bags, 2, state), trials))
+        results.append(bench.run("snapshot.load_latest_snapshot", lambda: snapshot.load_latest_snapshot(tmp_dir, bags),
+                                 trials))
+    return results
+
+
+def main():
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
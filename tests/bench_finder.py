@@ -0,0 +1,50 @@
+"""End-to-end benchmark of the finder pipeline, using a stand-in for sfinder so only Python-side overhead is measured.
+
+Set BENCH_REPLAY to a file recorded with `setup-finder --record` to replay real sfinder results
+(commands missing from the recording fall back to the fake backend).
+"""
+
+import os
+from pathlib import Path
+import bench
+import fake_sfinder
+from setupfinder.finder import finder
+from setupfinder.finder.backend import ReplayBackend
+from setupfinder.find import parse_input_line
+
+BAGS = ["TSD row-1,2 col-any filter-isTSD-any", "TSD row-1,2 col-any filter-isTSD-any", "PC height-4 cutoff-0.01"]
+
+
+def run_bags(bags, cache, backend):
+    f = finder.Finder(None, backend=backend)
+    f.cache = cache
+    for i, bag in enumerate(bags):
+        args = parse_input_line(bag)
+        if i == 0:
+            f.find_initial_setups(args)
+        elif args['setup_type'] == "PC":
+            f.find_PC_finishes(args)
+        else:
+            f.find_continuations(args)
+    return f
+
+
+def benchmark(trials=3):
+    """Benchmark full runs with an empty cache (every sfinder call answered by backend) and a warm cache."""
+    backend = fake_sfinder.FakeBackend()
+    if "BENCH_REPLAY" in os.environ:
+        backend = ReplayBackend(Path(os.environ["BENCH_REPLAY"]), fallback=backend)
+    warm_cache = {}
+    run_bags(BAGS, warm_cache, backend)
+    return [
+        bench.run("Finder TSD->TSD->PC (cold cache)", lambda: run_bags(BAGS, {}, backend), trials),
+        bench.run("Finder TSD->TSD->PC (warm cache)", lambda: run_bags(BAGS, warm_cache, backend), trials),
+    ]
+
+
+def main():
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""Benchmarks for fumen module."""
+
+import bench
+from setupfinder.finder import fumen
+
+TEST_FUMENS = [
+    "v115@9gwhCeBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRp?glMeAgl",
+    "v115@hghlQ4BeAtEeglR4BtAewhh0AeglA8Q4AtRpwhg0Be?D8Rpwhg0CeE8whB8AeI8AeG8JeAgH",
+]
+
+
+def benchmark(trials=2000):
+    """Benchmark fumen encoding/decoding."""
+    frames = [fumen.decode(fm) for fm in TEST_FUMENS]
+    return [
+        bench.run("fumen.decode", lambda: [fumen.decode(fm) for fm in TEST_FUMENS], trials),
+        bench.run("fumen.encode", lambda: [fumen.encode([frame]) for frame in frames], trials),
+        bench.run("fumen.encode (multi-frame)", lambda: fumen.encode(frames * 4), trials // 4),
+    ]
+
+
+def main():
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
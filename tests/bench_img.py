@@ -1,45 +1,36 @@
-"""Tests for img module."""
+"""Benchmarks for img module.
 
-import sys
-sys.path.append("..\\src")
+Set SFINDER_DIR to an sfinder install to also benchmark sfinder's util fig for comparison.
+"""
 
-import time
-from setupfinder import img, fumen, sfinder
+import os
+from pathlib import Path
+import bench
+from setupfinder import img
+from setupfinder.finder import sfinder
 
+TEST_FUMEN = "v115@9gwhCeBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRp?glMeAgl"
+SKIN_FILE = Path(__file__).resolve().parent / "block.png"
 
-def benchmark(trials):
+
+def benchmark(trials=100):
     """Benchmark different image generation functions."""
-    test_fumen = "v115@9gwhCeBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRp?glMeAgl"
-
-    data = ""
-    timer_start = time.perf_counter()
-    blocks = img.get_blocks_from_skin("block.png")
-    for _ in range(trials):
-        data += img.fumen_to_image(test_fumen, 7, blocks)
-    total_time = time.perf_counter() - timer_start
-    avg_time = total_time / trials
-    data_size = len(data) // 1024
-    print(
-        "fumen_to_image: Trials: %d, Total time: %.2fsec, Avg. Time: %.4fsec, Data size: %dkB"
-        % (trials, total_time, avg_time, data_size))
-
-    data = ""
-    timer_start = time.perf_counter()
-    sf = sfinder.SFinder(
-        "C:\\Users\\metazilla\\code\\setup-finder\\solution-finder-0.511")
-    for _ in range(trials):
-        data += sf.fig_png(test_fumen, "7")
-    total_time = time.perf_counter() - timer_start
-    avg_time = total_time / trials
-    data_size = len(data) // 1024
-    print(
-        "sf.fig_png: Trials: %d, Total time: %.2fsec, Avg. Time: %.4fsec, Data size: %dkB"
-        % (trials, total_time, avg_time, data_size))
+    blocks = img.get_blocks_from_skin(SKIN_FILE)
+    results = [
+        bench.run("img.get_blocks_from_skin", lambda: img.get_blocks_from_skin(SKIN_FILE), trials),
+        bench.run("img.fumen_to_image", lambda: img.fumen_to_image(TEST_FUMEN, 7, blocks), trials),
+        bench.run("img.fumens_to_pngs (x100)", lambda: img.fumens_to_pngs([TEST_FUMEN] * 100, 7, blocks), trials // 20),
+    ]
+    print("Data size: %dkB" % (len(img.fumen_to_image(TEST_FUMEN, 7, blocks)) // 1024))
+    if "SFINDER_DIR" in os.environ:
+        sf = sfinder.SFinder(working_dir=Path(os.environ["SFINDER_DIR"]))
+        results.append(bench.run("sf.fig_png", lambda: sf.fig_png(TEST_FUMEN, "7"), trials // 10))
+    return results
 
 
 def main():
     """Run benchmarks for img module."""
-    benchmark(100)
+    benchmark()
 
 
 if __name__ == '__main__':
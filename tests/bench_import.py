@@ -0,0 +1,50 @@
+"""Benchmarks for startup time: importing the command line entry point in a new interpreter.
+
+Heavy modules are only imported by the stages that need them (output, --plan, the scheduler, sfinder parsing, progress
+bars), so short cached runs and runs that fail early don't pay for them. IMPORT_BUDGET is the most importing
+setupfinder.find may add to interpreter startup, and LAZY_MODULES must not be imported by it.
+"""
+
+import subprocess
+import sys
+import bench
+
+IMPORT_BUDGET = 0.15  # seconds
+LAZY_MODULES = ["setupfinder.output", "setupfinder.img", "dominate", "imageio", "numpy", "lxml", "asyncio", "tqdm"]
+
+
+def run_python(code):
+    subprocess.run([sys.executable, "-c", code], cwd=str(bench.TESTS_DIR.parent), check=True)
+
+
+def loaded_modules(module):
+    """Modules in LAZY_MODULES that importing module loads."""
+    code = f"import sys, {module}; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=str(bench.TESTS_DIR.parent),
+                                     universal_newlines=True)
+    return output.split()
+
+
+def benchmark(trials=10):
+    """Benchmark interpreter startup with and without importing setupfinder.find, and check the budget."""
+    results = [
+        bench.run("python startup", lambda: run_python("pass"), trials),
+        bench.run("import setupfinder.find", lambda: run_python("import setupfinder.find"), trials),
+    ]
+    overhead = results[1]['avg_time'] - results[0]['avg_time']
+    loaded = loaded_modules("setupfinder.find")
+    print(f"Import overhead: {overhead:.3f}sec (budget: {IMPORT_BUDGET:.3f}sec)" +
+          (" OVER BUDGET" if overhead > IMPORT_BUDGET else ""))
+    if loaded:
+        print(f"Imported eagerly: {', '.join(loaded)}")
+    return results
+
+
+def main():
+    results = benchmark()
+    if results[1]['avg_time'] - results[0]['avg_time'] > IMPORT_BUDGET or loaded_modules("setupfinder.find"):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
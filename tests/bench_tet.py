@@ -0,0 +1,42 @@
+"""Benchmarks for TetField operations and setup filters."""
+
+from copy import deepcopy
+import bench
+from setupfinder.finder import finder, gen, fumen
+from setupfinder.finder.tet import TetField, TetSolution
+
+# field left after an albatross TSD, and a sfinder style solution for a TSD at 4,1
+BASE_FUMEN = "v115@9gwhCeBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRp?glMeAgl"
+
+
+def tsd_solution():
+    field = [[1] * 10, [1] * 10]
+    for x, y in [(3, 1), (4, 1), (5, 1), (4, 0)]:
+        field[y][x] = 0
+    return TetSolution(TetField(from_list=field), "", "IJLOSZ")
+
+
+def benchmark(trials=2000):
+    """Benchmark TetField.add_overlay/clear_rows and the is_TS* filters."""
+    base_field, _ = fumen.decode(BASE_FUMEN)
+    overlay = gen.generate_TSD(6, 4, 1, False)
+    full_field = [[1] * 10 for _ in range(4)] + [[1, 0] * 5]
+    return [
+        bench.run("TetField.add_overlay", lambda field: field.add_overlay(overlay), trials,
+                  setup=lambda: TetField(from_list=base_field)),
+        bench.run("TetField.clear_rows", lambda field: field.clear_rows(), trials,
+                  setup=lambda: TetField(from_list=full_field)),
+        bench.run("deepcopy(TetField)", lambda field: deepcopy(field), trials,
+                  setup=lambda: TetField(from_list=base_field)),
+        bench.run("finder.is_TSD", lambda sol: finder.is_TSD(sol, 4, 1), trials, setup=tsd_solution),
+        bench.run("finder.test_TSD", lambda sol: finder.test_TSD(sol, 4, 1), trials, setup=tsd_solution),
+        bench.run("finder.is_TSS", lambda sol: finder.is_TSS(sol, 4, 1), trials, setup=tsd_solution),
+    ]
+
+
+def main():
+    benchmark()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Fake sfinder backend for benchmarking the finder pipeline without Java or sfinder.jar.
+
+FakeBackend synthesizes sfinder's output (console text and result HTML) instead of running the JVM, so everything
+else (caching, HTML parsing, filtering) runs like it does normally. Setups are solved by filling every fill cell with
+gray using the 6 non-T pieces, so T-spin filters accept them.
+For replaying real sfinder results, record a run with --record and use backend.ReplayBackend instead.
+"""
+
+import re
+from setupfinder.finder import fumen
+
+PC_FUMEN = "v115@9gwhCeBtDewhQ4CeBti0whR4AeRpilg0whAeQ4AeRp?glMeAgl"
+
+
+class FakeBackend:
+    def run(self, command, options, output_file=None):
+        options = dict(zip(options[::2], options[1::2]))
+        if command == "setup":
+            field, _ = fumen.decode(options["-t"])
+            # fill cells (I color) and existing blocks become gray, everything else is empty
+            solved = [[8 if b in (1, 8) else 0 for b in row] for row in field]
+            solution = fumen.encode([(solved, "")])
+            diagram = "".join("".join("X" if b else "_" for b in row) for row in reversed(solved))
+            setup_html = (f'<html><body><section><p><code>{diagram}</code></p>'
+                          f'<div><a href="http://fumen.zui.jp/?{solution}">IJLOSZ</a></div></section></body></html>')
+            return "Found solution = 1, time = 1", setup_html
+        if command == "path":
+            path_html = f'<html><body><section><div><a href="http://fumen.zui.jp/?{PC_FUMEN}">x</a></div></section></body></html>'
+            return "Found path [minimal] = 1", path_html
+        if command == "percent":
+            # vary rate a bit so sorting has something to do
+            rate = 50 + len(re.sub(r"[^A-Z]", "", options["-p"])) * 5
+            return f"success = {rate:.2f}% (1/1)", None
+        raise ValueError(f"Unsupported command {command}")
@@ -155,3 +155,33 @@ def test_place_piece():
         setupfinder.analysis.place_piece(piece, placement, field)
     encoded_field = fumen.encode([(field, "")])
     assert encoded_field == "v115@9gBtDewhilwwBtCewhglRpxwR4Bewhg0RpwwR4Cewh?i0JeAgH"
+
+
+def test_find_keypresses():
+    """Unit test for find_keypresses."""
+    blank_field = [[0] * 10 for __ in range(20)]
+    # flat T in every column, counting DAS to either wall as one keypress
+    expected = [2, 3, 2, 1, 2, 3, 3, 2]
+    for x, presses in enumerate(expected):
+        assert setupfinder.analysis.find_keypresses("T", (x, -1, 2), blank_field) == presses
+
+    # TSD slot, T can't be harddropped in but can be spun in with kicks
+    rows = ["XXXX_XXXXX", "XXX___XXXX", "XXXX______"]
+    tsd_field = [[1 if c == "X" else 0 for c in row] for row in rows]
+    tsd_field.extend([[0] * 10 for __ in range(20 - len(tsd_field))])
+    assert setupfinder.analysis.is_harddrop_possible("T", (3, 0, 0), tsd_field) == False
+    assert setupfinder.analysis.find_keypresses("T", (3, 0, 0), tsd_field) == 4
+
+    # completely covered spot can't be reached
+    covered_field = [[1] * 9 + [0]] + [[1] * 10] + [[0] * 10 for __ in range(18)]
+    assert setupfinder.analysis.find_keypresses("I", (7, 0, 1), covered_field) is None
+
+
+def test_count_keypresses(fields):
+    """Unit test for count_keypresses."""
+    albatross, dt_cannon, albatross_no_t = fields
+    assert setupfinder.analysis.count_keypresses(albatross_no_t, "SOLIZJ") == 19
+    # T is skipped if bag doesn't include it
+    assert setupfinder.analysis.count_keypresses(albatross, "SOLIZJ") == 19
+    # gray blocks from previous bag are kept
+    assert setupfinder.analysis.count_keypresses(dt_cannon) is not None
@@ -0,0 +1,25 @@
+"""Tests for the api module."""
+
+from fake_sfinder import FakeBackend
+from setupfinder import api, export
+from setupfinder.find import parse_input_line
+from setupfinder.finder.finder import Finder
+
+BAGS = ["TSD row-1 col-any filter-isTSD-any", "TSD row-1,2 col-any filter-isTSD-any", "PC height-4 cutoff-50.00"]
+
+
+def test_streamed_records_match_export(tmp_path):
+    # the same search stage by stage, like the command line
+    with Finder(tmp_path / "cache.bin", backend=FakeBackend(), cache={}) as f:
+        f.find_initial_setups(parse_input_line(BAGS[0]))
+        f.find_continuations(parse_input_line(BAGS[1]))
+        f.find_PC_finishes(parse_input_line(BAGS[2]))
+        expected = list(export.iter_records(f.setups, f.pc_finish))
+    assert expected
+    calls = []
+    records = api.find_setups(BAGS, backend=FakeBackend(), progress=lambda done, total: calls.append((done, total)))
+    first = next(records)
+    # the first setup's records are available before the others are searched
+    assert calls == [(0, calls[0][1])] and calls[0][1] > 1
+    assert [first] + list(records) == expected
+    assert calls[-1] == (calls[0][1], calls[0][1])
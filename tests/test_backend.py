@@ -0,0 +1,209 @@
+"""Tests for the backend module."""
+
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import types
+import zipfile
+from pathlib import Path
+import pytest
+from setupfinder.finder.backend import (JPypeBackend, RecordingBackend, ReplayBackend, SubprocessBackend,
+                                        WorkerBackend)
+from setupfinder.finder.sfinder import SFINDER_VER, SFinder
+
+
+class CannedBackend:
+    """Backend with one successful percent command and one failing setup command."""
+
+    def run(self, command, options, output_file=None):
+        if command == "percent":
+            return "success = 87.50% (7/8)", None
+        output = "Message: Should specify equal to or more than 7 pieces\n"
+        raise subprocess.CalledProcessError(1, ["sfinder", command], output=output)
+
+
+def test_record_and_replay(tmp_path):
+    """Responses recorded with RecordingBackend are replayed by ReplayBackend, including failures."""
+    record_file = tmp_path / "record.jsonl"
+    sf = SFinder(backend=RecordingBackend(CannedBackend(), record_file))
+    assert sf.percent(fumen="v115@vhAAgH", pieces="*p7", height="4") == "87.50"
+    assert sf.setup(fumen="v115@vhAAgH") is None
+
+    # replay doesn't need sfinder.jar
+    sf = SFinder(working_dir=tmp_path, backend=ReplayBackend(record_file))
+    assert sf.percent(fumen="v115@vhAAgH", pieces="*p7", height="4") == "87.50"
+    assert sf.setup(fumen="v115@vhAAgH") is None
+    with pytest.raises(KeyError):
+        sf.percent(fumen="v115@vhAAgH", pieces="*p7", height="6")
+
+
+def test_cancelled_run_kills_java(tmp_path):
+    """A cancelled run_async stops its process before removing the run directory."""
+    (tmp_path / "sfinder.jar").touch()
+    backend = SubprocessBackend(tmp_path)
+    pid_file = tmp_path / "pid"
+    run_dirs = []
+
+    def prepare(command, options):
+        run_dir, _ = SubprocessBackend._prepare(backend, command, options)
+        run_dirs.append(run_dir)
+        # stands in for java: records its pid and keeps writing into run_dir
+        script = (f"import os, time\nopen({str(pid_file)!r}, 'w').write(str(os.getpid()))\n"
+                  f"while True:\n    open(os.path.join({str(run_dir)!r}, 'out'), 'w').close()\n    time.sleep(0.01)")
+        return run_dir, [sys.executable, "-c", script]
+
+    backend._prepare = prepare
+
+    async def cancel():
+        task = asyncio.ensure_future(backend.run_async("percent", []))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel())
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
+    assert not run_dirs[0].exists()
+
+
+class FakeJException(Exception):
+    def getMessage(self):
+        return str(self)
+
+
+class FakeSystem:
+    out = err = None
+
+    @classmethod
+    def setOut(cls, stream):
+        cls.out = stream
+
+    @classmethod
+    def setErr(cls, stream):
+        cls.err = stream
+
+
+class FakeBuffer:
+    def __init__(self):
+        self.text = ""
+
+    def toString(self, encoding):
+        return self.text
+
+
+class FakePrintStream:
+    def __init__(self, buffer, autoflush, encoding):
+        self.buffer = buffer
+
+    def println(self, line):
+        self.buffer.text += line + "\n"
+
+
+class FakeEntryPoint:
+    """Stands in for sfinder's entry.EntryPointMain: main calls mainRun and exits, the command decides what it does."""
+
+    @staticmethod
+    def main(args):
+        os._exit(FakeEntryPoint.mainRun(args))  # System.exit
+
+    @staticmethod
+    def mainRun(args):
+        command = list(args)[0]
+        if command == "fail":
+            raise FakeJException("Should specify equal to or more than 7 pieces")
+        if command == "exit":
+            os._exit(1)  # like a JVM crash, takes the process down
+        if command == "setup":
+            with open(args[args.index("-o") + 1], "w") as f:
+                f.write("<html></html>")
+        FakeSystem.out.println("Found solution = 1" if command == "setup" else "success = 87.50% (7/8)")
+        return 2 if command == "code" else 0
+
+
+class FakeMainOnly:
+    @staticmethod
+    def main(args):
+        pass
+
+
+def fake_jpype(monkeypatch):
+    """Install a jpype module that runs the fake Java classes above instead of starting a JVM."""
+    jpype = types.ModuleType("jpype")
+    classes = {
+        "java.lang.System": FakeSystem,
+        "java.io.ByteArrayOutputStream": FakeBuffer,
+        "java.io.PrintStream": FakePrintStream,
+        "entry.EntryPointMain": FakeEntryPoint,
+        "entry.MainOnly": FakeMainOnly
+    }
+    started = []
+    jpype.isJVMStarted = lambda: bool(started)
+    jpype.startJVM = lambda *args, **kwargs: started.append(args)
+    jpype.JClass = classes.__getitem__
+    jpype.JArray = lambda element_type: list
+    jpype.JString = str
+    jpype.JException = FakeJException
+    monkeypatch.setitem(sys.modules, "jpype", jpype)
+    return started
+
+
+def test_jpype_backend(tmp_path, monkeypatch):
+    started = fake_jpype(monkeypatch)
+    (tmp_path / "sfinder.jar").touch()
+    backend = JPypeBackend(tmp_path, jvm_args=[])
+    assert len(started) == 1
+    assert backend.run("percent", ["-t", "v115@vhAAgH"]) == ("success = 87.50% (7/8)\n", None)
+    assert backend.run("setup", ["-t", "v115@vhAAgH"], "setup.html") == ("Found solution = 1\n", "<html></html>")
+    with pytest.raises(subprocess.CalledProcessError) as failed:
+        backend.run("fail", [])
+    assert "Message: Should specify" in failed.value.output
+    with pytest.raises(subprocess.CalledProcessError):
+        backend.run("code", [])
+    # private run directories are removed, System.out is restored
+    assert list((tmp_path / "output").iterdir()) == [] and FakeSystem.out is None
+    # main may call System.exit and take the finder with it, so it's never called
+    with pytest.raises(RuntimeError):
+        JPypeBackend(tmp_path, jvm_args=[], entry_point="entry.MainOnly")
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != "fork", reason="the fake jpype module is passed on by fork")
+def test_worker_backend_survives_exit(tmp_path, monkeypatch):
+    fake_jpype(monkeypatch)
+    (tmp_path / "sfinder.jar").touch()
+    backend = WorkerBackend(tmp_path, workers=1, jvm_args=[])
+    try:
+        assert backend.run("percent", []) == ("success = 87.50% (7/8)\n", None)
+        with pytest.raises(subprocess.CalledProcessError):
+            backend.run("fail", [])
+        with pytest.raises(RuntimeError):
+            backend.run("exit", [])
+        # the worker that exited is replaced
+        assert backend.run("percent", []) == ("success = 87.50% (7/8)\n", None)
+    finally:
+        backend.close()
+
+
+def test_jpype_backend_with_sfinder():
+    """Run a real command through JPype, if JPype and sfinder are installed (SFINDER_DIR or ./solution-finder-*)."""
+    pytest.importorskip("jpype")
+    working_dir = Path(os.environ.get("SFINDER_DIR", str(Path.cwd() / SFINDER_VER)))
+    if not (working_dir / "sfinder.jar").exists():
+        pytest.skip(f"sfinder isn't installed in {working_dir}")
+    backend = JPypeBackend(working_dir)
+    output, _ = backend.run("percent", ["-t", "v115@vhAAgH", "-p", "*p7", "-c", "4"])
+    assert "success" in output
+
+
+def test_sfinder_entry_method():
+    """The sfinder.jar SFINDER_VER targets has the entry method JPypeBackend calls, checked without starting a JVM."""
+    jar_file = Path(os.environ.get("SFINDER_DIR", str(Path.cwd() / SFINDER_VER))) / "sfinder.jar"
+    if not zipfile.is_zipfile(str(jar_file)):
+        pytest.skip(f"sfinder isn't installed in {jar_file.parent}")
+    with zipfile.ZipFile(str(jar_file)) as jar:
+        class_file = jar.read(JPypeBackend.ENTRY_POINT.replace(".", "/") + ".class")
+    # method names and descriptors are in the class file's constant pool
+    assert JPypeBackend.ENTRY_METHOD.encode() in class_file and b"([Ljava/lang/String;)I" in class_file
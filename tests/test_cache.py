@@ -0,0 +1,27 @@
+"""Tests for the legacy cache importer."""
+
+from setupfinder.finder import cache, fumen
+from setupfinder.finder.gen import output_fumen
+from setupfinder.finder.sfinder import SFinder
+
+
+class NoBackend:
+    def run(self, command, options, output_file=None):
+        raise AssertionError("sfinder shouldn't run for imported results")
+
+
+def test_import_legacy_cache(tmp_path):
+    legacy_dir = tmp_path / "cache"
+    legacy_dir.mkdir()
+    query = output_fumen([[1, 1, 1, 1, 0, 0, 0, 3, 3, 3]])
+    solution = fumen.encode([([[8, 8, 8, 8, 0, 0, 0, 0, 0, 0]], "IJ")])
+    (legacy_dir / cache.get_cache_file(query)).write_text(solution)
+    pc_query = fumen.encode([([[8, 8, 8, 8, 8, 0, 0, 0, 0, 0]], "")])
+    (legacy_dir / cache.get_cache_file("r" + "L,J,*p7" + pc_query)).write_text("42.50")
+
+    setup_cache = {}
+    assert cache.import_legacy_cache(setup_cache, legacy_dir, tmp_path / "old_cache") == 2
+    assert not list(legacy_dir.iterdir()) and len(list((tmp_path / "old_cache").iterdir())) == 2
+    sf = SFinder(setup_cache, tmp_path, NoBackend())
+    assert [s.fumen for s in sf.setup(fumen=query)] == [solution]
+    assert sf.percent(fumen=pc_query, pieces="L,J,*p7", height="4") == "42.50"
@@ -0,0 +1,108 @@
+"""Tests for the cache_server module."""
+
+import os
+import sys
+import threading
+import pytest
+from fake_sfinder import FakeBackend
+from setupfinder.finder import gen, normalize
+from setupfinder.finder.cache_server import (CacheServer, RemoteCache, check_address, get_authkey, load_cache,
+                                             save_cache)
+from setupfinder.finder.cost import COST_MODEL_KEY, CostModel
+from setupfinder.finder.sfinder import SFinder
+
+AUTHKEY = b"test-key"
+# TSD overlay on an empty field, decodable so the server stores it under its canonical key
+FUMEN = gen.output_fumen(gen.generate_TSD(6, 2, 1, False))
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def run(self, command, options, output_file=None):
+        self.calls += 1
+        return super().run(command, options, output_file)
+
+
+def start_server(tmp_path):
+    address = str(tmp_path / "cache.sock")
+    server = CacheServer(tmp_path / "cache.bin", address, authkey=AUTHKEY)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for _ in range(100):
+        try:
+            return address, RemoteCache(address, authkey=AUTHKEY)
+        except ConnectionError:
+            threading.Event().wait(0.01)
+    raise ConnectionError("cache server didn't start")
+
+
+def test_shared_cache(tmp_path):
+    """Results added by one client are seen by others and saved by the server."""
+    address, first = start_server(tmp_path)
+    backend = CountingBackend()
+    solutions = SFinder(first, tmp_path, backend).setup(fumen=FUMEN)
+    assert solutions and backend.calls == 1
+    second = RemoteCache(address, authkey=AUTHKEY)
+    # the mirror image is stored under the same canonical key, solutions come back through JSON intact
+    mirrored = SFinder(second, tmp_path, backend).setup(fumen=gen.output_fumen(gen.generate_TSD(6, 7, 1, True)))
+    assert backend.calls == 1
+    assert [s.field.field for s in mirrored] == [s.field.mirror().field for s in solutions]
+    key, _ = normalize.cache_key("setup", FUMEN)
+    assert key in second and first.get("missing", 1) == 1
+
+    first.save()
+    saved = load_cache(tmp_path / "cache.bin")
+    assert list(saved) == [key] and [s.fumen for s in saved[key]] == [s.fumen for s in first[key]]
+
+
+def test_prefetch(tmp_path):
+    """Prefetching through a RemoteCache stores the results and the scheduler's cost model on the server."""
+    address, cache = start_server(tmp_path)
+    backend = CountingBackend()
+    sf = SFinder(cache, tmp_path, backend)
+    queries = [{'fumen': gen.output_fumen(gen.generate_TSD(6, col, 1, False))} for col in (2, 3, 4)]
+    sf.prefetch("setup", queries, jobs=2)
+    assert backend.calls == 3 and COST_MODEL_KEY in cache
+    assert CostModel.load(RemoteCache(address, authkey=AUTHKEY)).state["setup"][2] == 3
+    assert all(sf.setup(**query) for query in queries) and backend.calls == 3
+    # a bad request gets an error, the connection keeps working
+    with pytest.raises(RuntimeError):
+        cache._request("unknown")
+    assert len(cache) == 4
+
+
+def test_saved_cost_model(tmp_path):
+    """A server loading a cache with a cost model in it serves the model to clients."""
+    model = CostModel()
+    model.observe("setup", {'fumen': FUMEN}, 2.0)
+    saved = {}
+    model.save(saved)
+    save_cache(tmp_path / "cache.bin", saved)
+    _, cache = start_server(tmp_path)
+    assert CostModel.load(cache).state["setup"][2] == 1
+
+
+def test_wrong_authkey_rejected(tmp_path):
+    address, first = start_server(tmp_path)
+    with pytest.raises(ConnectionError):
+        RemoteCache(address, authkey=b"wrong-key")
+    # the server keeps serving clients with the right key
+    first["percent-key"] = "50.00"
+    assert RemoteCache(address, authkey=AUTHKEY)["percent-key"] == "50.00"
+
+
+def test_authkey_and_address(tmp_path):
+    key_file = tmp_path / "authkey"
+    key = get_authkey(key_file)
+    assert len(key) == 32 and get_authkey(key_file) == key
+    if sys.platform != "win32":
+        assert os.stat(str(key_file)).st_mode & 0o777 == 0o600
+        os.chmod(str(key_file), 0o644)
+        with pytest.raises(PermissionError):
+            get_authkey(key_file)
+    check_address(("localhost", 5000))
+    check_address(("127.0.0.1", 5000))
+    with pytest.raises(ValueError):
+        check_address(("0.0.0.0", 5000))
+    check_address(("0.0.0.0", 5000), allow_remote=True)
@@ -0,0 +1,29 @@
+"""Tests for the cost module."""
+
+from setupfinder.finder import fumen
+from setupfinder.finder.cost import CostModel, COST_MODEL_KEY
+
+
+def query(height, pieces="*p7"):
+    return {'fumen': fumen.encode([([[8] * 4 + [0] * 6] * height, "")]), 'pieces': pieces, 'height': str(height)}
+
+
+def test_prior_ordering():
+    model = CostModel()
+    assert model.predict("percent", query(6)) > model.predict("percent", query(4))
+    assert model.predict("percent", query(4, "*p7,*p4")) > model.predict("percent", query(4, "*p4"))
+
+
+def test_learns_from_timings():
+    model = CostModel()
+    for _ in range(20):
+        # pieces dominate, height doesn't matter
+        model.observe("percent", query(2, "*p7,*p4"), 60.0)
+        model.observe("percent", query(6, "*p4"), 0.1)
+        model.observe("percent", query(4, "*p4"), 0.1)
+    assert model.predict("percent", query(3, "*p7,*p4")) > model.predict("percent", query(6, "*p4"))
+    cache = {}
+    model.save(cache)
+    loaded = CostModel.load(cache)
+    assert COST_MODEL_KEY in cache
+    assert abs(loaded.predict("percent", query(4)) - model.predict("percent", query(4))) < 1e-6
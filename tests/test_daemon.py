@@ -0,0 +1,65 @@
+"""Tests for the daemon module."""
+
+import shutil
+import threading
+from pathlib import Path
+import pytest
+from fake_sfinder import FakeBackend
+from setupfinder.daemon import FinderDaemon, submit
+
+SKIN_FILE = Path(__file__).resolve().parent / "block.png"
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def run(self, command, options, output_file=None):
+        self.calls += 1
+        return super().run(command, options, output_file)
+
+
+def make_job(tmp_path):
+    shutil.copy(str(SKIN_FILE), str(tmp_path / "block.png"))
+    return {
+        'input_file': str(tmp_path / "input.txt"),
+        'bags': ["TSD row-1 col-any", "TSD row-2 col-any"],
+        'skin_file': str(tmp_path / "block.png"),
+        'work_dir': str(tmp_path),
+        'results': True
+    }
+
+
+def test_jobs_reuse_warm_cache(tmp_path):
+    backend = CountingBackend()
+    daemon = FinderDaemon(tmp_path / "cache.bin", backend=backend, root=tmp_path)
+    job = make_job(tmp_path)
+    first = daemon.run_job(job)
+    assert first['error'] is None and Path(first['output_file']).exists() and first['records']
+    calls = backend.calls
+    second = daemon.run_job(job)
+    # everything comes from the warm cache, the skin is only loaded once
+    assert second['records'] == first['records'] and backend.calls == calls
+    assert len(daemon._images) == 1
+    assert daemon.run_job(dict(job, skin_file=str(tmp_path / "missing.png")))['error'].startswith("Skin file")
+    # files outside the daemon's root can't be used
+    assert "outside the daemon's root" in daemon.run_job(dict(job, skin_file=str(SKIN_FILE)))['error']
+    assert "outside the daemon's root" in daemon.run_job(dict(job, export_file="/tmp/../etc/x.jsonl"))['error']
+    daemon.save()
+    assert (tmp_path / "cache.bin").exists()
+
+
+def test_submit_needs_authkey(tmp_path):
+    address = str(tmp_path / "daemon.sock")
+    daemon = FinderDaemon(tmp_path / "cache.bin", address, backend=FakeBackend(), authkey=b"test-key", root=tmp_path)
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    job = make_job(tmp_path)
+    for _ in range(100):
+        try:
+            reply = submit(job, address, authkey=b"test-key")
+            break
+        except ConnectionError:
+            threading.Event().wait(0.01)
+    assert reply['error'] is None and reply['records']
+    with pytest.raises(ConnectionError):
+        submit(job, address, authkey=b"wrong-key")
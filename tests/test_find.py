@@ -0,0 +1,59 @@
+"""Tests for the find module."""
+
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from fake_sfinder import FakeBackend
+from setupfinder import export, find
+
+BAGS = ["TSD row-1 col-any filter-isTSD-any", "TSD row-1,2 col-any filter-isTSD-any", "PC height-4 cutoff-0.01"]
+SKIN_FILE = Path(__file__).resolve().parent / "block.png"
+
+LAZY_MODULES = ["setupfinder.output", "dominate", "imageio", "numpy", "lxml", "asyncio"]
+
+
+def test_heavy_modules_imported_lazily():
+    """The command line only imports output, numpy, lxml etc. when a run gets to the stage that needs them."""
+    code = f"import sys, setupfinder.find; print(' '.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=str(Path(__file__).resolve().parent.parent),
+                                     universal_newlines=True)
+    assert output.split() == []
+
+
+class FailingBackend(FakeBackend):
+    """Fails after a number of PC queries, like a run that's interrupted."""
+
+    def __init__(self, percents):
+        self.percents = percents
+
+    def run(self, command, options, output_file=None):
+        if command == "percent":
+            if self.percents == 0:
+                raise RuntimeError("interrupted")
+            self.percents -= 1
+        return super().run(command, options, output_file)
+
+
+def run(tmp_path, name, backend):
+    export_file = tmp_path / f"{name}.jsonl"
+    find.setups_from_input(tmp_path / "input.txt", tmp_path / f"{name}.bin", False, SKIN_FILE,
+                           export_file=export_file, backend=backend, reuse_stages=False, bags=BAGS,
+                           work_dir=tmp_path)
+    return export_file
+
+
+def test_export_written_as_setups_finish(tmp_path, monkeypatch):
+    backend = FailingBackend(10**6)
+    _, expected = export.load_results(run(tmp_path, "full", backend))
+    expected = list(expected)
+    percents = 10**6 - backend.percents
+    monkeypatch.setattr(find, "EXPORT_CHUNK", 1)
+    export_file = tmp_path / "interrupted.jsonl"
+    with pytest.raises(RuntimeError):
+        run(tmp_path, "interrupted", FailingBackend(percents - 1))
+    header, records = export.load_results(export_file)
+    records = list(records)
+    # the setups finished before the run stopped are there, with the same ids as a full run
+    assert header['bags'] == BAGS and 0 < len(records) < len(expected)
+    assert records == expected[:len(records)]
@@ -0,0 +1,98 @@
+"""Tests for the finder module."""
+
+import pytest
+from urllib.parse import unquote
+from fake_sfinder import FakeBackend
+from setupfinder.find import parse_input_line
+from setupfinder.finder import fumen
+from setupfinder.finder.finder import Finder, carried_piece, check_carry, get_TSD_continuations, get_setup_func, iter_leaves
+from setupfinder.finder.sfinder import SFinder
+from setupfinder.finder.tet import TetField, TetSolution
+
+
+class CountingBackend(FakeBackend):
+    def __init__(self):
+        self.calls = 0
+
+    def run(self, command, options, output_file=None):
+        self.calls += 1
+        return super().run(command, options, output_file)
+
+
+class CarryBackend(CountingBackend):
+    """Setups also have solutions that leave a piece over (or use a carried Z)."""
+
+    def run(self, command, options, output_file=None):
+        output, html = super().run(command, options, output_file)
+        if command == "setup":
+            solution = html[html.index("<div>"):html.index("</div>") + 6]
+            html = html.replace(solution, "".join(
+                solution.replace(">IJLOSZ<", f">{sequence}<") for sequence in ["IJLOSZ", "IJLOS", "IJLSZ", "IJLOSZZ"]))
+        return output, html
+
+
+def test_mirrored_overlays_share_cache():
+    """Mirrored overlays on a symmetric field are cache hits for each other (see normalize module)."""
+    results = {}
+    for mirror_keys in (True, False):
+        backend = CountingBackend()
+        sf = SFinder({}, backend=backend, mirror_keys=mirror_keys)
+        field = TetField(from_list=[[1, 1, 1, 1, 0, 0, 1, 1, 1, 1]])
+        solutions = get_TSD_continuations(field, [1, 2], [2, 3, 6, 7], None, True, sf=sf)
+        results[mirror_keys] = (backend.calls, sorted(s.field.tostring() for s in solutions))
+    assert results[False][0] > 0 and results[True][0] * 2 == results[False][0]
+    assert results[True][1] == results[False][1]
+
+
+def test_carried_piece():
+    def sol(sequence):
+        return TetSolution(TetField(from_list=[[8] * 10]), fumen.encode([([[8] * 10], "")]), sequence)
+
+    assert carried_piece(sol("IJLOSZ")) == ""
+    assert carried_piece(sol("IJLOS")) is None
+    assert carried_piece(sol("IJLOS"), allow_carry=True) == "Z"
+    assert carried_piece(sol("IJLO"), allow_carry=True) is None
+    assert carried_piece(sol("IJLOSZZ"), "Z") == ""
+    assert carried_piece(sol("IJLOSZZ")) is None
+    assert carried_piece(sol("IJLOSZ"), "Z", allow_carry=True) == "Z"
+    carried = sol("IJLOSZT")
+    carried.carry = "Z"
+    assert carried.get_remaining_pieces() == "Z,*p7"
+    assert carried.mirror().carry == "S"
+
+
+def test_carry_over():
+    """Pieces are carried into the next bag with carry-N, queries put the carried piece in front of the bag."""
+    backend = CarryBackend()
+    f = Finder(None, backend=backend)
+    f.find_initial_setups(parse_input_line("TSD row-1 col-2,3,4 filter-isTSD-any carry-2"))
+    carries = [setup.solution.carry for setup in f.setups]
+    # every overlay keeps its full bag solution, and only 2 carrying ones (one per field and piece) are kept
+    assert carries.count("") == 3 and sorted(c for c in carries if c) == ["O", "Z"]
+    args = parse_input_line("TSD row-1 col-any filter-isTSD-any")
+    _, queries = f.stage_queries(args)
+    comments = {unquote(fumen.decode(q['fumen'])[1]) for q in queries}
+    assert comments == {"-m o -f i -p [^T]!", "-m o -f i -p O,[^T]!", "-m o -f i -p Z,[^T]!"}
+    f.find_continuations(args)
+    calls = backend.calls
+    # a carried Z can only be used by the solution with 2 Zs, a carried O by none
+    assert sorted(setup.solution.carry for setup in f.setups) == ["", "", "", "Z"]
+    # (mirrored solutions have L/J and S/Z swapped)
+    assert all(len(cont.solution.sequence) == (8 if setup.solution.carry else 7) and cont.solution.carry == ""
+               for setup in f.setups for cont in setup.continuations)
+    f.find_PC_finishes(parse_input_line("PC height-4 cutoff-0.01"))
+    assert all(leaf.solution.get_remaining_pieces() == "*p7" for leaf in iter_leaves(f.setups))
+    assert backend.calls > calls
+
+
+def test_carry_needs_filter():
+    """A carried piece can only go into a bag whose filter accounts for it, Tetrises can't use one."""
+    bags = [parse_input_line(bag) for bag in ["TSD row-1 col-2 filter-isTSD-any carry-2", "Tetris row-1 col-any"]]
+    with pytest.raises(ValueError):
+        check_carry(bags)
+    with pytest.raises(ValueError):
+        check_carry([parse_input_line("TSD row-1 col-2 filter-testTSD carry-2")])
+    check_carry(bags[:1] + [parse_input_line("PC height-4 cutoff-0.01")])
+    setup_func = get_setup_func(bags[1], sf=SFinder({}, backend=FakeBackend()))
+    with pytest.raises(ValueError):
+        setup_func(TetField(from_list=[[1] * 9 + [0]]), "Z")
@@ -0,0 +1,33 @@
+"""Tests for the img module."""
+
+from pathlib import Path
+from setupfinder import img
+from setupfinder.finder import fumen
+
+SKIN_FILE = Path(__file__).resolve().parent / "block.png"
+
+
+def test_prefetch_in_order_of_use(monkeypatch):
+    """Prefetch renders bounded batches of the first images (the ones used next) that fit in the cache."""
+    batches = []
+    fumens_to_pngs = img.fumens_to_pngs
+
+    def counting(fumens, *args, **kwargs):
+        batches.append(len(fumens))
+        return fumens_to_pngs(fumens, *args, **kwargs)
+
+    monkeypatch.setattr(img, "fumens_to_pngs", counting)
+    fumens = [fumen.encode([([[8 if x == i % 10 else 0 for x in range(10)]] * (1 + i // 10), "")]) for i in range(30)]
+    images = img.ImageCache(SKIN_FILE, maxsize=10)
+    images.prefetch(fumens, 4, chunk_size=4)
+    assert batches == [4, 4, 2]
+    for fumen_data in fumens[:10]:
+        images.url(fumen_data, 4)
+    assert batches == [4, 4, 2]
+    # cached images in the batch are kept, only the rest of the cache is rendered
+    images.prefetch(fumens[5:20], 4, chunk_size=4)
+    assert batches == [4, 4, 2, 4, 1]
+    for fumen_data in fumens[5:20]:
+        images.url(fumen_data, 4)
+    # the ones that didn't fit are rendered one at a time
+    assert batches == [4, 4, 2, 4, 1] + [1] * 5
@@ -0,0 +1,33 @@
+"""Tests for the jvm module."""
+
+from pathlib import Path
+from setupfinder.finder.jvm import CDS_ARCHIVE, JVMOptions, count_sequences, command_weight
+
+
+def test_count_sequences():
+    assert count_sequences("*p7") == 5040
+    assert count_sequences("[^T]!") == 720
+    assert count_sequences("T,*p4") == 840
+    assert count_sequences("[SZ]p1,*p7") == 10080
+
+
+def test_adaptive_options(tmp_path):
+    assert command_weight("setup", ["-t", "v115@vhAAgH", "-p", "*p7"]) == "light"
+    assert command_weight("percent", ["-t", "v115@vhAAgH", "-p", "*p7", "-c", "6"]) == "heavy"
+    options = JVMOptions(tmp_path, max_heap="2g")
+    assert options.args("percent", ["-p", "*p7", "-c", "6"])[0] == "-Xmx2g"
+    assert options.args("setup", ["-p", "*p4", "-c", "4"])[0] == "-Xmx512m"
+    assert JVMOptions(tmp_path, fixed=["-Xmx1024m"]).args("setup", []) == ["-Xmx1024m"]
+
+
+def test_cds_archive_path(tmp_path, monkeypatch):
+    """The archive is dumped and found in working_dir whatever directory java runs in."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "sfinder").mkdir()
+    archive = tmp_path / "sfinder" / CDS_ARCHIVE
+    options = JVMOptions(Path("sfinder"), cds=True)
+    assert options.startup_args()[-1] == f"-XX:ArchiveClassesAtExit={archive}"
+    # only one command dumps it
+    assert options.startup_args()[-1] != f"-XX:ArchiveClassesAtExit={archive}"
+    archive.touch()
+    assert options.startup_args()[-2:] == [f"-XX:SharedArchiveFile={archive}", "-Xshare:auto"]
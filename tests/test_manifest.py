@@ -0,0 +1,27 @@
+"""Tests for the manifest module."""
+
+from fake_sfinder import FakeBackend
+from setupfinder.finder import fumen, manifest
+from setupfinder.finder.sfinder import SFinder
+
+
+def test_manifest_round_trip(tmp_path):
+    """Jobs split into shards, run by workers and imported give the same results as running them directly."""
+    fields = [[[8] * n + [0] * (10 - n)] for n in range(1, 7)]
+    queries = [{'fumen': fumen.encode([(field, "")]), 'pieces': "T,*p7", 'height': "4"} for field in fields]
+    cache = {}
+    sf = SFinder(cache, backend=FakeBackend())
+    sf.percent(**queries[0])
+    assert manifest.write_manifest(tmp_path, "bag-1", sf, "percent", queries + queries[:2], shards=2) == 5
+    shards = sorted(tmp_path.glob("bag-1-shard-*.jobs.jsonl"))
+    assert len(shards) == 2
+    for shard in shards:
+        manifest.run_manifest(shard, FakeBackend(), jobs=2)
+    imported, failed = manifest.import_results(cache, sorted(tmp_path.glob("*.results.jsonl")))
+    assert (imported, failed) == (5, 0)
+    assert sf.pending("percent", queries) == []
+    direct = SFinder({}, backend=FakeBackend())
+    assert [sf.percent(**query) for query in queries] == [direct.percent(**query) for query in queries]
+    # nothing left to plan
+    assert manifest.write_manifest(tmp_path, "bag-1", sf, "percent", queries, shards=2) == 0
+    assert not list(tmp_path.glob("bag-1-shard-*.jobs.jsonl"))
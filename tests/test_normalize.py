@@ -0,0 +1,40 @@
+"""Tests for the normalize module."""
+
+from setupfinder.finder import fumen
+from setupfinder.finder.normalize import cache_key, rekey_cache
+from setupfinder.finder.tet import TetSolution, TetField
+
+# 0 blank, 8 solid, 1 fill (I), 3 margin (O)
+OVERLAY = [[8, 8, 8, 0, 1, 1, 1, 1, 3, 3], [8, 8, 0, 0, 0, 1, 1, 1, 3, 3]]
+
+
+def mirrored(field):
+    return [row[::-1] for row in field]
+
+
+def test_equivalent_setup_queries():
+    key, mirror = cache_key("setup", fumen.encode([(OVERLAY, "-m o -f i -p [^T]!")]))
+    # extra comment text and different colors for solid blocks don't matter
+    recolored = [[5 if b == 8 else b for b in row] for row in OVERLAY]
+    assert cache_key("setup", fumen.encode([(recolored, "TSD -m o -f i -p [^T]!")])) == (key, mirror)
+    # mirror image shares the key
+    assert cache_key("setup", fumen.encode([(mirrored(OVERLAY), "-m o -f i -p [^T]!")])) == (key, not mirror)
+    assert cache_key("setup", fumen.encode([(OVERLAY, "-m o -f i -p *p7")]))[0] != key
+
+
+def test_mirrored_pieces():
+    field = [[8, 8, 8, 8, 0, 0, 0, 0, 0, 0]]
+    key, mirror = cache_key("percent", fumen.encode([(field, "LJ")]), "L,S,*p7")
+    assert cache_key("percent", fumen.encode([(mirrored(field), "")]), "J,Z,*p7") == (key, not mirror)
+    assert cache_key("percent", fumen.encode([(mirrored(field), "")]), "L,S,*p7")[0] != key
+
+
+def test_rekey_legacy_cache():
+    fm = fumen.encode([(OVERLAY, "-m o -f i -p [^T]!")])
+    solution = TetSolution(TetField(from_list=[[8, 8, 8, 2, 2, 2, 2, 2, 8, 8]]), fumen.encode([([[8] * 10], "")]), "LS")
+    cache = {"setup" + fm: [solution], "percent" + fm + "L,J,*p7": "50.00"}
+    assert rekey_cache(cache) == 2
+    key, mirror = cache_key("setup", fm)
+    assert cache[key][0].sequence == ("JZ" if mirror else "LS")
+    assert cache[cache_key("percent", fm, "L,J,*p7")[0]] == "50.00"
+    assert rekey_cache(cache) == 0
@@ -0,0 +1,30 @@
+"""Tests for the plan module."""
+
+from fake_sfinder import FakeBackend
+from setupfinder import plan
+from setupfinder.find import parse_input_line
+from setupfinder.finder.finder import Finder
+
+BAGS = [parse_input_line(bag) for bag in ["TSD row-1 col-any filter-isTSD-any", "TSD row-1 col-any filter-isTSD-any",
+                                          "PC height-4 cutoff-50.00"]]
+
+
+def test_plan_follows_cached_stages():
+    cache = {}
+    stages = plan.plan_stages(BAGS, cache, jobs=2)
+    assert [stage['stage'] for stage in stages] == ["Bag 0", "Bag 1", "Bag 2"]
+    assert stages[0]['pending'] == stages[0]['queries'] > 0 and stages[0]['seconds'] > 0
+    assert stages[1]['queries'] is None and stages[1]['per_setup'] == 1 * 7 * 2
+    assert cache == {}
+    # with the first bag cached, the second can be planned
+    f = Finder(None, backend=FakeBackend(), cache=cache)
+    f.find_initial_setups(BAGS[0])
+    stages = plan.plan_stages(BAGS, cache, jobs=2)
+    assert stages[0]['pending'] == 0 and stages[1]['pending'] == stages[1]['queries'] > 0
+    assert stages[2]['queries'] is None
+    f.find_continuations(BAGS[1])
+    f.find_PC_finishes(BAGS[2])
+    stages = plan.plan_stages(BAGS, cache, jobs=2)
+    assert [stage['stage'] for stage in stages] == ["Bag 0", "Bag 1", "Bag 2", "Output"]
+    assert [stage['pending'] for stage in stages[:3]] == [0, 0, 0] and stages[3]['pending'] > 0
+    assert plan.format_plan(stages)[-1].startswith("Total: about")
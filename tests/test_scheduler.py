@@ -0,0 +1,39 @@
+"""Tests for the scheduler module."""
+
+import asyncio
+from setupfinder.finder import fumen
+from setupfinder.finder.sfinder import SFinder
+
+
+class SlowBackend:
+    """Async backend that takes a while per command and tracks how many run at once."""
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+        self.calls = 0
+
+    def run(self, command, options, output_file=None):
+        raise AssertionError("prefetch should use run_async")
+
+    async def run_async(self, command, options, output_file=None):
+        self.calls += 1
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.02)
+        self.running -= 1
+        return "success = 50.00% (1/2)", None
+
+
+def test_prefetch_runs_concurrently():
+    backend = SlowBackend()
+    cache = {}
+    sf = SFinder(cache, backend=backend, jobs=3)
+    fields = [[[8] * n + [0] * (10 - n)] for n in range(1, 9)]
+    queries = [{'fumen': fumen.encode([(field, "")]), 'pieces': "*p7", 'height': "4"} for field in fields]
+    # mirror images and duplicates don't run again
+    queries += [{'fumen': fumen.encode([([row[::-1] for row in field], "")]), 'pieces': "*p7", 'height': "4"}
+                for field in fields] + queries[:2]
+    sf.prefetch("percent", queries)
+    assert backend.calls == 8 and backend.max_running == 3
+    assert sf.percent(**queries[-1]) == "50.00" and backend.calls == 8
@@ -0,0 +1,56 @@
+"""Tests for the snapshot module."""
+
+import zlib
+from fake_sfinder import FakeBackend
+from setupfinder import export
+from setupfinder.find import parse_input_line
+from setupfinder.finder import snapshot
+from setupfinder.finder.finder import Finder
+
+BAGS = ["TSD row-1 col-any filter-isTSD-any", "TSD row-1,2 col-any filter-isTSD-any", "PC height-4 cutoff-20.00"]
+
+
+class SpreadBackend(FakeBackend):
+    """PC rates spread out by field, so cutoffs filter some of them."""
+
+    def run(self, command, options, output_file=None):
+        if command == "percent":
+            rate = 10 + zlib.crc32(options[options.index("-t") + 1].encode()) % 90
+            return f"success = {rate:.2f}% (1/1)", None
+        return super().run(command, options, output_file)
+
+
+def find(bags, cache):
+    f = Finder(None, backend=SpreadBackend(), cache=cache)
+    f.find_initial_setups(parse_input_line(bags[0]))
+    f.find_continuations(parse_input_line(bags[1]))
+    f.find_PC_finishes(parse_input_line(bags[2]))
+    return f
+
+
+def test_stages_reused_by_prefix(tmp_path):
+    f = find(BAGS, {})
+    snapshot.save_snapshot(tmp_path, BAGS, 2, f.get_state())
+    # same bags with different spacing
+    assert snapshot.load_latest_snapshot(tmp_path, ["TSD  row-1 col-any filter-isTSD-any"] + BAGS[1:], 50.0)[0] == 2
+    # only the last bag changed, so nothing is reused (earlier bags weren't saved)
+    assert snapshot.load_latest_snapshot(tmp_path, BAGS[:2] + ["PC height-5 cutoff-20.00"], 20.0) is None
+    # setups found with mirrored cache keys aren't reused by runs without them (or with another sfinder version)
+    assert snapshot.load_latest_snapshot(tmp_path, BAGS, 50.0, mirror_keys=False) is None
+    assert snapshot.stage_key(BAGS, 2) != snapshot.stage_key(BAGS, 2, mirror_keys=False)
+
+
+def test_pc_cutoff_refiltered(tmp_path):
+    cache = {}
+    f = find(BAGS, cache)
+    snapshot.save_snapshot(tmp_path, BAGS, 2, f.get_state())
+    rates = [record['pc_rate'] for record in export.iter_records(f.setups, True)]
+    cutoff = sorted(rates)[len(rates) // 2]
+    higher = BAGS[:2] + [f"PC height-4 cutoff-{cutoff}"]
+    stage, state = snapshot.load_latest_snapshot(tmp_path, higher, cutoff)
+    expected = list(export.iter_records(find(higher, cache).setups, True))
+    assert stage == 2 and state['pc_cutoff'] == cutoff
+    assert list(export.iter_records(state['setups'], True)) == expected
+    assert len(expected) < len(rates)
+    # a lower cutoff needs PCs that weren't kept
+    assert snapshot.load_latest_snapshot(tmp_path, BAGS[:2] + ["PC height-4 cutoff-1"], 1.0) is None